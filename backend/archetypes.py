@@ -0,0 +1,173 @@
+"""
+Opponent archetype canonicalization
+Free-text opponent names ("Charizard ex", "charizard", "Zard ex") are resolved to
+one canonical archetype so stats and grouping queries bucket them together.
+Lookups are served from an in-memory alias map with a trigram fallback for typos;
+the `archetypes` collection is the source of truth shared by all workers.
+"""
+import logging
+import re
+import unicodedata
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ARCHETYPE_FIELDS = {"_id": 0, "id": 1, "name": 1, "aliases": 1}
+
+# Suffixes that do not distinguish archetypes ("Lugia VSTAR" == "Lugia V" == "lugia")
+IGNORED_TOKENS = {"ex", "v", "vstar", "vmax", "gx", "deck"}
+
+# Minimum trigram Jaccard similarity for a fuzzy match ("charizrd" -> "charizard")
+FUZZY_THRESHOLD = 0.55
+
+# Well-known archetypes and the nicknames players type for them
+BUILTIN_ARCHETYPES = {
+    "Charizard ex": ["zard", "zard ex", "char", "charizard pidgeot", "zard pidgeot"],
+    "Gardevoir ex": ["gardy", "gardevoir", "garde"],
+    "Dragapult ex": ["pult", "dragapult", "dragapult dusknoir"],
+    "Raging Bolt ex": ["bolt", "raging bolt", "raging bolt ogerpon"],
+    "Lugia VSTAR": ["lugia", "lugia archeops"],
+    "Miraidon ex": ["miraidon", "mirai", "miraidon iron hands"],
+    "Gholdengo ex": ["gholdengo", "ghold", "gholdengo dunsparce"],
+    "Lost Zone Box": ["lost box", "lost zone", "comfey", "lost zone comfey"],
+    "Regidrago VSTAR": ["regidrago", "drago"],
+    "Roaring Moon ex": ["roaring moon", "moon"],
+    "Chien-Pao ex": ["chien pao", "baxcalibur", "chien pao baxcalibur", "pao"],
+    "Terapagos ex": ["terapagos", "pagos"],
+    "Iron Thorns ex": ["iron thorns", "thorns"],
+    "Snorlax Stall": ["snorlax", "stall", "lax stall"],
+    "Ancient Box": ["ancient", "ancient toolbox"],
+    "Future Box": ["future", "future toolbox", "iron crown"],
+    "Palkia VSTAR": ["palkia", "origin forme palkia"],
+    "Arceus VSTAR": ["arceus", "arceus giratina", "giratina"],
+    "Pidgeot Control": ["pidgeot", "control"],
+}
+
+def normalize_name(raw: str) -> str:
+    """Lowercase, strip accents/punctuation and ignorable suffixes: "Chien-Pao ex" -> "chien pao\""""
+    text = unicodedata.normalize("NFKD", raw).encode("ascii", "ignore").decode().lower()
+    tokens = re.sub(r"[^a-z0-9]+", " ", text).split()
+    kept = [t for t in tokens if t not in IGNORED_TOKENS]
+    return " ".join(kept or tokens)
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ArchetypeIndex:
+    """In-memory alias and trigram index over the archetypes collection"""
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}  # archetype id -> canonical name
+        self.aliases: Dict[str, str] = {}  # normalized alias -> archetype id
+        self.grams: Dict[str, Set[str]] = {}  # normalized alias -> its trigrams
+        self.postings: Dict[str, Set[str]] = {}  # trigram -> aliases containing it
+        self.loaded = False
+
+    def add(self, archetype: dict):
+        self.names[archetype["id"]] = archetype["name"]
+        for alias in archetype.get("aliases", []):
+            self.aliases[alias] = archetype["id"]
+            self.grams[alias] = trigrams(alias)
+            for gram in self.grams[alias]:
+                self.postings.setdefault(gram, set()).add(alias)
+
+    def lookup(self, raw: str) -> Optional[str]:
+        """Archetype id for a raw name: exact alias first, then closest trigram match"""
+        normalized = normalize_name(raw)
+        if not normalized:
+            return None
+        if normalized in self.aliases:
+            return self.aliases[normalized]
+        # Only aliases sharing at least one trigram are scored (Jaccard similarity)
+        query = trigrams(normalized)
+        overlaps = Counter(alias for gram in query for alias in self.postings.get(gram, ()))
+        best_id, best_score = None, 0.0
+        for alias, shared in overlaps.items():
+            score = shared / (len(query) + len(self.grams[alias]) - shared)
+            if score > best_score:
+                best_id, best_score = self.aliases[alias], score
+        return best_id if best_score >= FUZZY_THRESHOLD else None
+
+async def ensure_archetypes(db, index: ArchetypeIndex):
+    """Create indexes, seed built-in archetypes and load everything into the index"""
+    await db.archetypes.create_index("id", unique=True)
+    await db.archetypes.create_index("aliases", unique=True)
+    archetypes = [a async for a in db.archetypes.find({}, ARCHETYPE_FIELDS)]
+    by_name = {archetype["name"]: archetype for archetype in archetypes}
+    claimed = {alias for archetype in archetypes for alias in archetype.get("aliases", [])}
+    # Only built-ins (or aliases) missing from the collection cost a write, so a restart is one read
+    for name, nicknames in BUILTIN_ARCHETYPES.items():
+        aliases = sorted({normalize_name(name), *(normalize_name(n) for n in nicknames)})
+        existing = by_name.get(name)
+        if existing:
+            # Only add aliases that no other archetype has claimed
+            for alias in aliases:
+                if alias in claimed:
+                    continue
+                try:
+                    await db.archetypes.update_one({"id": existing["id"]}, {"$addToSet": {"aliases": alias}})
+                    existing.setdefault("aliases", []).append(alias)
+                    claimed.add(alias)
+                except DuplicateKeyError:
+                    pass
+            continue
+        archetype = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "aliases": aliases,
+            "created_at": datetime.now(timezone.utc),
+        }
+        try:
+            await db.archetypes.insert_one(archetype)
+            archetypes.append(archetype)
+            claimed.update(aliases)
+        except DuplicateKeyError:
+            logger.warning(f"Archetype {name} shares an alias with an existing archetype; not seeded")
+    for archetype in archetypes:
+        index.add(archetype)
+    index.loaded = True
+
+async def canonicalize(db, index: ArchetypeIndex, raw: str) -> Optional[dict]:
+    """Resolve a raw opponent name to {"id", "name"}, creating a new archetype if unseen"""
+    if not index.loaded:
+        await ensure_archetypes(db, index)
+    normalized = normalize_name(raw)
+    if not normalized:
+        return None
+
+    archetype_id = index.lookup(raw)
+    if archetype_id:
+        if normalized not in index.aliases:
+            # Learn the spelling so the next lookup is an exact hit
+            try:
+                await db.archetypes.update_one({"id": archetype_id}, {"$addToSet": {"aliases": normalized}})
+                index.add({"id": archetype_id, "name": index.names[archetype_id], "aliases": [normalized]})
+            except DuplicateKeyError:
+                # Another worker stored this spelling first, possibly for another archetype: that one wins
+                stored = await db.archetypes.find_one({"aliases": normalized}, ARCHETYPE_FIELDS)
+                if stored:
+                    index.add(stored)
+                    return {"id": stored["id"], "name": stored["name"]}
+        return {"id": archetype_id, "name": index.names[archetype_id]}
+
+    # Another worker may have created it since we loaded
+    archetype = await db.archetypes.find_one({"aliases": normalized}, ARCHETYPE_FIELDS)
+    if not archetype:
+        archetype = {
+            "id": str(uuid.uuid4()),
+            "name": raw.strip(),
+            "aliases": [normalized],
+            "created_at": datetime.now(timezone.utc),
+        }
+        try:
+            await db.archetypes.insert_one(archetype)
+        except DuplicateKeyError:
+            archetype = await db.archetypes.find_one({"aliases": normalized}, ARCHETYPE_FIELDS)
+    index.add(archetype)
+    return {"id": archetype["id"], "name": archetype["name"]}
@@ -0,0 +1,97 @@
+"""
+Benchmark GET /api/decks payload size and serialization time
+Compares the old path (pydantic response_model + stdlib json) with the
+orjson path, the ?fields=summary projection, and gzip on the wire.
+No database needed: decks are generated in memory.
+
+Usage: python benchmark_payloads.py [num_decks] [iterations]
+"""
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from server import Deck, DECK_SUMMARY_FIELDS, pick_featured_image
+
+def make_card(i):
+    """A card_data entry shaped like the frontend's cache entries"""
+    return {
+        'name': f'Card {i} ex',
+        'image': f'https://images.example.com/cards/{i}_LG.png',
+        'supertype': 'Pokémon',
+        'subtypes': ['Basic', 'ex'],
+        'hp': '220',
+        'types': ['Fire'],
+        'abilities': [{'name': 'Ability', 'text': 'Once during your turn, you may search your deck for up to 2 Basic Energy cards and attach them to your Pokémon in any way you like. Then, shuffle your deck.', 'type': 'Ability'}],
+        'attacks': [{'name': 'Burning Darkness', 'cost': ['Fire', 'Fire'], 'damage': '180+', 'text': 'This attack does 30 more damage for each Prize card your opponent has taken.'}] * 2,
+        'weaknesses': [{'type': 'Water', 'value': '×2'}],
+        'resistances': [],
+        'retreatCost': ['Colorless', 'Colorless'],
+        'rules': ['Pokémon ex rule: When your Pokémon ex is Knocked Out, your opponent takes 2 Prize cards.'],
+        'isBasic': True,
+        'isPokemon': i % 3 == 0,
+        'isTrainer': i % 3 == 1,
+        'isEnergy': i % 3 == 2,
+    }
+
+def make_deck(unique_cards=25):
+    card_data = {f'SVI-{i}': make_card(i) for i in range(unique_cards)}
+    now = datetime.now(timezone.utc)
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': 'benchmark-user',
+        'deck_name': 'Card 0 ex',
+        'deck_list': '\n'.join(f'4 Card {i} ex SVI {i}' for i in range(15)),
+        'card_data': card_data,
+        'test_results': {'total_hands': 120, 'mulligan_count': 9, 'mulligan_percentage': 7.5},
+        'stats': {'total_matches': 20, 'wins': 12, 'losses': 8, 'win_rate': 60.0},
+        'featured_image': pick_featured_image('Card 0 ex', card_data),
+        'created_at': now,
+        'updated_at': now,
+    }
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = fn()
+    return body, (time.perf_counter() - start) / iterations * 1000
+
+def main():
+    num_decks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    decks = [make_deck() for _ in range(num_decks)]
+    summaries = [{k: d[k] for k in DECK_SUMMARY_FIELDS if k in d} for d in decks]
+    adapter = TypeAdapter(List[Deck])
+
+    def before():
+        # What FastAPI did with response_model=List[Deck] and the default JSONResponse
+        validated = adapter.validate_python(decks)
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(',', ':')).encode()
+
+    def after_full():
+        return orjson.dumps(decks)
+
+    def after_summary():
+        return orjson.dumps(summaries)
+
+    print(f'=== /api/decks payload benchmark: {num_decks} decks, {iterations} iterations ===\n')
+    print(f'{"mode":<28}{"bytes":>12}{"gzip bytes":>12}{"serialize ms":>14}')
+    for label, fn in [('before (pydantic + json)', before),
+                      ('orjson, full', after_full),
+                      ('orjson, fields=summary', after_summary)]:
+        body, ms = timed(fn, iterations)
+        print(f'{label:<28}{len(body):>12,}{len(gzip.compress(body, 6)):>12,}{ms:>14.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Cold start report
+Imports server.py in a fresh interpreter under `python -X importtime`, prints the
+packages that dominate the import by cumulative time, then times the app's lifespan
+startup (index creation, archetype seeding) on mongomock or TEST_MONGO_URL.
+Exits non-zero when the import exceeds its budget, so CI catches a heavy import
+creeping back into the module-level path.
+
+  python backend/importtime_report.py                  # report, 1.5s import budget
+  python backend/importtime_report.py --budget-ms 800 --top 25
+  python backend/importtime_report.py --startup        # also time lifespan startup
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1500"))
+
+# server.py reads these at import; nothing connects until the first query
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+# "import time:       self [us] |  cumulative | imported package"
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_times(module: str = "server") -> list:
+    """(depth, self us, cumulative us, module) per import, in the interpreter's order"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"import {module} failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((len(indent) // 2, int(self_us), int(cumulative_us), name))
+    return rows
+
+def by_package(rows: list) -> dict:
+    """Cumulative microseconds per top-level package imported directly by the module"""
+    totals = defaultdict(int)
+    for depth, _, cumulative_us, name in rows:
+        if depth == 1:
+            totals[name.split(".")[0]] += cumulative_us
+    return totals
+
+async def time_startup() -> float:
+    """Milliseconds for the lifespan's startup tasks on mongomock (or TEST_MONGO_URL)"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    test_url = os.environ.get("TEST_MONGO_URL")
+    if test_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        server.db = AsyncIOMotorClient(test_url, tz_aware=True)["importtime_report"]
+    else:
+        import mongomock_motor
+        server.db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["importtime_report"]
+
+    start = time.perf_counter()
+    async with server.lifespan(server.app):
+        await server.app.state.startup_task
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--startup", action="store_true", help="also time lifespan startup")
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total_ms = max((cumulative for depth, _, cumulative, name in rows if name == args.module), default=0) / 1000
+    packages = sorted(by_package(rows).items(), key=lambda item: item[1], reverse=True)
+
+    print(f"import {args.module}: {total_ms:.0f}ms (budget {args.budget_ms:.0f}ms)")
+    print(f"{'package':<32}{'cumulative':>12}")
+    for name, cumulative_us in packages[:args.top]:
+        print(f"{name:<32}{cumulative_us / 1000:>10.1f}ms")
+    heavy = [name for _, _, _, name in rows if name.split(".")[0] in ("playwright", "bs4", "numpy")]
+    if heavy:
+        print(f"warning: lazily loaded packages imported at startup: {sorted({n.split('.')[0] for n in heavy})}")
+
+    if args.startup:
+        print(f"lifespan startup: {asyncio.run(time_startup()):.0f}ms")
+
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import {args.module} took {total_ms:.0f}ms, over the {args.budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
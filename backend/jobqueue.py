@@ -0,0 +1,400 @@
+"""
+Durable job queue on the `jobs` collection
+Long-running work (scrapes, server-side card resolution, simulations) is enqueued
+instead of run inside the request: the POST returns a job id at once and clients poll
+GET /api/jobs/{id} for progress and the result. Any worker can run any job. Web workers
+run a few consumer coroutines (JOB_WORKERS), and `python backend/worker.py` runs a
+dedicated consumer process against the same collection.
+
+A job is claimed atomically, highest priority first and then oldest, and holds a lease
+that the running worker renews. If the worker dies, the lease expires and another worker
+reclaims the job, unless that attempt was its last: then the job fails. A failed
+attempt is retried with exponential backoff until max_attempts. An idempotency key per user maps a repeated POST to the job it already
+created.
+
+Handlers can also emit events (each resolved card, partial simulation aggregates) to
+`job_events`. GET /api/jobs/{id}/events streams those events as Server-Sent Events, along
+with progress and status changes. On the worker running the job the stream wakes
+immediately; other workers poll.
+A running job can be cancelled. The flag is seen at the handler's next progress write or
+the next lease renewal, or at once when the job runs on the worker handling the cancel.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from metrics import Counter, Histogram, REGISTRY
+from scheduler import worker_identity
+
+logger = logging.getLogger(__name__)
+
+JOBS_FINISHED = REGISTRY.register(Counter(
+    "jobs_finished_total", "Job attempts by kind and outcome", ("kind", "status")))
+JOB_RUN_TIME = REGISTRY.register(Histogram(
+    "job_run_duration_seconds", "Time spent running one job attempt", ("kind",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)))
+JOB_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "job_queue_wait_seconds", "Time from enqueue (or retry time) to a worker claiming the job", ("kind",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300)))
+
+# Finished jobs are kept this long for polling clients, then removed by a TTL index
+FINISHED_RETENTION = timedelta(days=7)
+EVENT_RETENTION = timedelta(days=1)
+FINISHED_STATUSES = {"succeeded", "failed", "cancelled"}
+
+# Fields GET /api/jobs/{id} reports
+JOB_FIELDS = {"_id": 0, "id": 1, "kind": 1, "status": 1, "priority": 1, "params": 1, "attempts": 1,
+                 "max_attempts": 1, "progress": 1, "result": 1, "error": 1, "created_at": 1,
+                 "started_at": 1, "finished_at": 1, "run_at": 1}
+
+class PermanentError(Exception):
+    """Failure that another attempt cannot fix (bad params, deleted deck): no retries"""
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job has been cancelled"""
+
+@dataclass
+class Handler:
+    kind: str
+    run: Callable[["JobContext"], Awaitable[Any]]
+    max_attempts: int = 3
+    timeout: Optional[float] = None  # seconds per attempt
+    priority: int = 0  # default when the caller does not choose one
+
+class JobContext:
+    """What a handler sees: its params and a way to report progress"""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.job = job
+        self.id = job["id"]
+        self.params = job.get("params") or {}
+        self.user_id = job.get("user_id")
+        self.last_progress = 0.0
+
+    @property
+    def final_attempt(self) -> bool:
+        """No retry follows if this attempt fails: a handler's cue to settle for partial results"""
+        return self.job["attempts"] >= self.job["max_attempts"]
+
+    async def progress(self, done: int, total: int, message: Optional[str] = None, force: bool = False):
+        """Record progress; writes are throttled so a tight loop can call this every step"""
+        now = time.monotonic()
+        if not force and done < total and now - self.last_progress < self.queue.progress_interval:
+            return
+        self.last_progress = now
+        progress = {"done": done, "total": total, "message": message}
+        self.job["progress"] = progress
+        # The same round trip tells us whether someone cancelled the job meanwhile
+        job = await self.queue.collection().find_one_and_update(
+            {"id": self.id}, {"$set": {"progress": progress}}, {"_id": 0, "cancel_requested": 1})
+        self.queue.notify(self.id)
+        if job and job.get("cancel_requested"):
+            raise JobCancelled()
+
+    async def emit(self, kind: str, data: Any):
+        """Publish an event to the job's stream (stored, so late subscribers replay it)"""
+        now = datetime.now(timezone.utc)
+        await self.queue.events().insert_one(
+            {"job_id": self.id, "type": kind, "data": data, "created_at": now, "expires_at": now + EVENT_RETENTION})
+        self.queue.notify(self.id)
+
+class JobQueue:
+    def __init__(self, collection_getter, events_getter, concurrency: int = 2, poll_seconds: float = 1.0,
+                 lease_seconds: float = 60, backoff_seconds: float = 5, max_backoff_seconds: float = 600,
+                 progress_interval: float = 0.5, worker_id: Optional[str] = None):
+        self.collection = collection_getter  # resolved per call so the db can be swapped
+        self.events = events_getter
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.progress_interval = progress_interval
+        self.worker_id = worker_id or worker_identity()
+        self.handlers: Dict[str, Handler] = {}
+        self.tasks = []
+        self.wakeup = asyncio.Event()
+        self.local: Dict[str, asyncio.Future] = {}  # job id -> handler run on this worker
+        self.cancelled: Set[str] = set()
+        self.watchers: Dict[str, Set[asyncio.Event]] = {}
+
+    def handler(self, kind: str, run, max_attempts: int = 3, timeout: Optional[float] = None, priority: int = 0):
+        self.handlers[kind] = Handler(kind, run, max_attempts, timeout, priority)
+
+    async def ensure_indexes(self):
+        jobs = self.collection()
+        await asyncio.gather(
+            jobs.create_index("id", unique=True),
+            # Claim order: runnable jobs by priority, then by when they became runnable
+            jobs.create_index([("status", 1), ("priority", -1), ("run_at", 1)]),
+            jobs.create_index([("user_id", 1), ("created_at", -1)]),
+            jobs.create_index("idempotency", unique=True, sparse=True),
+            jobs.create_index("expires_at", expireAfterSeconds=0),
+            self.events().create_index([("job_id", 1), ("_id", 1)]),
+            self.events().create_index("expires_at", expireAfterSeconds=0),
+        )
+
+    async def enqueue(self, kind: str, params: Optional[dict] = None, user_id: Optional[str] = None,
+                      priority: Optional[int] = None, idempotency_key: Optional[str] = None) -> dict:
+        """Insert a queued job, or return the one already created under this idempotency key"""
+        handler = self.handlers[kind]
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params or {},
+            "user_id": user_id,
+            "status": "queued",
+            "priority": handler.priority if priority is None else priority,
+            "attempts": 0,
+            "max_attempts": handler.max_attempts,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "run_at": now,
+        }
+        if idempotency_key:
+            job["idempotency"] = f"{user_id}:{kind}:{idempotency_key}"
+        try:
+            await self.collection().insert_one(job)
+        except DuplicateKeyError:
+            existing = await self.collection().find_one({"idempotency": job["idempotency"]}, JOB_FIELDS)
+            if existing:
+                return existing
+            raise
+        self.wakeup.set()
+        return {k: v for k, v in job.items() if JOB_FIELDS.get(k)}
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"id": job_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return await self.collection().find_one(query, JOB_FIELDS)
+
+    async def cancel(self, job_id: str, user_id: Optional[str] = None) -> Optional[str]:
+        """Cancel a queued job outright, or ask a running one to stop; the resulting status"""
+        query = {"id": job_id} if user_id is None else {"id": job_id, "user_id": user_id}
+        now = datetime.now(timezone.utc)
+        result = await self.collection().update_one(
+            {**query, "status": "queued"},
+            {"$set": {"status": "cancelled", "finished_at": now, "expires_at": now + FINISHED_RETENTION}})
+        if result.modified_count:
+            self.notify(job_id)
+            return "cancelled"
+        result = await self.collection().update_one(
+            {**query, "status": "running"}, {"$set": {"cancel_requested": True}})
+        if not result.modified_count:
+            return None
+        self.stop_local(job_id)
+        return "cancelling"
+
+    def stop_local(self, job_id: str):
+        if job_id in self.local:
+            self.cancelled.add(job_id)
+            self.local[job_id].cancel()
+
+    def notify(self, job_id: str):
+        for event in self.watchers.get(job_id, ()):
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float):
+        """Sleep until this worker changes the job or emits for it, or `timeout` passes"""
+        event = asyncio.Event()
+        self.watchers.setdefault(job_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.watchers[job_id].discard(event)
+            if not self.watchers[job_id]:
+                del self.watchers[job_id]
+
+    async def stream(self, job_id: str, after: Optional[str] = None, poll_seconds: float = 0.5,
+                     keepalive_seconds: float = 15) -> AsyncIterator[dict]:
+        """Stored events after `after` (an event id), then live events, progress and status changes
+
+        Ends after the job reaches a finished status; yields None as a keepalive when quiet.
+        """
+        try:
+            last = ObjectId(after) if after else None
+        except InvalidId:
+            last = None
+        sent_status, sent_progress = None, None
+        quiet_since = time.monotonic()
+        while True:
+            # Job first: events written before a finished status are then all in the read below
+            job = await self.collection().find_one({"id": job_id}, JOB_FIELDS)
+            if job is None:
+                return
+            query = {"job_id": job_id}
+            if last is not None:
+                query["_id"] = {"$gt": last}
+            events = await self.events().find(query).sort("_id", 1).to_list(None)
+            for event in events:
+                last = event["_id"]
+                yield {"id": str(event["_id"]), "type": event["type"], "data": event["data"]}
+            if job.get("progress") and job["progress"] != sent_progress:
+                sent_progress = job["progress"]
+                yield {"type": "progress", "data": sent_progress}
+            if job["status"] != sent_status:
+                sent_status = job["status"]
+                yield {"type": "status", "data": job}
+            if job["status"] in FINISHED_STATUSES:
+                return
+            if events:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= keepalive_seconds:
+                quiet_since = time.monotonic()
+                yield None
+            await self.wait(job_id, poll_seconds)
+
+    async def claim(self) -> Optional[dict]:
+        """Atomically take the most urgent runnable job (or one whose worker's lease lapsed)"""
+        now = datetime.now(timezone.utc)
+        update = {"status": "running", "worker": self.worker_id, "started_at": now,
+                  "lease_expires_at": now + timedelta(seconds=self.lease_seconds)}
+        # The pre-image is enough: the update's effect is applied to it below
+        job = await self.collection().find_one_and_update(
+            {"kind": {"$in": list(self.handlers)},
+             "$or": [{"status": "queued", "run_at": {"$lte": now}},
+                     {"status": "running", "lease_expires_at": {"$lte": now}}]},
+            {"$set": update, "$inc": {"attempts": 1}},
+            sort=[("priority", -1), ("run_at", 1)],
+            return_document=ReturnDocument.BEFORE)
+        if job is None:
+            return None
+        JOB_QUEUE_WAIT.observe(max(0.0, (now - job["run_at"]).total_seconds()), kind=job["kind"])
+        job.update(update)
+        job["attempts"] += 1
+        return job
+
+    async def renew(self, job: dict):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            current = await self.collection().find_one_and_update(
+                {"id": job["id"], "worker": self.worker_id, "status": "running"},
+                {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+                {"_id": 0, "cancel_requested": 1})
+            if current and current.get("cancel_requested"):
+                # Cancelled through another worker while the handler reports no progress
+                self.stop_local(job["id"])
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter"""
+        ceiling = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def execute(self, job: dict) -> str:
+        handler = self.handlers[job["kind"]]
+        context = JobContext(self, job)
+        renewer = asyncio.create_task(self.renew(job))
+        run = asyncio.ensure_future(asyncio.wait_for(handler.run(context), handler.timeout))
+        self.local[job["id"]] = run
+        if job.get("cancel_requested"):
+            self.stop_local(job["id"])  # cancelled after its previous worker's lease lapsed
+        self.notify(job["id"])
+        start = time.perf_counter()
+        try:
+            result = await run
+            status, fields = "succeeded", {"result": result, "error": None}
+        except JobCancelled:
+            status, fields = "cancelled", {"error": "cancelled"}
+        except asyncio.CancelledError:
+            if job["id"] not in self.cancelled:
+                # Shutdown: hand the job back untouched so the next worker starts it afresh
+                renewer.cancel()
+                await self.collection().update_one(
+                    {"id": job["id"], "worker": self.worker_id},
+                    {"$set": {"status": "queued", "worker": None}, "$inc": {"attempts": -1}})
+                raise
+            status, fields = "cancelled", {"error": "cancelled"}
+        except Exception as e:
+            error = f"timed out after {handler.timeout}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            if not isinstance(e, PermanentError) and job["attempts"] < job["max_attempts"]:
+                delay = self.backoff(job["attempts"])
+                status, fields = "queued", {"error": error, "worker": None,
+                                            "run_at": datetime.now(timezone.utc) + timedelta(seconds=delay)}
+                logger.warning(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, "
+                               f"retrying in {delay:.0f}s: {error}")
+            else:
+                status, fields = "failed", {"error": error}
+                logger.error(f"Job {job['id']} ({job['kind']}) failed: {error}")
+        finally:
+            renewer.cancel()
+            self.local.pop(job["id"], None)
+            self.cancelled.discard(job["id"])
+        elapsed = time.perf_counter() - start
+        JOBS_FINISHED.inc(kind=job["kind"], status="retrying" if status == "queued" else status)
+        JOB_RUN_TIME.observe(elapsed, kind=job["kind"])
+
+        if status != "queued":
+            finished = datetime.now(timezone.utc)
+            fields.update(finished_at=finished, expires_at=finished + FINISHED_RETENTION)
+            if status == "succeeded" and context.job.get("progress"):
+                progress = context.job["progress"]
+                fields["progress"] = {**progress, "done": progress["total"]}
+        await self.collection().update_one(
+            {"id": job["id"], "worker": self.worker_id}, {"$set": {"status": status, **fields}})
+        self.notify(job["id"])
+        return status
+
+    async def abandon(self, job: dict) -> str:
+        """Fail a reclaimed job whose worker died on its final attempt instead of running it again"""
+        finished = datetime.now(timezone.utc)
+        error = f"worker lost during attempt {job['max_attempts']} of {job['max_attempts']}"
+        # The claim counted an attempt that never runs
+        await self.collection().update_one(
+            {"id": job["id"], "worker": self.worker_id},
+            {"$set": {"status": "failed", "error": error, "finished_at": finished,
+                      "expires_at": finished + FINISHED_RETENTION},
+             "$inc": {"attempts": -1}})
+        JOBS_FINISHED.inc(kind=job["kind"], status="failed")
+        logger.error(f"Job {job['id']} ({job['kind']}) failed: {error}")
+        self.notify(job["id"])
+        return "failed"
+
+    async def run_once(self) -> Optional[str]:
+        """Claim and run one job; the job's final status, or None if nothing was runnable"""
+        job = await self.claim()
+        if job is None:
+            return None
+        if job["attempts"] > job["max_attempts"]:
+            return await self.abandon(job)
+        return await self.execute(job)
+
+    async def consume(self):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.consume()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
@@ -0,0 +1,67 @@
+"""
+Canonicalize opponent names on existing matches
+Resolves every distinct opponent_deck_name once through the archetype index and
+stamps opponent_archetype_id / opponent_archetype on all matches that use it.
+
+Usage: python migrate_archetypes.py [--dry-run]
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from archetypes import ArchetypeIndex, canonicalize, ensure_archetypes, normalize_name
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+async def migrate_archetypes(dry_run=False):
+    """Resolve distinct opponent names and bulk-update their matches"""
+
+    print(f"=== Canonicalizing opponent archetypes{' (dry run)' if dry_run else ''} ===\n")
+
+    index = ArchetypeIndex()
+    await ensure_archetypes(db, index)
+
+    names = await db.matches.distinct(
+        "opponent_deck_name", {"opponent_archetype_id": {"$exists": False}}
+    )
+    print(f"Found {len(names)} distinct opponent names to resolve\n")
+
+    matches_updated = 0
+    archetypes_used = set()
+
+    for name in names:
+        if dry_run:
+            archetype_id = index.lookup(name)
+            canonical = index.names.get(archetype_id, f"(new) {name.strip()}")
+        else:
+            archetype = await canonicalize(db, index, name) if normalize_name(name) else None
+            if not archetype:
+                print(f"  ✗ Skipping unnameable opponent {name!r}")
+                continue
+            archetype_id, canonical = archetype["id"], archetype["name"]
+            result = await db.matches.update_many(
+                {"opponent_deck_name": name, "opponent_archetype_id": {"$exists": False}},
+                {"$set": {"opponent_archetype_id": archetype_id, "opponent_archetype": canonical}}
+            )
+            matches_updated += result.modified_count
+        archetypes_used.add(canonical)
+        print(f"  {name!r} -> {canonical}")
+
+    print(f"\n=== Migration Complete ===")
+    print(f"Distinct raw names: {len(names)}")
+    print(f"Canonical archetypes: {len(archetypes_used)}")
+    print(f"Matches updated: {matches_updated}")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_archetypes(dry_run="--dry-run" in sys.argv))
+    client.close()
@@ -0,0 +1,102 @@
+"""
+Move embedded card_data out of deck documents into the shared pokemon_cards collection
+Every card a deck embeds is inserted into pokemon_cards if it is not there yet,
+then the deck keeps only its card_keys. Decks without a featured_image get one picked
+from card_data first, since the dashboard backfill can no longer derive it afterwards.
+Reports how much storage was saved.
+
+Usage: python migrate_card_data.py [--dry-run]
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import bson
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from server import card_doc_from_client, card_keys_for, pick_featured_image
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 200
+
+async def collection_size(name):
+    stats = await db.command("collStats", name)
+    return stats.get("size", 0)
+
+async def migrate_card_data(dry_run=False):
+    """Deduplicate card_data from all decks into pokemon_cards"""
+
+    print(f"=== Normalizing deck card_data{' (dry run)' if dry_run else ''} ===\n")
+
+    decks_size_before = await collection_size("decks")
+    cards_size_before = await collection_size("pokemon_cards")
+
+    decks_migrated = 0
+    cards_seen = 0
+    cards_inserted = 0
+    embedded_bytes = 0
+    unique_cards = set()
+
+    deck_ops = []
+    cursor = db.decks.find(
+        {"card_data": {"$exists": True}},
+        {"_id": 1, "id": 1, "deck_name": 1, "deck_list": 1, "card_data": 1, "featured_image": 1}
+    )
+    async for deck in cursor:
+        card_data = deck.get("card_data") or {}
+        embedded_bytes += len(bson.encode({"card_data": card_data}))
+
+        card_ops = []
+        for cache_key, card in card_data.items():
+            card_doc = card_doc_from_client(cache_key, card or {})
+            if not card_doc:
+                continue
+            cards_seen += 1
+            unique_cards.add(card_doc["card_id"])
+            card_ops.append(UpdateOne({"card_id": card_doc["card_id"]}, {"$setOnInsert": card_doc}, upsert=True))
+
+        if card_ops and not dry_run:
+            result = await db.pokemon_cards.bulk_write(card_ops, ordered=False)
+            cards_inserted += result.upserted_count
+
+        update = {"card_keys": card_keys_for(deck.get("deck_list") or "", card_data)}
+        if "featured_image" not in deck:
+            update["featured_image"] = pick_featured_image(deck.get("deck_name") or "", card_data)
+        deck_ops.append(UpdateOne({"_id": deck["_id"]}, {"$set": update, "$unset": {"card_data": ""}}))
+        decks_migrated += 1
+
+        if len(deck_ops) >= BATCH_SIZE:
+            if not dry_run:
+                await db.decks.bulk_write(deck_ops, ordered=False)
+            deck_ops = []
+            print(f"  ✓ {decks_migrated} decks processed")
+
+    if deck_ops and not dry_run:
+        await db.decks.bulk_write(deck_ops, ordered=False)
+
+    decks_size_after = await collection_size("decks")
+    cards_size_after = await collection_size("pokemon_cards")
+
+    print(f"\n=== Migration Complete ===")
+    print(f"Decks migrated: {decks_migrated}")
+    print(f"Embedded card entries: {cards_seen} ({len(unique_cards)} unique cards)")
+    print(f"New cards added to pokemon_cards: {cards_inserted}")
+    print(f"Embedded card_data removed: {embedded_bytes / 1024:.1f} KiB")
+    print(f"decks collection: {decks_size_before / 1024:.1f} KiB -> {decks_size_after / 1024:.1f} KiB")
+    print(f"pokemon_cards collection: {cards_size_before / 1024:.1f} KiB -> {cards_size_after / 1024:.1f} KiB")
+    saved = (decks_size_before + cards_size_before) - (decks_size_after + cards_size_after)
+    print(f"Net data size saved: {saved / 1024:.1f} KiB (run compact to release disk space)")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_card_data(dry_run="--dry-run" in sys.argv))
+    client.close()
@@ -0,0 +1,98 @@
+"""
+Backfill ISO-8601 date strings into native BSON dates
+Older documents were written with datetime.isoformat(); the server now stores
+and queries real dates (TTL index on sessions, date-range queries on matches).
+Safe to re-run: only string-typed fields are touched.
+
+Usage: python migrate_datetimes.py [--dry-run]
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+# collection -> date fields (dotted paths allowed)
+DATE_FIELDS = {
+    'users': ['created_at'],
+    'sessions': ['expires_at', 'created_at'],
+    'decks': ['created_at', 'updated_at', 'test_results.last_tested'],
+    'matches': ['match_date', 'created_at'],
+    'pokemon_cards': ['created_at'],
+}
+
+BATCH_SIZE = 500
+
+def parse_date(value):
+    """Parse an isoformat() string into a UTC-aware datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def get_path(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+async def backfill_collection(name, fields, dry_run):
+    converted = 0
+    failed = 0
+    ops = []
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+
+    async for doc in db[name].find(query, projection):
+        update = {}
+        for field in fields:
+            value = get_path(doc, field)
+            if isinstance(value, str):
+                try:
+                    update[field] = parse_date(value)
+                except ValueError:
+                    print(f"  ✗ {name} {doc['_id']}: unparseable {field}={value!r}")
+                    failed += 1
+        if update:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+            converted += 1
+        if len(ops) >= BATCH_SIZE:
+            if not dry_run:
+                await db[name].bulk_write(ops, ordered=False)
+            ops = []
+
+    if ops and not dry_run:
+        await db[name].bulk_write(ops, ordered=False)
+
+    print(f"  ✓ {name}: {converted} documents converted, {failed} fields skipped")
+    return converted
+
+async def migrate_datetimes(dry_run=False):
+    """Convert every known date field from string to BSON date"""
+
+    print(f"=== Backfilling BSON dates{' (dry run)' if dry_run else ''} ===\n")
+
+    total = 0
+    for name, fields in DATE_FIELDS.items():
+        total += await backfill_collection(name, fields, dry_run)
+
+    print(f"\n=== Backfill Complete ===")
+    print(f"Documents converted: {total}")
+    print("Restart the backend so the sessions TTL index is (re)created on startup.")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_datetimes(dry_run="--dry-run" in sys.argv))
+    client.close()
@@ -0,0 +1,172 @@
+"""
+Deck consistency optimizer
+Searches small count adjustments to a deck list: add a copy of a Basic Pokemon, an Energy
+or a Supporter and cut a copy of something else, so the deck size stays the same. Each
+variation is scored on its mulligan rate and on "at least k of these by turn N" access
+targets with the exact odds from probability.py. The result is the Pareto front: tweaks
+that no other variation beats on every score at once.
+
+A score depends only on the deck size, the Basic count and each target's copy counts, so
+scores are memoized on those numbers. Different swaps that land on the same numbers are
+scored once. Unscored compositions are split into batches and evaluated across a process
+pool. The search widens one swap at a time from the current front until it runs out of
+time or of new variations.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from probability import MAX_COPIES, draw_probabilities, mulligan_rate
+from simulation import BASIC, ENERGY
+
+# (deck size, Basic count, (copies, non-Basic copies) per target)
+Composition = Tuple[int, int, Tuple[Tuple[int, int], ...]]
+# (k, turn, "first" | "second") per target
+Check = Tuple[int, int, str]
+
+BATCH_SIZE = 32  # one numpy evaluation is ~1ms, so ship compositions to the pool in batches
+MAX_FRONT = 25
+
+@dataclass
+class Row:
+    cache_key: str
+    name: str
+    copies: int
+    code: int
+    supporter: bool = False
+    basic_energy: bool = False
+
+    @property
+    def tweakable(self) -> bool:
+        """Cards the optimizer may add a copy of"""
+        return self.code in (BASIC, ENERGY) or self.supporter
+
+    @property
+    def max_copies(self) -> int:
+        return 60 if self.basic_energy else MAX_COPIES
+
+def score_compositions(compositions: Sequence[Composition], checks: Sequence[Check]) -> List[Optional[dict]]:
+    """Mulligan rate and target odds per composition; None for decks without a Basic
+
+    Runs in the process pool, so it only takes and returns plain data.
+    """
+    max_turn = max((turn for _, turn, _ in checks), default=1)
+    scores = []
+    for deck_size, basics, targets in compositions:
+        if basics < 1:
+            scores.append(None)
+            continue
+        odds = draw_probabilities(deck_size, basics, list(targets) or [(0, 0)], max_turn)
+        scores.append({
+            "mulligan_rate": round(mulligan_rate(deck_size, basics), 4),
+            "targets": [round(float(odds[going][i, k - 1, turn - 1]), 4)
+                        for i, (k, turn, going) in enumerate(checks)],
+        })
+    return scores
+
+def composition(rows: List[Row], counts: Tuple[int, ...], members: List[List[int]]) -> Composition:
+    basics = sum(n for row, n in zip(rows, counts) if row.code == BASIC)
+    targets = tuple((sum(counts[i] for i in group), sum(counts[i] for i in group if rows[i].code != BASIC))
+                    for group in members)
+    return sum(counts), basics, targets
+
+def swaps(rows: List[Row], counts: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+    """Every +1 of a tweakable card paired with a -1 of any other card"""
+    variations = []
+    for add, row in enumerate(rows):
+        if not row.tweakable or counts[add] >= row.max_copies:
+            continue
+        for cut in range(len(rows)):
+            if cut != add and counts[cut] > 0:
+                variation = list(counts)
+                variation[add] += 1
+                variation[cut] -= 1
+                variations.append(tuple(variation))
+    return variations
+
+def cost(score: dict) -> Tuple[float, ...]:
+    """Scores as one vector where lower is better everywhere"""
+    return (score["mulligan_rate"], *(-t for t in score["targets"]))
+
+def pareto_front(scored: Dict[Tuple[int, ...], dict]) -> Dict[Tuple[float, ...], Tuple[int, ...]]:
+    """Non-dominated score vectors, each with the first variation that reached it
+
+    Sorted, a point can only be dominated by one before it, so each point is compared with
+    the front so far rather than with every other point.
+    """
+    by_cost = {}
+    for counts, score in scored.items():
+        by_cost.setdefault(cost(score), counts)
+    front = {}
+    for point in sorted(by_cost):
+        if not any(all(f <= p for f, p in zip(kept, point)) for kept in front):
+            front[point] = by_cost[point]
+    return front
+
+async def search(rows: List[Row], members: List[List[int]], checks: List[Check], budget_seconds: float,
+                 executor=None, workers: int = 1, max_changes: int = 3, memo=None) -> dict:
+    """Explore swaps from the stored counts for up to `budget_seconds`
+
+    `members` lists, per target, the indexes of the rows it counts. `memo` maps
+    (checks, composition) to a score and may be shared between searches.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + budget_seconds
+    memo = {} if memo is None else memo
+    baseline = tuple(row.copies for row in rows)
+    scored: Dict[Tuple[int, ...], dict] = {}
+    checks_key = tuple(checks)
+    evaluated = 0
+
+    async def score(variations: List[Tuple[int, ...]]):
+        nonlocal evaluated
+        keys = {counts: (checks_key, composition(rows, counts, members)) for counts in variations}
+        pending = list({key for key in keys.values() if key not in memo})
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, score_compositions, [key[1] for key in batch], checks)
+            for batch in batches))
+        for batch, batch_scores in zip(batches, results):
+            memo.update(zip(batch, batch_scores))
+        evaluated += len(pending)
+        for counts, key in keys.items():
+            score = memo.get(key)
+            if score is not None:
+                scored[counts] = score
+
+    await score([baseline])
+    if baseline not in scored:
+        raise ValueError("The deck has no Basic Pokemon")
+    seen = {baseline}
+    frontier = [baseline]
+    timed_out = False
+    for _ in range(max_changes):
+        variations = list(dict.fromkeys(v for counts in frontier for v in swaps(rows, counts) if v not in seen))
+        seen.update(variations)
+        # A batch per pool worker at a time, so the deadline is checked between steps
+        step = BATCH_SIZE * max(workers, 1)
+        for start in range(0, len(variations), step):
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            await score(variations[start:start + step])
+        # Widen from the variations this step added to the front
+        added = set(variations)
+        frontier = [counts for counts in pareto_front(scored).values() if counts in added]
+        if timed_out or not frontier:
+            break
+
+    front = [counts for counts in pareto_front(scored).values() if counts != baseline]
+    front.sort(key=lambda counts: ([-t for t in scored[counts]["targets"]], scored[counts]["mulligan_rate"]))
+    return {
+        "baseline": scored[baseline],
+        "tweaks": [{
+            "changes": [{"cache_key": row.cache_key, "name": row.name, "delta": n - row.copies}
+                        for row, n in zip(rows, counts) if n != row.copies],
+            **scored[counts],
+        } for counts in front[:MAX_FRONT]],
+        "evaluated": evaluated,
+        "variations": len(scored) - 1,
+        "timed_out": timed_out,
+    }
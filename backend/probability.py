@@ -0,0 +1,82 @@
+"""
+Turn-by-turn draw probabilities
+Exact hypergeometric odds of having seen at least k copies of each card (or group of
+cards) by turn N, going first or second. The opening 7 is conditioned on holding a Basic
+Pokemon, since a hand without one is shuffled back (a mulligan). The 6 prizes are a uniform
+random draw from what is left after the opener, so they do not change the draw odds; they
+cap how many cards can be drawn and can lock every copy of a card away, which
+`all_prized` reports.
+
+Everything is computed in one numpy pass over targets x opening copies x draws x drawn
+copies, so a whole deck's table costs about as much as a single card.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+HAND_SIZE = 7
+PRIZES = 6
+MAX_COPIES = 4  # k = 1..4; a deck plays at most 4 of a card other than basic Energy
+
+def binomial_table(n: int) -> np.ndarray:
+    """Pascal's triangle as floats: table[a, b] = C(a, b)"""
+    table = np.zeros((n + 1, n + 1))
+    table[:, 0] = 1
+    for a in range(1, n + 1):
+        table[a, 1:a + 1] = table[a - 1, :a] + table[a - 1, 1:a + 1]
+    return table
+
+def choose(table: np.ndarray, n, k) -> np.ndarray:
+    """C(n, k) elementwise, 0 outside 0 <= k <= n"""
+    n, k = np.broadcast_arrays(np.asarray(n), np.asarray(k))
+    valid = (k >= 0) & (k <= n) & (n >= 0)
+    return np.where(valid, table[np.clip(n, 0, None), np.clip(k, 0, None)], 0.0)
+
+def mulligan_rate(deck_size: int, basics: int) -> float:
+    table = binomial_table(deck_size)
+    return float(choose(table, deck_size - basics, HAND_SIZE) / table[deck_size, HAND_SIZE])
+
+def draw_probabilities(deck_size: int, basics: int, targets: List[Tuple[int, int]], max_turn: int) -> dict:
+    """Odds for each target, given as (copies, copies that are not Basic Pokemon)
+
+    Returns "first" and "second" arrays shaped [target, k - 1, turn - 1] holding
+    P(at least k copies seen by that turn), and "all_prized" per target.
+    """
+    if basics < 1:
+        raise ValueError("The deck has no Basic Pokemon")
+    if deck_size < HAND_SIZE + PRIZES:
+        raise ValueError(f"A deck needs at least {HAND_SIZE + PRIZES} cards")
+    table = binomial_table(deck_size)
+    rest = deck_size - HAND_SIZE
+    draw_cap = rest - PRIZES
+
+    copies = np.array([t[0] for t in targets])[:, None, None, None]
+    nonbasic = np.array([t[1] for t in targets])[:, None, None, None]
+    other_basics = basics - (copies - nonbasic)
+    in_hand = np.arange(HAND_SIZE + 1)[None, :, None, None]
+    draws = np.minimum(np.arange(max_turn + 1), draw_cap)[None, None, :, None]
+    drawn = np.arange(copies.max() + 1)[None, None, None, :]
+
+    # P(x copies in the opener and a Basic among its 7 cards) / P(a Basic among them).
+    # The subtracted term counts openers whose x copies are all non-Basic and that
+    # hold no other Basic either.
+    hand = (choose(table, copies, in_hand) * choose(table, deck_size - copies, HAND_SIZE - in_hand)
+            - choose(table, nonbasic, in_hand) * choose(table, deck_size - copies - other_basics, HAND_SIZE - in_hand))
+    hand = hand / (table[deck_size, HAND_SIZE] - table[deck_size - basics, HAND_SIZE])
+
+    # P(j more copies among d draws from the rest of the deck)
+    left = copies - in_hand
+    draw = choose(table, left, drawn) * choose(table, rest - left, draws - drawn) / choose(table, rest, draws)
+
+    joint = hand * draw  # [target, opener copies, draws, drawn copies]
+    seen = np.minimum(in_hand + drawn, MAX_COPIES)
+    at_least = np.stack([(joint * (seen >= k)).sum(axis=(1, 3)) for k in range(1, MAX_COPIES + 1)], axis=1)
+    at_least = np.clip(at_least, 0.0, 1.0)
+
+    all_prized = hand[:, 0, 0, 0] * choose(table, rest - copies[:, 0, 0, 0], PRIZES - copies[:, 0, 0, 0]) / table[rest, PRIZES]
+    # The player going first skips the turn 1 draw
+    return {
+        "first": at_least[:, :, :max_turn],
+        "second": at_least[:, :, 1:],
+        "all_prized": all_prized,
+    }
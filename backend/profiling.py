@@ -0,0 +1,180 @@
+"""
+On-demand profiling for production diagnosis
+Two modes, both idle (a single dict check per request) until an admin arms them:
+- request profiling: profile the next N requests whose path matches a pattern
+  (pyinstrument when installed, as speedscope, HTML and text; otherwise cProfile)
+- sampling: sample the event loop thread's stack for T seconds and emit
+  collapsed stacks (flamegraph.pl) or a speedscope JSON profile
+Results are kept in memory per worker.
+"""
+import asyncio
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from typing import Dict, Optional
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pragma: no cover - optional dependency
+    PyinstrumentProfiler = None
+
+MAX_RESULTS = 20
+MAX_SAMPLE_SECONDS = 120
+
+class ProfileStore:
+    def __init__(self):
+        self.armed: Dict[str, int] = {}  # path pattern -> requests left to profile
+        self.results = deque(maxlen=MAX_RESULTS)
+        self.sampling = False
+
+    def arm(self, pattern: str, count: int):
+        self.armed[pattern] = count
+
+    def disarm(self):
+        self.armed.clear()
+
+    def claim(self, path: str) -> Optional[str]:
+        """Take one profiling slot for this path, if any pattern matches"""
+        for pattern, remaining in list(self.armed.items()):
+            if fnmatch(path, pattern):
+                if remaining <= 1:
+                    self.armed.pop(pattern, None)
+                else:
+                    self.armed[pattern] = remaining - 1
+                return pattern
+        return None
+
+    def add(self, kind: str, target: str, duration: float, outputs: Dict[str, str]) -> dict:
+        result = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "target": target,
+            "duration_seconds": round(duration, 4),
+            "formats": list(outputs),
+            "created_at": datetime.now(timezone.utc),
+            "outputs": outputs,
+        }
+        self.results.appendleft(result)
+        return result
+
+    def get(self, result_id: str) -> Optional[dict]:
+        return next((r for r in self.results if r["id"] == result_id), None)
+
+    def summaries(self):
+        return [{k: v for k, v in r.items() if k != "outputs"} for r in self.results]
+
+profile_store = ProfileStore()
+
+class ProfilingMiddleware:
+    """Profiles armed requests; a no-op pass-through while nothing is armed"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profile_store.armed or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        pattern = profile_store.claim(scope["path"])
+        if pattern is None:
+            await self.app(scope, receive, send)
+            return
+
+        target = f'{scope["method"]} {scope["path"]}'
+        start = time.perf_counter()
+        if PyinstrumentProfiler is not None:
+            profiler = PyinstrumentProfiler(async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.stop()
+                profile_store.add("request", target, time.perf_counter() - start, {
+                    "speedscope": profiler.output(SpeedscopeRenderer()),
+                    "html": profiler.output_html(),
+                    "text": profiler.output_text(unicode=True),
+                })
+        else:
+            # cProfile sees everything the event loop runs meanwhile, not only this request
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.disable()
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(60)
+                profile_store.add("request", target, time.perf_counter() - start, {"pstats": text.getvalue()})
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+def sample_thread(thread_id: int, seconds: float, interval: float) -> Counter:
+    """Collect root->leaf stacks of one thread; runs in its own thread"""
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            stacks[tuple(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+def collapsed(stacks: Counter) -> str:
+    """flamegraph.pl / speedscope-importable "a;b;c count" lines"""
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()) + "\n"
+
+def speedscope(stacks: Counter, name: str, interval: float) -> dict:
+    """speedscope "sampled" profile (https://www.speedscope.app/file-format-schema.json)"""
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        sample = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(count * interval)
+    total = sum(weights)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": total, "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "tcg-backend",
+    }
+
+async def run_sampler(seconds: float, interval: float) -> dict:
+    """Sample the calling event loop's thread for `seconds` without blocking the loop"""
+    if profile_store.sampling:
+        raise RuntimeError("A sampling profile is already running")
+    profile_store.sampling = True
+    try:
+        loop_thread = threading.get_ident()
+        start = time.perf_counter()
+        stacks = await asyncio.to_thread(sample_thread, loop_thread, seconds, interval)
+        name = f"event loop, {seconds:g}s @ {interval * 1000:g}ms"
+        return profile_store.add("sample", name, time.perf_counter() - start, {
+            "collapsed": collapsed(stacks),
+            "speedscope": speedscope(stacks, name, interval),
+        })
+    finally:
+        profile_store.sampling = False
@@ -0,0 +1,267 @@
+"""
+Rate limiting and admission control
+Every /api request is classified (cheap CRUD, outbound image fetch, Playwright scrape,
+CPU-heavy simulation) and must take a token from a per-IP token bucket of that class and,
+for a session the server has already validated, a per-session one (429 + Retry-After when
+empty). Unknown tokens cost nothing to invent, so they are limited by IP alone; the IP is
+read from the right of X-Forwarded-For, past the configured number of trusted proxies,
+because the client controls everything to the left. Expensive classes also have a
+concurrency ceiling, and a global in-flight ceiling protects the worker (503 + Retry-After).
+Long-lived event streams take a token to connect but are not counted as in flight.
+POST /api/jobs is classified by the job kind in its body, so queueing a scrape as a job
+costs the same as calling the scrape route.
+Buckets live in memory per worker; RATE_LIMIT_BACKEND=mongo shares the expensive classes'
+buckets across workers through an atomic update on the rate_limits collection.
+"""
+import hashlib
+import json
+import math
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from cachetools import TTLCache
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+
+from metrics import Counter, REGISTRY
+
+RATE_LIMITED = REGISTRY.register(Counter(
+    "rate_limited_requests_total", "Requests rejected by rate limiting or admission control", ("route_class", "reason")))
+
+@dataclass
+class RouteClass:
+    name: str
+    capacity: float  # burst size of a per-session bucket
+    refill_per_second: float
+    max_concurrent: Optional[int] = None  # across all users, per worker
+    ip_factor: float = 3.0  # an IP bucket holds this many sessions' worth (shared NATs)
+    shared: bool = False  # use the shared backend when one is configured
+    long_lived: bool = False  # open for minutes (SSE): skips the in-flight and concurrency ceilings
+
+DEFAULT_CLASSES = [
+    # Chromium launches against TrainerHill: 3 per session, then one every 20s
+    (re.compile(r"^/api/(meta-brake|meta-wizard/)"), RouteClass("scrape", 3, 1 / 20, max_concurrent=2, ip_factor=2, shared=True)),
+    # Outbound fetches from the LimitlessTCG CDN; a deck page shows a few dozen cards
+    (re.compile(r"^/api/cards/image/"), RouteClass("image", 120, 5, max_concurrent=32, shared=True)),
+    # CPU-bound simulation and optimization endpoints
+    (re.compile(r"^/api/decks/[^/]+/(optimize|hands|probabilities)"), RouteClass("simulate", 10, 0.5, max_concurrent=4, shared=True)),
+    # Job event streams; EventSource reconnects every few seconds while a job runs
+    (re.compile(r"^/api/jobs/[^/]+/events$"), RouteClass("stream", 60, 1, long_lived=True)),
+]
+DEFAULT_CRUD = RouteClass("crud", 120, 20)
+# Job kind -> route class doing the same work, for POST /api/jobs
+DEFAULT_JOB_CLASSES = {"meta_wizard": "scrape", "meta_brake": "scrape", "simulate_hands": "simulate"}
+JOBS_PATH = "/api/jobs"
+
+def hashed(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:24]
+
+class MemoryBuckets:
+    """Token buckets local to this worker; idle buckets are dropped (a full bucket == a new one)"""
+
+    def __init__(self, maxsize: int = 100_000, idle_seconds: int = 3600):
+        self.buckets = TTLCache(maxsize=maxsize, ttl=idle_seconds)
+
+    async def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return True, 0.0
+        self.buckets[key] = (tokens, now)
+        return False, (1 - tokens) / rate
+
+    def reset(self):
+        self.buckets.clear()
+
+class MongoBuckets:
+    """Token buckets shared by all workers, one document per bucket, updated atomically"""
+
+    def __init__(self, collection_getter, idle_seconds: int = 3600):
+        self.collection = collection_getter  # resolved per call so the db can be swapped
+        self.idle_seconds = idle_seconds
+
+    async def ensure_indexes(self):
+        await self.collection().create_index("expires_at", expireAfterSeconds=0)
+
+    async def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.time()
+        refill = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, rate]},
+        ]}]}
+        update = [
+            {"$set": {"tokens": refill, "updated": now,
+                      "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.idle_seconds)}},
+            # Both expressions see the refilled balance from the previous stage
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]},
+                      "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+        ]
+        bucket = None
+        for _ in range(2):
+            try:
+                bucket = await self.collection().find_one_and_update(
+                    {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER)
+                break
+            except DuplicateKeyError:
+                continue  # another worker created the bucket first; retry as an update
+        if bucket is None:
+            return True, 0.0  # lost the upsert race twice; admit rather than fail the request
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (1 - bucket["tokens"]) / rate
+
+    def reset(self):
+        pass
+
+class RateLimiter:
+    def __init__(self, classes: List[Tuple[Pattern, RouteClass]], crud: RouteClass,
+                 max_in_flight: int, local: MemoryBuckets, shared=None, job_classes: Optional[Dict[str, str]] = None):
+        self.classes = classes
+        self.crud = crud
+        self.job_classes = job_classes or {}
+        self.max_in_flight = max_in_flight
+        self.local = local
+        self.shared = shared
+        self.in_flight = 0
+        self.active = {}  # route class name -> requests in progress
+        self.sessions = TTLCache(maxsize=100_000, ttl=600)  # hashed tokens of validated sessions
+
+    def remember_session(self, token: str):
+        """Called once a request's session has been checked against the database"""
+        self.sessions[hashed(token)] = True
+
+    def forget_session(self, token: str):
+        self.sessions.pop(hashed(token), None)
+
+    def classify(self, path: str) -> RouteClass:
+        for pattern, route_class in self.classes:
+            if pattern.match(path):
+                return route_class
+        return self.crud
+
+    def classify_job(self, kind) -> Optional[RouteClass]:
+        name = self.job_classes.get(kind) if isinstance(kind, str) else None
+        return next((route_class for _, route_class in self.classes if route_class.name == name), None)
+
+    def reset(self):
+        self.local.reset()
+        if self.shared:
+            self.shared.reset()
+        self.in_flight = 0
+        self.active.clear()
+        self.sessions.clear()
+
+    async def check_buckets(self, route_class: RouteClass, identities) -> float:
+        """Retry-After seconds from the first empty bucket, else 0; later buckets are left untouched"""
+        backend = self.shared if route_class.shared and self.shared else self.local
+        for kind, identity in identities:
+            capacity = route_class.capacity * (route_class.ip_factor if kind == "ip" else 1)
+            allowed, retry_after = await backend.take(
+                f"{route_class.name}:{kind}:{identity}", capacity, route_class.refill_per_second)
+            if not allowed:
+                return retry_after
+        return 0.0
+
+def client_ip(connection: HTTPConnection, forwarded_header: Optional[str], trusted_proxies: int) -> str:
+    """The address the outermost trusted proxy saw; hops left of it are client-supplied"""
+    if forwarded_header and trusted_proxies > 0:
+        hops = [hop.strip() for hop in (connection.headers.get(forwarded_header) or "").split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return connection.client.host if connection.client else "unknown"
+
+def client_identities(scope, forwarded_header: Optional[str], trusted_proxies: int, sessions) -> list:
+    """(kind, id) pairs a request is limited by: its client IP, then its session if validated"""
+    connection = HTTPConnection(scope)
+    identities = [("ip", client_ip(connection, forwarded_header, trusted_proxies))]
+    token = connection.cookies.get("session_token")
+    if not token:
+        auth = connection.headers.get("authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else None
+    if token and hashed(token) in sessions:
+        identities.append(("session", hashed(token)))
+    return identities
+
+async def buffer_body(receive):
+    """Read the whole request body; returns it with a receive callable that replays it"""
+    messages, body = [], b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+    return body, replay
+
+def job_kind(body: bytes):
+    try:
+        return json.loads(body).get("kind")
+    except (ValueError, AttributeError):
+        return None  # left for the route to reject
+
+def rejection(status: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+class RateLimitMiddleware:
+    """Admission control for /api: in-flight ceiling, per-class concurrency, token buckets"""
+
+    def __init__(self, app, limiter: RateLimiter, enabled: bool = True, forwarded_header: Optional[str] = None,
+                 trusted_proxies: int = 1):
+        self.app = app
+        self.limiter = limiter
+        self.enabled = enabled
+        self.forwarded_header = forwarded_header
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith("/api/") \
+                or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter
+        route_class = limiter.classify(scope["path"])
+        if scope["method"] == "POST" and scope["path"] == JOBS_PATH and limiter.job_classes:
+            body, receive = await buffer_body(receive)
+            route_class = limiter.classify_job(job_kind(body)) or route_class
+        # Streams stay open for the life of a job; counting them would crowd out short requests
+        counted = not route_class.long_lived
+        if counted and limiter.in_flight >= limiter.max_in_flight:
+            RATE_LIMITED.inc(route_class=route_class.name, reason="overloaded")
+            await rejection(503, "Server is busy, try again shortly", 1)(scope, receive, send)
+            return
+        active = limiter.active.get(route_class.name, 0)
+        if counted and route_class.max_concurrent is not None and active >= route_class.max_concurrent:
+            RATE_LIMITED.inc(route_class=route_class.name, reason="concurrency")
+            await rejection(503, "Too many of these requests are running, try again shortly", 2)(scope, receive, send)
+            return
+        identities = client_identities(scope, self.forwarded_header, self.trusted_proxies, limiter.sessions)
+        retry_after = await limiter.check_buckets(route_class, identities)
+        if retry_after:
+            RATE_LIMITED.inc(route_class=route_class.name, reason="rate")
+            await rejection(429, "Rate limit exceeded", retry_after)(scope, receive, send)
+            return
+        if not counted:
+            await self.app(scope, receive, send)
+            return
+
+        limiter.in_flight += 1
+        limiter.active[route_class.name] = limiter.active.get(route_class.name, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
+            limiter.active[route_class.name] -= 1
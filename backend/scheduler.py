@@ -0,0 +1,206 @@
+"""
+Leader-elected periodic jobs
+Every worker runs a Scheduler, but only the holder of the lease document in
+`scheduler_leases` runs jobs. The leader renews the lease every heartbeat; if it dies, the
+lease expires and another worker takes over on its next heartbeat. Job schedules live in
+`scheduler_jobs`, so a new leader picks up where the old one stopped. Each run is recorded
+in `scheduler_runs`. An admin can ask for a run from any worker by flagging the job
+document, and the leader starts it on its next tick.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from metrics import Counter, Gauge, Histogram, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNS = REGISTRY.register(Counter(
+    "scheduler_job_runs_total", "Scheduled job runs by outcome", ("job", "status")))
+JOB_DURATION = REGISTRY.register(Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time", ("job",),
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600)))
+IS_LEADER = REGISTRY.register(Gauge(
+    "scheduler_is_leader", "1 on the worker currently holding the scheduler lease"))
+
+LEASE_ID = "scheduler"
+RUN_HISTORY_DAYS = 30
+
+@dataclass
+class Job:
+    name: str
+    interval: timedelta
+    run: Callable[[], Awaitable[Optional[dict]]]  # may return a summary stored with the run
+    timeout: Optional[float] = None  # seconds; None lets the run take as long as it needs
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+class Scheduler:
+    def __init__(self, db_getter, lease_seconds: float = 30, heartbeat_seconds: float = 10,
+                 worker_id: Optional[str] = None):
+        self.db = db_getter  # resolved per call so the db can be swapped
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_id = worker_id or worker_identity()
+        self.jobs: Dict[str, Job] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self.is_leader = False
+        self.task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, interval: timedelta, run, timeout: Optional[float] = None):
+        self.jobs[name] = Job(name, interval, run, timeout)
+
+    async def ensure_indexes(self):
+        await self.db().scheduler_runs.create_index([("job", 1), ("started_at", -1)])
+        await self.db().scheduler_runs.create_index(
+            "started_at", expireAfterSeconds=RUN_HISTORY_DAYS * 24 * 3600)
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; False while another worker holds an unexpired one"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await self.db().scheduler_leases.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"owner": self.worker_id}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.worker_id, "heartbeat_at": now,
+                          "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            lease = None  # held by someone else: the upsert collided with their document
+        leader = bool(lease and lease["owner"] == self.worker_id)
+        if leader != self.is_leader:
+            logger.info(f"Scheduler {self.worker_id} {'acquired' if leader else 'lost'} the lease")
+            IS_LEADER.set(1 if leader else 0)
+        self.is_leader = leader
+        return leader
+
+    async def release(self):
+        """Expire our lease so another worker can take over without waiting it out"""
+        if self.is_leader:
+            await self.db().scheduler_leases.update_one(
+                {"_id": LEASE_ID, "owner": self.worker_id},
+                {"$set": {"expires_at": datetime.now(timezone.utc)}})
+        self.is_leader = False
+        IS_LEADER.set(0)
+
+    async def sync_jobs(self):
+        """Create schedule documents for registered jobs; existing schedules are kept"""
+        now = datetime.now(timezone.utc)
+        for job in self.jobs.values():
+            await self.db().scheduler_jobs.update_one(
+                {"_id": job.name},
+                {"$set": {"interval_seconds": job.interval.total_seconds()},
+                 "$setOnInsert": {"next_run_at": now}},
+                upsert=True)
+
+    async def due_jobs(self) -> list:
+        now = datetime.now(timezone.utc)
+        cursor = self.db().scheduler_jobs.find(
+            {"_id": {"$in": list(self.jobs)},
+             "$or": [{"next_run_at": {"$lte": now}}, {"trigger_requested_at": {"$ne": None}}]},
+            {"_id": 1, "trigger_requested_by": 1})
+        return [doc async for doc in cursor if doc["_id"] not in self.running]
+
+    async def tick(self):
+        """One heartbeat: renew the lease and, as leader, start whatever is due"""
+        if not await self.acquire():
+            self.cancel_running()
+            return
+        for doc in await self.due_jobs():
+            self.start(self.jobs[doc["_id"]], doc.get("trigger_requested_by"))
+
+    def start(self, job: Job, triggered_by: Optional[str] = None) -> asyncio.Task:
+        task = asyncio.create_task(self.execute(job, triggered_by))
+        self.running[job.name] = task
+        task.add_done_callback(lambda _: self.running.pop(job.name, None))
+        return task
+
+    async def execute(self, job: Job, triggered_by: Optional[str] = None):
+        started = datetime.now(timezone.utc)
+        # Schedule the next run before starting, so a crash mid-run does not retry in a loop
+        await self.db().scheduler_jobs.update_one(
+            {"_id": job.name},
+            {"$set": {"next_run_at": started + job.interval, "running_on": self.worker_id,
+                      "trigger_requested_at": None, "trigger_requested_by": None}})
+        run = {"id": str(uuid.uuid4()), "job": job.name, "worker": self.worker_id,
+               "triggered_by": triggered_by or "schedule", "started_at": started}
+        await self.db().scheduler_runs.insert_one({**run})  # insert_one adds an ObjectId _id
+
+        start = time.perf_counter()
+        status, error, result = "success", None, None
+        try:
+            result = await asyncio.wait_for(job.run(), job.timeout)
+        except asyncio.CancelledError:
+            status, error = "cancelled", "scheduler lost the lease or shut down"
+            raise
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"exceeded {job.timeout}s"
+        except Exception as e:
+            status, error = "error", str(e)
+            logger.exception(f"Scheduled job {job.name} failed")
+        finally:
+            duration = time.perf_counter() - start
+            JOB_RUNS.inc(job=job.name, status=status)
+            JOB_DURATION.observe(duration, job=job.name)
+
+            finished = {"finished_at": datetime.now(timezone.utc), "status": status, "error": error,
+                        "duration_ms": round(duration * 1000, 1), "result": result}
+            # Record the run and release the job's running_on claim even when cancelled;
+            # shielded so a second cancel (stop() after tick() lost the lease) cannot cut it short
+            await asyncio.shield(asyncio.gather(
+                self.db().scheduler_runs.update_one({"id": run["id"]}, {"$set": finished}),
+                self.db().scheduler_jobs.update_one(
+                    {"_id": job.name}, {"$set": {"running_on": None, "last_run": {**run, **finished}}}),
+            ))
+        return status
+
+    def cancel_running(self):
+        for task in list(self.running.values()):
+            task.cancel()
+
+    async def trigger(self, name: str, requested_by: str):
+        """Ask the leader, whichever worker it is, to run a job on its next tick"""
+        await self.db().scheduler_jobs.update_one(
+            {"_id": name},
+            {"$set": {"trigger_requested_at": datetime.now(timezone.utc), "trigger_requested_by": requested_by}})
+
+    async def status(self) -> dict:
+        lease, jobs = await asyncio.gather(
+            self.db().scheduler_leases.find_one({"_id": LEASE_ID}, {"_id": 0}),
+            self.db().scheduler_jobs.find({"_id": {"$in": list(self.jobs)}}).to_list(None),
+        )
+        return {"worker_id": self.worker_id, "is_leader": self.is_leader, "lease": lease,
+                "jobs": [{"name": job.pop("_id"), **job} for job in jobs]}
+
+    async def loop(self):
+        await self.sync_jobs()
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Scheduler heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def run_forever(self):
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.cancel_running()
+        if self.running:
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+        try:
+            await self.release()
+        except Exception as e:
+            logger.error(f"Failed to release the scheduler lease: {e}")
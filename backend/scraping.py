@@ -0,0 +1,300 @@
+"""
+TrainerHill meta scraping
+Playwright renders the meta page and BeautifulSoup parses the matchup table. Both are
+heavy imports, so server.py loads this module on the first meta request. The scheduler
+stores the rendered page in `meta_snapshots`, and the routes parse that copy while it is fresh.
+"""
+import logging
+import re
+from typing import Optional
+
+from bs4 import BeautifulSoup
+from playwright.async_api import async_playwright
+
+from metrics import track_scrape
+
+logger = logging.getLogger(__name__)
+
+TRAINERHILL_META_URL = "https://www.trainerhill.com/meta?game=PTCG"
+
+async def fetch_meta_html() -> Optional[str]:
+    """Rendered TrainerHill meta page, or None when no Playwright browser is installed"""
+    async with async_playwright() as p:
+        try:
+            browser = await p.chromium.launch(headless=True)
+        except Exception as browser_error:
+            logger.warning(f"Playwright browser launch failed: {browser_error}")
+            return None
+        
+        page = await browser.new_page()
+        
+        try:
+            with track_scrape("trainerhill_meta"):
+                # Navigate to TrainerHill meta page
+                await page.goto(TRAINERHILL_META_URL, wait_until="networkidle", timeout=30000)
+                
+                # Wait for the table to load
+                await page.wait_for_selector("table", timeout=15000)
+                
+                # Get the rendered HTML
+                return await page.content()
+        finally:
+            await browser.close()
+
+async def meta_wizard(deck_name: str, html: Optional[str] = None) -> dict:
+    """Best and worst 3 matchups for a deck, from `html` (a stored snapshot) or a live scrape"""
+    if html is None:
+        html = await fetch_meta_html()
+    if html is None:
+        # Fallback: Return sample data when Playwright browsers not installed
+        logger.warning("Returning sample meta data. Install Playwright browsers for real data.")
+        return {
+            'deck_name': deck_name,
+            'best_matchups': [
+                {'opponent': 'Sample Deck A', 'win_rate': 58.5},
+                {'opponent': 'Sample Deck B', 'win_rate': 55.2},
+                {'opponent': 'Sample Deck C', 'win_rate': 52.8}
+            ],
+            'worst_matchups': [
+                {'opponent': 'Sample Deck X', 'win_rate': 35.4},
+                {'opponent': 'Sample Deck Y', 'win_rate': 38.9},
+                {'opponent': 'Sample Deck Z', 'win_rate': 42.1}
+            ],
+            'source': 'Sample Data (Playwright not available)',
+            'total_matchups': 14,
+            'note': 'Sample data shown. Install Playwright browsers in production for real TrainerHill data.'
+        }
+    
+    # Parse HTML to find matchup data
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Normalize deck name for matching
+    search_name = deck_name.lower().replace(' ex', '').replace('ex', '').strip()
+    
+    matchups = []
+    
+    # Find the matchup table
+    tables = soup.find_all('table')
+    logger.info(f"Found {len(tables)} tables on the page")
+    
+    for table in tables:
+        rows = table.find_all('tr')
+        if len(rows) < 2:
+            continue
+        
+        # Get header row to identify columns (opponent decks)
+        header_row = rows[0]
+        header_cells = header_row.find_all(['th', 'td'])
+        
+        # Extract opponent names from headers (skip first column which is the deck name)
+        opponent_names = []
+        for cell in header_cells[1:]:
+            opponent_text = cell.get_text(strip=True)
+            # Clean up the text
+            opponent_clean = re.sub(r'\s+', ' ', opponent_text).strip()
+            if opponent_clean and opponent_clean != '%=wins+ties3total':
+                opponent_names.append(opponent_clean)
+        
+        logger.info(f"Extracted {len(opponent_names)} opponent names from headers")
+        
+        # Find our deck's row
+        for row in rows[1:]:
+            cells = row.find_all(['td', 'th'])
+            if len(cells) < 2:
+                continue
+            
+            # First cell is the deck name
+            first_cell_text = cells[0].get_text(strip=True).lower()
+            
+            # Check if this is our deck
+            if search_name in first_cell_text or first_cell_text.replace(' ', '') in search_name.replace(' ', ''):
+                logger.info(f"Found deck row for {deck_name}: {first_cell_text}")
+                
+                # Parse matchup data from remaining cells
+                for i, cell in enumerate(cells[1:]):
+                    cell_text = cell.get_text(strip=True)
+                    # Extract percentage (e.g., "65.2%")
+                    percentage_match = re.search(r'(\d+(?:\.\d+)?)\s*%', cell_text)
+                    
+                    if percentage_match and i < len(opponent_names):
+                        win_rate = float(percentage_match.group(1))
+                        opponent = opponent_names[i]
+                        
+                        matchups.append({
+                            'opponent': opponent,
+                            'win_rate': win_rate
+                        })
+                
+                break  # Found our deck, stop searching
+        
+        if matchups:
+            break  # Found matchups, stop searching tables
+    
+    # If no matchups found
+    if not matchups:
+        logger.warning(f"No matchup data found for {deck_name}")
+        return {
+            'deck_name': deck_name,
+            'best_matchups': [{'opponent': 'Deck not found in meta', 'win_rate': 0}],
+            'worst_matchups': [{'opponent': 'Deck not found in meta', 'win_rate': 0}],
+            'source': 'TrainerHill',
+            'total_matchups': 0,
+            'note': f'Deck "{deck_name}" not found in current meta data.'
+        }
+    
+    # Sort matchups by win rate
+    sorted_matchups = sorted(matchups, key=lambda x: x['win_rate'], reverse=True)
+    
+    # Get best 3 and worst 3
+    best_3 = sorted_matchups[:3] if len(sorted_matchups) >= 3 else sorted_matchups
+    worst_3 = sorted_matchups[-3:] if len(sorted_matchups) >= 3 else sorted_matchups
+    worst_3.reverse()  # Show worst first
+    
+    return {
+        'deck_name': deck_name,
+        'best_matchups': best_3,
+        'worst_matchups': worst_3,
+        'source': 'TrainerHill',
+        'total_matchups': len(matchups)
+    }
+
+async def meta_brake(html: Optional[str] = None) -> dict:
+    """Top 2 meta-breaking decks using weighted scoring, from `html` or a live scrape"""
+    logger.info("Starting Meta Brake calculation...")
+    if html is None:
+        html = await fetch_meta_html()
+    if html is None:
+        # Fallback: Return sample meta brake data when Playwright browsers not installed
+        logger.warning("Returning sample meta brake data. Install Playwright browsers for real data.")
+        return {
+            'top_decks': [
+                {'deck_name': 'Sample Meta Breaker 1', 'overall_wr': 54.5, 'weighted_score': 54.2},
+                {'deck_name': 'Sample Meta Breaker 2', 'overall_wr': 52.8, 'weighted_score': 52.5}
+            ],
+            'source': 'Sample Data (Playwright not available)',
+            'total_analyzed': 14,
+            'note': 'Sample data shown. Install Playwright browsers in production for real TrainerHill analysis.'
+        }
+    
+    # Parse HTML to extract full matchup matrix
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Find the matchup table
+    tables = soup.find_all('table')
+    
+    deck_data = {}  # {deck_name: {overall_wr: float, matchups: {opponent: win_rate}}}
+    
+    for table in tables:
+        rows = table.find_all('tr')
+        if len(rows) < 2:
+            continue
+        
+        # Get header row for opponent names
+        header_row = rows[0]
+        header_cells = header_row.find_all(['th', 'td'])
+        
+        # Extract opponent names (skip first column)
+        opponent_names = []
+        for cell in header_cells[1:]:
+            opponent_text = cell.get_text(strip=True)
+            opponent_clean = re.sub(r'\s+', ' ', opponent_text).strip()
+            if opponent_clean and opponent_clean != '%=wins+ties3total':
+                opponent_names.append(opponent_clean)
+        
+        if len(opponent_names) == 0:
+            continue
+        
+        logger.info(f"Found {len(opponent_names)} decks in meta")
+        
+        # Parse each deck's row
+        for row in rows[1:]:
+            cells = row.find_all(['td', 'th'])
+            if len(cells) < 2:
+                continue
+            
+            # First cell is the deck name
+            deck_name = cells[0].get_text(strip=True)
+            if not deck_name:
+                continue
+            
+            # Parse matchup data
+            matchups = {}
+            win_rates = []
+            
+            for i, cell in enumerate(cells[1:]):
+                cell_text = cell.get_text(strip=True)
+                # Extract percentage
+                percentage_match = re.search(r'(\d+(?:\.\d+)?)\s*%', cell_text)
+                
+                if percentage_match and i < len(opponent_names):
+                    win_rate = float(percentage_match.group(1))
+                    opponent = opponent_names[i]
+                    matchups[opponent] = win_rate
+                    win_rates.append(win_rate)
+            
+            if len(matchups) > 0:
+                # Calculate overall win rate for this deck
+                overall_wr = sum(win_rates) / len(win_rates)
+                deck_data[deck_name] = {
+                    'overall_wr': overall_wr,
+                    'matchups': matchups
+                }
+        
+        if len(deck_data) > 0:
+            break  # Found data, stop searching
+    
+    if len(deck_data) < 2:
+        logger.warning("Not enough deck data found")
+        return {
+            'top_decks': [],
+            'note': 'Insufficient data to calculate meta breakers'
+        }
+    
+    logger.info(f"Analyzing {len(deck_data)} decks for meta breakers...")
+    
+    # Calculate weighted scores
+    # Score = overall_wr * 0.4 + weighted_matchup_score * 0.6
+    # weighted_matchup_score = Σ(win_rate_vs_opponent * opponent_overall_wr) / Σ(opponent_overall_wr)
+    
+    deck_scores = []
+    
+    for deck_name, data in deck_data.items():
+        overall_wr = data['overall_wr']
+        matchups = data['matchups']
+        
+        # Calculate weighted matchup score
+        weighted_sum = 0
+        weight_total = 0
+        
+        for opponent, win_rate_vs_opponent in matchups.items():
+            if opponent in deck_data:
+                opponent_strength = deck_data[opponent]['overall_wr']
+                # Weight this matchup by opponent's strength
+                weighted_sum += (win_rate_vs_opponent / 100.0) * opponent_strength
+                weight_total += opponent_strength
+        
+        if weight_total > 0:
+            weighted_matchup_score = (weighted_sum / weight_total) * 100
+        else:
+            weighted_matchup_score = overall_wr
+        
+        # Final score: balance overall strength with ability to beat strong decks
+        final_score = (overall_wr * 0.4) + (weighted_matchup_score * 0.6)
+        
+        deck_scores.append({
+            'deck_name': deck_name,
+            'overall_wr': round(overall_wr, 1),
+            'weighted_score': round(final_score, 2)
+        })
+    
+    # Sort by weighted score and get top 2
+    deck_scores.sort(key=lambda x: x['weighted_score'], reverse=True)
+    top_2 = deck_scores[:2]
+    
+    logger.info(f"Top 2 meta breakers: {[d['deck_name'] for d in top_2]}")
+    
+    return {
+        'top_decks': top_2,
+        'source': 'TrainerHill',
+        'total_analyzed': len(deck_data)
+    }
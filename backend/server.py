@@ -1,27 +1,81 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Response, Cookie, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Response, Cookie, Request, Query
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import anyio
+import asyncio
 import os
+import time
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
+import random
+import json
+import orjson
+import hashlib
+import re
+import csv
+import codecs
+import io
+from cachetools import TTLCache
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
 from datetime import datetime, timezone, timedelta
 import httpx
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from archetypes import ArchetypeIndex, canonicalize, ensure_archetypes
+from jobqueue import JOB_FIELDS, JobContext, JobQueue, PermanentError
+from metrics import MetricsMiddleware, MongoCommandMetrics, instrumented_client, render_metrics
+from profiling import MAX_SAMPLE_SECONDS, ProfilingMiddleware, profile_store, run_sampler
+from ratelimit import DEFAULT_CLASSES, DEFAULT_CRUD, DEFAULT_JOB_CLASSES, MemoryBuckets, MongoBuckets, RateLimiter, RateLimitMiddleware
+from scheduler import Scheduler
+from subsystems import LazyDatabase, Subsystems
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Everything not needed to import the app is built on first use and closed at shutdown
+subsystems = Subsystems()
+
 # MongoDB connection
+# Dates are stored as native BSON dates; tz_aware returns them as UTC-aware datetimes
+# The client (SRV lookup, monitor threads) is created by the first query, not at import
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+mongo_client = subsystems.register(
+    "mongo", lambda: AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()]),
+    close=lambda client: client.close())
+db = LazyDatabase(mongo_client, os.environ['DB_NAME'])
+
+# Playwright + BeautifulSoup, only needed by the TrainerHill meta routes
+subsystems.module("scraping")
+
+# Opening-hand simulation and seeded hands (numpy), only needed by the simulator routes and jobs
+subsystems.module("simulation")
 
-# Create the main app without a prefix
-app = FastAPI()
+# numpy draw odds for the deck page consistency table
+subsystems.module("probability")
+
+# Count-tweak search for the optimize route, scored across a process pool (0 workers: threads)
+subsystems.module("optimizer")
+OPTIMIZE_WORKERS = int(os.environ.get('OPTIMIZE_WORKERS', str(min(os.cpu_count() or 1, 4))))
+subsystems.register(
+    "process_pool",
+    # spawn, not fork: forking a process that runs an event loop and Motor's threads is unsafe
+    lambda: ProcessPoolExecutor(OPTIMIZE_WORKERS, mp_context=multiprocessing.get_context("spawn")),
+    close=lambda pool: pool.shutdown(wait=False, cancel_futures=True))
+
+# One pooled client for outbound lookups (LimitlessTCG, Pokemon TCG API) instead of a connection per request
+subsystems.register("http_client", lambda: instrumented_client(timeout=10.0), close=lambda client: client.aclose())
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -52,6 +106,7 @@ class Deck(BaseModel):
     card_data: Optional[dict] = None  # Cached card data from Pokemon TCG API
     test_results: Optional[dict] = None  # Hand simulator test results
     stats: Optional[dict] = None  # Basic stats for dashboard (calculated on-demand)
+    featured_image: Optional[str] = None  # Dashboard thumbnail picked from card_data on write
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -62,6 +117,8 @@ class Match(BaseModel):
     user_id: str
     result: str  # "win" or "loss"
     opponent_deck_name: str
+    opponent_archetype_id: Optional[str] = None  # Canonical archetype for opponent_deck_name
+    opponent_archetype: Optional[str] = None  # Canonical archetype name
     went_first: bool
     bad_game: bool = False
     mulligan_count: int = 0
@@ -106,6 +163,31 @@ class MatchUpdate(BaseModel):
     mulligan_count: Optional[int] = None
     notes: Optional[str] = None
 
+class MatchImportRow(MatchCreate):
+    match_date: Optional[datetime] = None  # Back-filled games keep their original date
+
+class ImportRowError(BaseModel):
+    row: int  # 1-based data row (CSV header not counted)
+    error: str
+
+class MatchImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool = False
+
+class WeeklyStats(BaseModel):
+    week_start: datetime
+    matches: int
+    wins: int
+    win_rate: float
+
+class FormPoint(BaseModel):
+    match_id: str
+    match_date: datetime
+    result: str
+    rolling_win_rate: float  # Win rate over the last `rolling` matches up to this one
+
 class DeckStats(BaseModel):
     total_matches: int
     wins: int
@@ -119,6 +201,355 @@ class DeckStats(BaseModel):
     avg_mulligans: float
     total_mulligans: int
     opponent_stats: dict
+    current_streak: int = 0  # Positive = wins in a row, negative = losses in a row
+    longest_win_streak: int = 0
+    longest_loss_streak: int = 0
+    form: List[FormPoint] = []
+    weekly: List[WeeklyStats] = []
+
+class DeckBundle(BaseModel):
+    deck: Deck
+    matches: List[Match]
+    stats: DeckStats
+
+class MatchupRecord(BaseModel):
+    wins: int
+    losses: int
+    total: int
+    win_rate: float
+
+class DeckAnalytics(BaseModel):
+    deck_id: str
+    deck_name: Optional[str] = None
+    record: MatchupRecord
+    went_first: MatchupRecord
+    went_second: MatchupRecord
+    mulligan_rate: float  # % of games with at least one mulligan
+    avg_mulligans: float
+    opponents: dict  # opponent name -> MatchupRecord
+
+class UserAnalytics(BaseModel):
+    record: MatchupRecord
+    went_first: MatchupRecord
+    went_second: MatchupRecord
+    mulligan_rate: float
+    avg_mulligans: float
+    decks: List[DeckAnalytics]
+    opponents: dict  # opponent name -> MatchupRecord across all decks
+
+# HTTP caching policies
+# Card documents are keyed by set code + number but are repaired in place (image
+# backfills, re-seeding, fallback cards later resolved), so browsers keep them for an
+# hour and then revalidate against the content ETag. Counts drift slowly as the DB is
+# populated. Per-user data must always be revalidated, but the ETag makes that a cheap 304.
+CARD_CACHE_CONTROL = "public, max-age=3600"
+CARD_COUNT_CACHE_CONTROL = "public, max-age=300"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from arbitrary version parts"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def content_etag(payload) -> str:
+    """Build a strong ETag from the canonical JSON encoding of a payload"""
+    return make_etag(json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")))
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header against an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def cached_json_response(request: Request, etag: str, cache_control: str, build_payload) -> Response:
+    """Return 304 when the client already has this version, otherwise the JSON body.
+
+    build_payload is only called on a miss, so revalidated requests skip serialization.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content=jsonable_encoder(build_payload()), headers=headers)
+
+# Deck fields the dashboard needs; everything except the card_data blob
+DECK_SUMMARY_FIELDS = ["id", "user_id", "deck_name", "deck_list", "featured_image",
+                       "test_results", "stats", "created_at", "updated_at"]
+
+# Per-hand card counts are stored as fixed-size histograms: bucket i = hands holding i cards
+HISTOGRAM_CATEGORIES = ("pokemon", "trainer", "energy", "basic_pokemon")
+HISTOGRAM_BUCKETS = 8  # 0..7 cards of a kind in a 7-card hand
+PERCENTILES = (10, 25, 50, 75, 90)
+
+def empty_histograms() -> dict:
+    return {category: [0] * HISTOGRAM_BUCKETS for category in HISTOGRAM_CATEGORIES}
+
+def histogram_stats(histogram: List[int]) -> dict:
+    """Mean, variance, percentiles and bucket shares of a per-hand count histogram"""
+    hands = sum(histogram)
+    if not hands:
+        return {"histogram": histogram, "hands": 0}
+    mean = sum(i * n for i, n in enumerate(histogram)) / hands
+    variance = sum(n * (i - mean) ** 2 for i, n in enumerate(histogram)) / hands
+    percentiles = {}
+    for p in PERCENTILES:
+        # Smallest count that at least p% of hands do not exceed
+        cumulative = 0
+        for i, n in enumerate(histogram):
+            cumulative += n
+            if cumulative * 100 >= p * hands:
+                percentiles[f"p{p}"] = i
+                break
+    return {
+        "histogram": histogram,
+        "hands": hands,
+        "mean": round(mean, 2),
+        "variance": round(variance, 3),
+        "std": round(variance ** 0.5, 3),
+        "percentiles": percentiles,
+        "shares": [round(n / hands * 100, 1) for n in histogram],
+    }
+
+def derive_test_results(results: Optional[dict]) -> Optional[dict]:
+    """Add averages and percentages to stored raw counters, and statistics to histograms
+
+    Histograms only cover hands saved since they were introduced, so each reports its
+    own hand count.
+    """
+    if not results or "total_pokemon" not in results:
+        return results  # Nothing saved yet, or a legacy averaged document
+    hands = results.get("total_hands") or 0
+
+    def average(total):
+        return round(total / hands, 1) if hands else 0
+
+    def percentage(count):
+        return round(count / hands * 100, 1) if hands else 0
+
+    derived = {
+        **results,
+        "mulligan_percentage": percentage(results.get("mulligan_count", 0)),
+        "avg_pokemon": average(results.get("total_pokemon", 0)),
+        "avg_trainer": average(results.get("total_trainer", 0)),
+        "avg_energy": average(results.get("total_energy", 0)),
+        "avg_basic_pokemon": average(results.get("total_basic_pokemon", 0)),
+        "unplayable_percentage": percentage(results.get("unplayable_hands", 0)),
+    }
+    if results.get("histograms"):
+        derived["distributions"] = {category: histogram_stats(histogram)
+                                    for category, histogram in results["histograms"].items()}
+    return derived
+
+def parse_deck_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Resolve the ?fields= query parameter into a list of Deck fields (None = all)"""
+    if not fields:
+        return None
+    if fields == "summary":
+        return DECK_SUMMARY_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip() in Deck.model_fields]
+    # id is always needed to attach stats
+    return ["id"] + [f for f in requested if f != "id"]
+
+def pick_featured_image(deck_name: str, card_data: Optional[dict]) -> Optional[str]:
+    """Pick the dashboard image: the Pokemon named in the deck title, else the first Pokemon"""
+    if not card_data:
+        return None
+    deck_name_lower = deck_name.lower()
+    pokemon = [c for c in card_data.values() if isinstance(c, dict) and c.get("isPokemon") and c.get("image")]
+    for card in pokemon:
+        if (card.get("name") or "").lower().split(" ")[0] in deck_name_lower:
+            return card["image"]
+    return pokemon[0]["image"] if pokemon else None
+
+# Card reference helpers
+# Decks store only card keys ("SVI-78"); card details live once in pokemon_cards
+# and are joined back into the card_data shape the frontend expects at read time.
+DECK_LINE_PATTERN = re.compile(r'^(\d+)\s+(.+?)\s+([A-Z]{2,5})\s+(\d+)$', re.IGNORECASE)
+SECTION_PATTERNS = [
+    (re.compile(r'^Pok[eé]mon:', re.IGNORECASE), 'pokemon'),
+    (re.compile(r'^Trainer:', re.IGNORECASE), 'trainer'),
+    (re.compile(r'^Energy:', re.IGNORECASE), 'energy'),
+]
+
+# card_id -> card in frontend shape. Stored cards are repaired in place by scripts and other
+# workers, so an entry may be up to the TTL out of date, the same hour browsers keep a card.
+card_cache = TTLCache(maxsize=5000, ttl=3600)
+
+def parse_deck_list(deck_list: str) -> List[dict]:
+    """Parse a PTCGL deck list into entries (same rules as the frontend parser)"""
+    entries = []
+    section = 'unknown'
+    for line in deck_list.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        header = next((name for pattern, name in SECTION_PATTERNS if pattern.match(line)), None)
+        if header:
+            section = header
+            continue
+        match = DECK_LINE_PATTERN.match(line)
+        if match:
+            set_code = match.group(3).upper()
+            card_number = match.group(4)
+            entries.append({
+                'count': int(match.group(1)),
+                'name': match.group(2).strip(),
+                'set_code': set_code,
+                'card_number': card_number,
+                'cache_key': f"{set_code}-{card_number}",
+                'section': section,
+            })
+    return entries
+
+def card_id_for_key(cache_key: str) -> str:
+    """"MEW-123" -> "mew-123" (the pokemon_cards card_id)"""
+    set_code, _, card_number = cache_key.partition('-')
+    return f"{set_code.lower()}-{card_number}"
+
+def card_doc_from_client(cache_key: str, card_data: dict) -> Optional[dict]:
+    """Convert a frontend card_data entry into a pokemon_cards document"""
+    parts = cache_key.split('-')
+    if len(parts) < 2:
+        return None
+    set_code = parts[0].upper()
+    card_number = '-'.join(parts[1:])  # Handle card numbers with dashes
+    return {
+        "card_id": f"{set_code.lower()}-{card_number}",
+        "set_code": set_code,
+        "card_number": card_number,
+        "name": card_data.get("name"),
+        "supertype": card_data.get("supertype"),
+        "subtypes": card_data.get("subtypes", []),
+        "hp": card_data.get("hp"),
+        "types": card_data.get("types", []),
+        "abilities": card_data.get("abilities", []),
+        "attacks": card_data.get("attacks", []),
+        "weaknesses": card_data.get("weaknesses", []),
+        "resistances": card_data.get("resistances", []),
+        "retreat_cost": card_data.get("retreatCost", []),
+        "rules": card_data.get("rules", []),
+        "image_small": card_data.get("image"),
+        "created_at": datetime.now(timezone.utc)
+    }
+
+def client_card_from_doc(card: dict) -> dict:
+    """Convert a pokemon_cards document into the frontend card_data shape"""
+    subtypes = card.get("subtypes") or []
+    return {
+        "name": card.get("name"),
+        "image": card.get("image_small"),
+        "supertype": card.get("supertype"),
+        "subtypes": subtypes,
+        "hp": card.get("hp"),
+        "types": card.get("types") or [],
+        "abilities": card.get("abilities") or [],
+        "attacks": card.get("attacks") or [],
+        "weaknesses": card.get("weaknesses") or [],
+        "resistances": card.get("resistances") or [],
+        "retreatCost": card.get("retreat_cost") or [],
+        "rules": card.get("rules") or [],
+        "isBasic": card.get("supertype") == "Pokémon" and "Basic" in subtypes,
+    }
+
+async def store_client_cards(card_data: dict) -> int:
+    """Insert cards we have never seen into pokemon_cards; existing cards are left alone"""
+    operations = []
+    for cache_key, card in card_data.items():
+        card_doc = card_doc_from_client(cache_key, card or {})
+        if card_doc:
+            operations.append(UpdateOne({"card_id": card_doc["card_id"]}, {"$setOnInsert": card_doc}, upsert=True))
+    if not operations:
+        return 0
+    result = await db.pokemon_cards.bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+async def load_cards(cache_keys) -> dict:
+    """Batch-load cards by cache key, serving repeats from the in-process cache"""
+    cards = {}
+    missing = {}
+    for cache_key in cache_keys:
+        card_id = card_id_for_key(cache_key)
+        if card_id in card_cache:
+            cards[cache_key] = card_cache[card_id]
+        else:
+            missing[card_id] = cache_key
+    if missing:
+        async for doc in db.pokemon_cards.find({"card_id": {"$in": list(missing)}}, {"_id": 0, "created_at": 0}):
+            card = client_card_from_doc(doc)
+            card_cache[doc["card_id"]] = card
+            cards[missing[doc["card_id"]]] = card
+    return cards
+
+def deck_card(card: dict, section: Optional[str]) -> dict:
+    """A card in the card_data shape of one deck"""
+    # Deck list sections are more reliable than supertype for the simulator
+    return {
+        **card,
+        "isPokemon": section == 'pokemon' if section else card["supertype"] == "Pokémon",
+        "isTrainer": section == 'trainer' if section else card["supertype"] == "Trainer",
+        "isEnergy": section == 'energy' if section else card["supertype"] == "Energy",
+    }
+
+async def attach_card_data(decks: List[dict]):
+    """Fill card_data for normalized decks from pokemon_cards in a single query
+
+    Legacy decks that still embed card_data are left untouched.
+    """
+    normalized = [d for d in decks if d.get("card_keys") is not None]
+    cards = await load_cards({key for d in normalized for key in d["card_keys"]})
+    for deck in normalized:
+        sections = {e['cache_key']: e['section'] for e in parse_deck_list(deck.get("deck_list") or "")}
+        deck["card_data"] = {key: deck_card(cards[key], sections.get(key)) for key in deck["card_keys"] if key in cards}
+        deck.pop("card_keys", None)
+
+def card_keys_for(deck_list: str, card_data: Optional[dict]) -> List[str]:
+    """Keys a deck references: the resolved card_data keys, else what the list names"""
+    if card_data:
+        return list(card_data.keys())
+    return list(dict.fromkeys(e['cache_key'] for e in parse_deck_list(deck_list)))
+
+# Alias/trigram index over the archetypes collection, loaded at startup
+archetype_index = ArchetypeIndex()
+
+async def opponent_archetype_fields(opponent_deck_name: str) -> dict:
+    """Canonical archetype fields stored alongside the raw opponent name"""
+    archetype = await canonicalize(db, archetype_index, opponent_deck_name)
+    if not archetype:
+        return {"opponent_archetype_id": None, "opponent_archetype": None}
+    return {"opponent_archetype_id": archetype["id"], "opponent_archetype": archetype["name"]}
+
+# user_id -> UserAnalytics; dropped whenever one of the user's matches changes.
+# Per worker: a match written through another worker only shows up here once the entry
+# expires, so the TTL is kept to the staleness a dashboard can live with.
+analytics_cache = TTLCache(maxsize=1024, ttl=30)
+
+def invalidate_user_analytics(user_id: str):
+    analytics_cache.pop(user_id, None)
+
+# user_id -> ids of decks the user is known to own; dropped on deck create/delete.
+# Per worker, so a deck deleted through another worker can still pass a cached check here
+# for up to the TTL: only reads trust it, writes pass fresh=True.
+owned_decks_cache = TTLCache(maxsize=4096, ttl=60)
+
+async def user_owns_deck(user_id: str, deck_id: str, fresh: bool = False) -> bool:
+    """Ownership check that never loads the deck document; fresh=True skips the cache"""
+    owned = owned_decks_cache.get(user_id)
+    if not fresh and owned is not None and deck_id in owned:
+        return True
+    # Covered by the (user_id, id) index: answered from the index alone
+    if await db.decks.find_one({"user_id": user_id, "id": deck_id}, {"_id": 0, "id": 1}) is None:
+        return False
+    owned_decks_cache.setdefault(user_id, set()).add(deck_id)
+    return True
+
+def invalidate_owned_decks(user_id: str):
+    owned_decks_cache.pop(user_id, None)
+
+async def require_deck_owner(user_id: str, deck_id: str, fresh: bool = False):
+    if not await user_owns_deck(user_id, deck_id, fresh):
+        raise HTTPException(status_code=404, detail="Deck not found")
 
 # Helper function to get user from session
 async def get_current_user(request: Request) -> Optional[User]:
@@ -137,7 +568,7 @@ async def get_current_user(request: Request) -> Optional[User]:
     # Find session in database
     session = await db.sessions.find_one({
         "session_token": session_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
     }, {"_id": 0})
     
     if not session:
@@ -148,12 +579,21 @@ async def get_current_user(request: Request) -> Optional[User]:
     if not user:
         return None
     
-    # Convert datetime strings back to datetime objects
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
+    # From now on the rate limiter gives this session its own bucket
+    rate_limiter.remember_session(session_token)
     return User(**user)
 
+# Emails allowed to use the /api/admin endpoints
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
+
+async def require_admin(request: Request) -> User:
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
 # Auth Routes
 @api_router.post("/auth/session", response_model=SessionResponse)
 async def create_session(session_req: SessionRequest, response: Response):
@@ -161,7 +601,7 @@ async def create_session(session_req: SessionRequest, response: Response):
     try:
         # Call Emergent auth API to get user data
         auth_service_url = os.environ.get('AUTH_SERVICE_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data')
-        async with httpx.AsyncClient() as client:
+        async with instrumented_client() as client:
             auth_response = await client.get(
                 auth_service_url,
                 headers={"X-Session-ID": session_req.session_id},
@@ -181,12 +621,9 @@ async def create_session(session_req: SessionRequest, response: Response):
                 picture=user_data["picture"]
             )
             user_doc = new_user.model_dump()
-            user_doc['created_at'] = user_doc['created_at'].isoformat()
             await db.users.insert_one(user_doc)
             user = new_user
         else:
-            if isinstance(existing_user.get('created_at'), str):
-                existing_user['created_at'] = datetime.fromisoformat(existing_user['created_at'])
             user = User(**existing_user)
         
         # Create session
@@ -200,8 +637,6 @@ async def create_session(session_req: SessionRequest, response: Response):
         )
         
         session_doc = new_session.model_dump()
-        session_doc['expires_at'] = session_doc['expires_at'].isoformat()
-        session_doc['created_at'] = session_doc['created_at'].isoformat()
         await db.sessions.insert_one(session_doc)
         
         # Set httpOnly cookie
@@ -249,6 +684,7 @@ async def logout(request: Request, response: Response):
     if session_token:
         # Delete session from database
         await db.sessions.delete_one({"session_token": session_token})
+        rate_limiter.forget_session(session_token)
     
     # Clear cookie
     response.delete_cookie(key="session_token", path="/")
@@ -267,32 +703,66 @@ async def create_deck(deck_data: DeckCreate, request: Request):
         user_id=user.id,
         deck_name=deck_data.deck_name,
         deck_list=deck_data.deck_list,
-        card_data=deck_data.card_data
+        card_data=deck_data.card_data,
+        featured_image=pick_featured_image(deck_data.deck_name, deck_data.card_data)
     )
     
-    deck_doc = new_deck.model_dump()
-    deck_doc['created_at'] = deck_doc['created_at'].isoformat()
-    deck_doc['updated_at'] = deck_doc['updated_at'].isoformat()
+    # Card details go to the shared pokemon_cards collection; the deck keeps only keys
+    if deck_data.card_data:
+        await store_client_cards(deck_data.card_data)
+    
+    deck_doc = new_deck.model_dump(exclude={"card_data"})
+    deck_doc['card_keys'] = card_keys_for(deck_data.deck_list, deck_data.card_data)
     await db.decks.insert_one(deck_doc)
+    invalidate_owned_decks(user.id)
     
     return new_deck
 
 @api_router.get("/decks", response_model=List[Deck])
-async def get_decks(request: Request):
-    """Get all decks for current user with stats"""
+async def get_decks(request: Request, fields: Optional[str] = None):
+    """Get all decks for current user with stats
+
+    ?fields=summary drops card_data (the dashboard only needs featured_image);
+    ?fields=a,b,c returns just those Deck fields.
+    """
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    decks = await db.decks.find({"user_id": user.id}, {"_id": 0}).to_list(1000)
+    selected_fields = parse_deck_fields(fields)
+    wants_card_data = selected_fields is None or "card_data" in selected_fields
+    projection = {"_id": 0}
+    if selected_fields:
+        projection.update({f: 1 for f in selected_fields})
+        if wants_card_data:
+            # card_data is rebuilt from the stored keys and the list's sections
+            projection.update({"card_keys": 1, "deck_list": 1})
     
-    # Convert datetime strings and add stats for each deck
+    decks = await db.decks.find({"user_id": user.id}, projection).to_list(1000)
+    for deck in decks:
+        if deck.get("test_results"):
+            deck["test_results"] = derive_test_results(deck["test_results"])
+    
+    if wants_card_data:
+        await attach_card_data(decks)
+        if selected_fields and "deck_list" not in selected_fields:
+            for deck in decks:
+                deck.pop("deck_list", None)
+    
+    # Decks created before featured_image existed: derive it once from card_data and store it
+    if selected_fields and "featured_image" in selected_fields:
+        missing = {d["id"]: d for d in decks if "featured_image" not in d}
+        if missing:
+            legacy = await db.decks.find(
+                {"id": {"$in": list(missing)}}, {"_id": 0, "id": 1, "deck_name": 1, "card_data": 1}
+            ).to_list(1000)
+            for doc in legacy:
+                image = pick_featured_image(doc.get("deck_name", ""), doc.get("card_data"))
+                missing[doc["id"]]["featured_image"] = image
+                await db.decks.update_one({"id": doc["id"]}, {"$set": {"featured_image": image}})
+    
+    # Add stats for each deck
     for deck in decks:
-        if isinstance(deck.get('created_at'), str):
-            deck['created_at'] = datetime.fromisoformat(deck['created_at'])
-        if isinstance(deck.get('updated_at'), str):
-            deck['updated_at'] = datetime.fromisoformat(deck['updated_at'])
-        
         # Calculate basic stats for dashboard display
         matches = await db.matches.find({"deck_id": deck["id"]}, {"_id": 0}).to_list(1000)
         total_matches = len(matches)
@@ -316,7 +786,8 @@ async def get_decks(request: Request):
                 'win_rate': 0
             }
     
-    return decks
+    # Documents are already in response shape; skip per-request response_model validation
+    return ORJSONResponse(content=decks)
 
 @api_router.get("/decks/{deck_id}", response_model=Deck)
 async def get_deck(deck_id: str, request: Request):
@@ -329,12 +800,13 @@ async def get_deck(deck_id: str, request: Request):
     if not deck:
         raise HTTPException(status_code=404, detail="Deck not found")
     
-    if isinstance(deck.get('created_at'), str):
-        deck['created_at'] = datetime.fromisoformat(deck['created_at'])
-    if isinstance(deck.get('updated_at'), str):
-        deck['updated_at'] = datetime.fromisoformat(deck['updated_at'])
+    # card_data is rebuilt from the shared pokemon_cards collection, which changes without
+    # touching the deck, so the ETag hashes the body itself (cards come from card_cache)
+    await attach_card_data([deck])
+    deck["test_results"] = derive_test_results(deck.get("test_results"))
+    body = Deck(**deck)
     
-    return Deck(**deck)
+    return cached_json_response(request, content_etag(body), PRIVATE_CACHE_CONTROL, lambda: body)
 
 @api_router.put("/decks/{deck_id}", response_model=Deck)
 async def update_deck(deck_id: str, deck_update: DeckUpdate, request: Request):
@@ -343,28 +815,61 @@ async def update_deck(deck_id: str, deck_update: DeckUpdate, request: Request):
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Check if deck exists and belongs to user
-    existing_deck = await db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0})
-    if not existing_deck:
-        raise HTTPException(status_code=404, detail="Deck not found")
-    
     # Prepare update data
     update_data = {k: v for k, v in deck_update.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
+    owned = {"id": deck_id, "user_id": user.id}
+    
+    update_ops = {}
+    if deck_update.card_data is not None:
+        # Store card details once in pokemon_cards and keep only the keys on the deck
+        await store_client_cards(deck_update.card_data)
+        update_data.pop('card_data')
+        update_ops['$unset'] = {'card_data': ""}
+        if deck_update.deck_name is not None:
+            update_data['featured_image'] = pick_featured_image(deck_update.deck_name, deck_update.card_data)
+        if deck_update.card_data or deck_update.deck_list is not None:
+            update_data['card_keys'] = card_keys_for(deck_update.deck_list or "", deck_update.card_data)
+        else:
+            # An empty card_data falls back to the keys the stored list names
+            stored = await db.decks.find_one(owned, {"_id": 0, "deck_list": 1})
+            if not stored:
+                raise HTTPException(status_code=404, detail="Deck not found")
+            update_data['card_keys'] = card_keys_for(stored.get('deck_list', ''), None)
     
     # If deck_list is being updated, reset test_results
     # (user needs to re-run hand simulator with new deck)
     if deck_update.deck_list is not None:
         update_data['test_results'] = None
     
-    await db.decks.update_one({"id": deck_id}, {"$set": update_data})
+    updated_deck = None
+    if deck_update.card_data is None and deck_update.deck_list is not None:
+        # Normalized decks get their card_keys from the new list; legacy decks that still
+        # embed card_data keep resolving cards from it
+        updated_deck = await db.decks.find_one_and_update(
+            {**owned, "card_keys": {"$exists": True}},
+            {"$set": {**update_data, 'card_keys': card_keys_for(deck_update.deck_list, None)}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+    if updated_deck is None:
+        updated_deck = await db.decks.find_one_and_update(
+            owned, {"$set": update_data, **update_ops}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+    if not updated_deck:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    
+    if deck_update.card_data is not None and deck_update.deck_name is None:
+        # The thumbnail prefers the Pokemon named in the deck title, known only now
+        image = pick_featured_image(updated_deck.get('deck_name', ''), deck_update.card_data)
+        if image != updated_deck.get('featured_image'):
+            await db.decks.update_one(owned, {"$set": {"featured_image": image}})
+            updated_deck['featured_image'] = image
+    if deck_update.deck_name is not None:
+        invalidate_user_analytics(user.id)  # analytics carry deck names
     
-    # Get updated deck
-    updated_deck = await db.decks.find_one({"id": deck_id}, {"_id": 0})
-    if isinstance(updated_deck.get('created_at'), str):
-        updated_deck['created_at'] = datetime.fromisoformat(updated_deck['created_at'])
-    if isinstance(updated_deck.get('updated_at'), str):
-        updated_deck['updated_at'] = datetime.fromisoformat(updated_deck['updated_at'])
+    await attach_card_data([updated_deck])
+    updated_deck["test_results"] = derive_test_results(updated_deck.get("test_results"))
     
     return Deck(**updated_deck)
 
@@ -378,9 +883,11 @@ async def delete_deck(deck_id: str, request: Request):
     result = await db.decks.delete_one({"id": deck_id, "user_id": user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Deck not found")
+    invalidate_owned_decks(user.id)
     
     # Also delete all matches for this deck
     await db.matches.delete_many({"deck_id": deck_id})
+    invalidate_user_analytics(user.id)
     
     return {"message": "Deck deleted successfully"}
 
@@ -392,16 +899,15 @@ async def create_match(match_data: MatchCreate, request: Request):
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Verify deck belongs to user
-    deck = await db.decks.find_one({"id": match_data.deck_id, "user_id": user.id}, {"_id": 0})
-    if not deck:
-        raise HTTPException(status_code=404, detail="Deck not found")
+    # A write: don't attach a match to a deck another worker has deleted
+    await require_deck_owner(user.id, match_data.deck_id, fresh=True)
     
     new_match = Match(
         deck_id=match_data.deck_id,
         user_id=user.id,
         result=match_data.result,
         opponent_deck_name=match_data.opponent_deck_name,
+        **(await opponent_archetype_fields(match_data.opponent_deck_name)),
         went_first=match_data.went_first,
         bad_game=match_data.bad_game,
         mulligan_count=match_data.mulligan_count,
@@ -409,12 +915,14 @@ async def create_match(match_data: MatchCreate, request: Request):
     )
     
     match_doc = new_match.model_dump()
-    match_doc['match_date'] = match_doc['match_date'].isoformat()
-    match_doc['created_at'] = match_doc['created_at'].isoformat()
     await db.matches.insert_one(match_doc)
+    invalidate_user_analytics(user.id)
     
     return new_match
 
+# Most matches a deck's match list returns, newest first
+MATCH_LIST_LIMIT = 1000
+
 @api_router.get("/matches/{deck_id}", response_model=List[Match])
 async def get_matches(deck_id: str, request: Request):
     """Get all matches for a deck"""
@@ -422,19 +930,10 @@ async def get_matches(deck_id: str, request: Request):
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Verify deck belongs to user
-    deck = await db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0})
-    if not deck:
-        raise HTTPException(status_code=404, detail="Deck not found")
+    await require_deck_owner(user.id, deck_id)
     
-    matches = await db.matches.find({"deck_id": deck_id}, {"_id": 0}).sort("match_date", -1).to_list(1000)
-    
-    # Convert datetime strings back to datetime objects
-    for match in matches:
-        if isinstance(match.get('match_date'), str):
-            match['match_date'] = datetime.fromisoformat(match['match_date'])
-        if isinstance(match.get('created_at'), str):
-            match['created_at'] = datetime.fromisoformat(match['created_at'])
+    cursor = db.matches.find({"deck_id": deck_id}, {"_id": 0}).sort("match_date", -1).limit(MATCH_LIST_LIMIT)
+    matches = await cursor.to_list(None)
     
     return matches
 
@@ -445,25 +944,192 @@ async def update_match(match_id: str, match_update: MatchUpdate, request: Reques
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Check if match exists and belongs to user
-    existing_match = await db.matches.find_one({"id": match_id, "user_id": user.id}, {"_id": 0})
-    if not existing_match:
-        raise HTTPException(status_code=404, detail="Match not found")
-    
     # Prepare update data
     update_data = {k: v for k, v in match_update.model_dump().items() if v is not None}
+    if match_update.opponent_deck_name is not None:
+        update_data.update(await opponent_archetype_fields(match_update.opponent_deck_name))
     
-    await db.matches.update_one({"id": match_id}, {"$set": update_data})
-    
-    # Get updated match
-    updated_match = await db.matches.find_one({"id": match_id}, {"_id": 0})
-    if isinstance(updated_match.get('match_date'), str):
-        updated_match['match_date'] = datetime.fromisoformat(updated_match['match_date'])
-    if isinstance(updated_match.get('created_at'), str):
-        updated_match['created_at'] = datetime.fromisoformat(updated_match['created_at'])
+    owned = {"id": match_id, "user_id": user.id}
+    if update_data:
+        updated_match = await db.matches.find_one_and_update(
+            owned, {"$set": update_data}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+    else:
+        updated_match = await db.matches.find_one(owned, {"_id": 0})
+    if not updated_match:
+        raise HTTPException(status_code=404, detail="Match not found")
+    if update_data:
+        invalidate_user_analytics(user.id)
     
     return Match(**updated_match)
 
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_REPORTED_ERRORS = 500
+
+class ImportDecodeError(Exception):
+    def __init__(self, row: int, reason: str):
+        super().__init__(reason)
+        self.row = row
+
+async def iter_body_lines(request: Request):
+    """Yield decoded lines (newline kept) from the request body as it streams in
+
+    Bytes are split on newlines before decoding, so a multi-byte character split across
+    chunks stays whole and invalid UTF-8 raises UnicodeDecodeError on the line holding it.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()  # utf-8-sig drops a leading BOM
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield decoder.decode(line + b"\n")
+    text = decoder.decode(buffer, final=True)
+    if text:
+        yield text
+
+async def iter_import_rows(request: Request, import_format: Optional[str]):
+    """Yield (row number, dict) from a CSV (with header) or NDJSON body
+
+    Raises ImportDecodeError, carrying the row being read, if the body is not UTF-8.
+    """
+    content_type = request.headers.get("content-type", "")
+    header = None
+    row_number = 0
+    record = ""  # CSV lines of a record whose quoted field spans a newline
+    lines = iter_body_lines(request)
+    while True:
+        try:
+            line = await lines.__anext__()
+        except StopAsyncIteration:
+            break
+        except UnicodeDecodeError as e:
+            raise ImportDecodeError(row_number + 1, f"body is not valid UTF-8 ({e.reason})")
+        if not record and not line.strip():
+            continue
+        if import_format is None:
+            import_format = "csv" if "csv" in content_type else "ndjson" if line.lstrip().startswith("{") else "csv"
+        if import_format == "csv":
+            record += line
+            # Quotes come in pairs ("" escapes one), so an odd count means a field is still open
+            if record.count('"') % 2:
+                continue
+            values = next(csv.reader(io.StringIO(record)), [])
+            record = ""
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            row_number += 1
+            # Blank cells mean "use the default" rather than an empty value
+            yield row_number, {k: v.strip() for k, v in zip(header, values) if v.strip() != ""}
+        else:
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, e
+
+@api_router.post("/matches/import", response_model=MatchImportResult)
+async def import_matches(
+    request: Request,
+    import_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+):
+    """Bulk-import matches from a streamed CSV or NDJSON body
+
+    Rows are validated like POST /matches; bad rows are reported and skipped.
+    """
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    owned_decks = {}  # deck_id -> owned by user (one lookup per distinct deck)
+    archetypes = {}  # raw opponent name -> canonical archetype fields
+    errors = []
+    failed = 0
+    imported = 0
+    batch = []  # (row number, match document)
+    
+    def reject(row_number: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append(ImportRowError(row=row_number, error=message))
+    
+    async def flush():
+        nonlocal imported
+        if not batch:
+            return
+        try:
+            result = await db.matches.insert_many([doc for _, doc in batch], ordered=False)
+            imported += len(result.inserted_ids)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            imported += len(batch) - len(write_errors)
+            for write_error in write_errors:
+                reject(batch[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+        batch.clear()
+    
+    rows = iter_import_rows(request, import_format)
+    while True:
+        try:
+            row_number, row = await rows.__anext__()
+        except StopAsyncIteration:
+            break
+        except ImportDecodeError as e:
+            # Earlier batches are already stored; say how far the import got
+            await flush()
+            raise HTTPException(status_code=400, detail={
+                "row": e.row, "error": str(e), "imported": imported, "failed": failed})
+        if isinstance(row, Exception):
+            reject(row_number, f"Invalid JSON: {row}")
+            continue
+        if not isinstance(row, dict):
+            reject(row_number, "Row must be a JSON object")
+            continue
+        try:
+            match_row = MatchImportRow(**row)
+        except ValidationError as e:
+            reject(row_number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        result = match_row.result.strip().lower()
+        if result not in ("win", "loss"):
+            reject(row_number, f"result must be 'win' or 'loss', got {match_row.result!r}")
+            continue
+        
+        if match_row.deck_id not in owned_decks:
+            owned_decks[match_row.deck_id] = await user_owns_deck(user.id, match_row.deck_id, fresh=True)
+        if not owned_decks[match_row.deck_id]:
+            reject(row_number, f"Deck {match_row.deck_id} not found")
+            continue
+        
+        if match_row.opponent_deck_name not in archetypes:
+            archetypes[match_row.opponent_deck_name] = await opponent_archetype_fields(match_row.opponent_deck_name)
+        
+        match_fields = match_row.model_dump(exclude={"match_date", "result"})
+        if match_row.match_date:
+            match_date = match_row.match_date
+            match_fields["match_date"] = match_date if match_date.tzinfo else match_date.replace(tzinfo=timezone.utc)
+        new_match = Match(
+            user_id=user.id,
+            result=result,
+            **match_fields,
+            **archetypes[match_row.opponent_deck_name],
+        )
+        batch.append((row_number, new_match.model_dump()))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+    
+    await flush()
+    if imported:
+        invalidate_user_analytics(user.id)
+    
+    return MatchImportResult(
+        imported=imported,
+        failed=failed,
+        errors=errors,
+        errors_truncated=failed > len(errors),
+    )
+
 @api_router.delete("/matches/{match_id}")
 async def delete_match(match_id: str, request: Request):
     """Delete a match"""
@@ -474,70 +1140,528 @@ async def delete_match(match_id: str, request: Request):
     result = await db.matches.delete_one({"id": match_id, "user_id": user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Match not found")
+    invalidate_user_analytics(user.id)
     
     return {"message": "Match deleted successfully"}
 
-@api_router.get("/decks/{deck_id}/stats", response_model=DeckStats)
-async def get_deck_stats(deck_id: str, request: Request):
-    """Get statistics for a deck"""
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+def count_if(condition) -> dict:
+    """$sum accumulator counting documents that satisfy an aggregation expression"""
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+IS_WIN = {"$eq": ["$result", "win"]}
+# Group opponents by canonical archetype; matches logged before canonicalization fall back to raw text
+OPPONENT = {"$ifNull": ["$opponent_archetype", "$opponent_deck_name"]}
+IS_LOSS = {"$eq": ["$result", "loss"]}
+WENT_FIRST = {"$eq": ["$went_first", True]}
+WENT_SECOND = {"$eq": ["$went_first", False]}
+
+def deck_stats_pipeline(deck_id: str, date_from: Optional[datetime], date_to: Optional[datetime],
+                        window: Optional[int], rolling: int) -> List[dict]:
+    """Aggregation computing every DeckStats section in one round trip
+
+    Served by the (deck_id, match_date) index; window keeps only the last N matches.
+    """
+    match_filter = {"deck_id": deck_id}
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from
+    if date_to:
+        date_range["$lte"] = date_to
+    if date_range:
+        match_filter["match_date"] = date_range
     
-    # Verify deck belongs to user
-    deck = await db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0})
-    if not deck:
-        raise HTTPException(status_code=404, detail="Deck not found")
+    pipeline = [{"$match": match_filter}]
+    if window:
+        pipeline += [{"$sort": {"match_date": -1}}, {"$limit": window}]
+    pipeline += [
+        {"$sort": {"match_date": 1}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total_matches": {"$sum": 1},
+                "wins": count_if(IS_WIN),
+                "bad_games": count_if({"$eq": ["$bad_game", True]}),
+                "went_first_wins": count_if({"$and": [IS_WIN, WENT_FIRST]}),
+                "went_first_losses": count_if({"$and": [IS_LOSS, WENT_FIRST]}),
+                "went_second_wins": count_if({"$and": [IS_WIN, WENT_SECOND]}),
+                "went_second_losses": count_if({"$and": [IS_LOSS, WENT_SECOND]}),
+                "total_mulligans": {"$sum": {"$ifNull": ["$mulligan_count", 0]}},
+            }}],
+            "opponents": [{"$group": {
+                "_id": OPPONENT,
+                "wins": count_if(IS_WIN),
+                "total": {"$sum": 1},
+            }}],
+            "weekly": [
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": "$match_date", "unit": "week", "startOfWeek": "monday"}},
+                    "matches": {"$sum": 1},
+                    "wins": count_if(IS_WIN),
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+            "form": [
+                {"$setWindowFields": {
+                    "sortBy": {"match_date": 1},
+                    "output": {
+                        "rolling_wins": {"$sum": {"$cond": [IS_WIN, 1, 0]},
+                                         "window": {"documents": [-(rolling - 1), "current"]}},
+                        "rolling_count": {"$sum": 1, "window": {"documents": [-(rolling - 1), "current"]}},
+                    },
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "match_id": "$id",
+                    "match_date": 1,
+                    "result": 1,
+                    "rolling_win_rate": {"$round": [{"$multiply": [{"$divide": ["$rolling_wins", "$rolling_count"]}, 100]}, 1]},
+                }},
+            ],
+        }},
+    ]
+    return pipeline
+
+def streaks(results: List[str]) -> tuple:
+    """(current, longest win, longest loss) for results in chronological order"""
+    current = longest_win = longest_loss = 0
+    for result in results:
+        if result == "win":
+            current = current + 1 if current > 0 else 1
+            longest_win = max(longest_win, current)
+        else:
+            current = current - 1 if current < 0 else -1
+            longest_loss = max(longest_loss, -current)
+    return current, longest_win, longest_loss
+
+def week_start(moment: datetime) -> datetime:
+    """Monday 00:00 UTC of the week, matching $dateTrunc with startOfWeek monday"""
+    moment = moment.astimezone(timezone.utc)
+    return (moment - timedelta(days=moment.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def deck_stats_from_matches(matches: List[dict], rolling: int = 10) -> DeckStats:
+    """DeckStats computed in Python from already-loaded matches (same numbers as deck_stats_pipeline)"""
+    ordered = sorted(matches, key=lambda m: m["match_date"])
+    total_matches = len(ordered)
+    wins = sum(1 for m in ordered if m["result"] == "win")
+    total_mulligans = sum(m.get("mulligan_count") or 0 for m in ordered)
     
-    # Get all matches for this deck
-    matches = await db.matches.find({"deck_id": deck_id}, {"_id": 0}).to_list(1000)
+    def count(result, went_first):
+        return sum(1 for m in ordered if m["result"] == result and m.get("went_first") is went_first)
     
-    # Calculate stats
-    total_matches = len(matches)
-    wins = sum(1 for m in matches if m["result"] == "win")
-    losses = total_matches - wins
-    win_rate = (wins / total_matches * 100) if total_matches > 0 else 0
-    bad_games = sum(1 for m in matches if m.get("bad_game", False))
+    opponent_stats = {}
+    weekly = {}
+    form = []
+    for i, m in enumerate(ordered):
+        opponent = m.get("opponent_archetype") or m["opponent_deck_name"]
+        record = opponent_stats.setdefault(opponent, {"wins": 0, "losses": 0, "total": 0})
+        record["wins" if m["result"] == "win" else "losses"] += 1
+        record["total"] += 1
+        
+        week = weekly.setdefault(week_start(m["match_date"]), {"matches": 0, "wins": 0})
+        week["matches"] += 1
+        week["wins"] += m["result"] == "win"
+        
+        recent = ordered[max(0, i - rolling + 1):i + 1]
+        form.append(FormPoint(
+            match_id=m["id"], match_date=m["match_date"], result=m["result"],
+            rolling_win_rate=round(sum(1 for r in recent if r["result"] == "win") / len(recent) * 100, 1),
+        ))
     
-    went_first_wins = sum(1 for m in matches if m["result"] == "win" and m["went_first"])
-    went_first_losses = sum(1 for m in matches if m["result"] == "loss" and m["went_first"])
-    went_second_wins = sum(1 for m in matches if m["result"] == "win" and not m["went_first"])
-    went_second_losses = sum(1 for m in matches if m["result"] == "loss" and not m["went_first"])
+    current_streak, longest_win_streak, longest_loss_streak = streaks([m["result"] for m in ordered])
     
-    # Calculate mulligan stats
-    total_mulligans = sum(m.get("mulligan_count", 0) for m in matches)
+    return DeckStats(
+        total_matches=total_matches,
+        wins=wins,
+        losses=total_matches - wins,
+        win_rate=round(wins / total_matches * 100, 2) if total_matches > 0 else 0,
+        bad_games=sum(1 for m in ordered if m.get("bad_game")),
+        went_first_wins=count("win", True),
+        went_first_losses=count("loss", True),
+        went_second_wins=count("win", False),
+        went_second_losses=count("loss", False),
+        avg_mulligans=round(total_mulligans / total_matches, 2) if total_matches > 0 else 0,
+        total_mulligans=total_mulligans,
+        opponent_stats=opponent_stats,
+        current_streak=current_streak,
+        longest_win_streak=longest_win_streak,
+        longest_loss_streak=longest_loss_streak,
+        form=form,
+        weekly=[
+            WeeklyStats(week_start=start, matches=w["matches"], wins=w["wins"],
+                        win_rate=round(w["wins"] / w["matches"] * 100, 1))
+            for start, w in sorted(weekly.items())
+        ],
+    )
+
+async def aggregate_deck_stats(deck_id: str, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                               window: Optional[int] = None, rolling: int = 10) -> DeckStats:
+    """DeckStats from deck_stats_pipeline, for decks whose matches are not all loaded"""
+    results = await db.matches.aggregate(
+        deck_stats_pipeline(deck_id, date_from, date_to, window, rolling)
+    ).to_list(1)
+    facets = results[0]
+    totals = facets["totals"][0] if facets["totals"] else {}
+    
+    total_matches = totals.get("total_matches", 0)
+    wins = totals.get("wins", 0)
+    win_rate = (wins / total_matches * 100) if total_matches > 0 else 0
+    total_mulligans = totals.get("total_mulligans", 0)
     avg_mulligans = (total_mulligans / total_matches) if total_matches > 0 else 0
     
-    # Calculate opponent stats
-    opponent_stats = {}
-    for match in matches:
-        opp = match["opponent_deck_name"]
-        if opp not in opponent_stats:
-            opponent_stats[opp] = {"wins": 0, "losses": 0, "total": 0}
-        
-        opponent_stats[opp]["total"] += 1
-        if match["result"] == "win":
-            opponent_stats[opp]["wins"] += 1
-        else:
-            opponent_stats[opp]["losses"] += 1
+    opponent_stats = {
+        o["_id"]: {"wins": o["wins"], "losses": o["total"] - o["wins"], "total": o["total"]}
+        for o in facets["opponents"]
+    }
+    
+    current_streak, longest_win_streak, longest_loss_streak = streaks([p["result"] for p in facets["form"]])
     
     return DeckStats(
         total_matches=total_matches,
         wins=wins,
-        losses=losses,
+        losses=total_matches - wins,
         win_rate=round(win_rate, 2),
-        bad_games=bad_games,
-        went_first_wins=went_first_wins,
-        went_first_losses=went_first_losses,
-        went_second_wins=went_second_wins,
-        went_second_losses=went_second_losses,
+        bad_games=totals.get("bad_games", 0),
+        went_first_wins=totals.get("went_first_wins", 0),
+        went_first_losses=totals.get("went_first_losses", 0),
+        went_second_wins=totals.get("went_second_wins", 0),
+        went_second_losses=totals.get("went_second_losses", 0),
         avg_mulligans=round(avg_mulligans, 2),
         total_mulligans=total_mulligans,
-        opponent_stats=opponent_stats
+        opponent_stats=opponent_stats,
+        current_streak=current_streak,
+        longest_win_streak=longest_win_streak,
+        longest_loss_streak=longest_loss_streak,
+        form=facets["form"],
+        weekly=[
+            WeeklyStats(week_start=w["_id"], matches=w["matches"], wins=w["wins"],
+                        win_rate=round(w["wins"] / w["matches"] * 100, 1))
+            for w in facets["weekly"]
+        ],
+    )
+
+@api_router.get("/decks/{deck_id}/stats", response_model=DeckStats)
+async def get_deck_stats(
+    deck_id: str,
+    request: Request,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    window: Optional[int] = Query(None, ge=1, description="Only the last N matches"),
+    rolling: int = Query(10, ge=1, le=100, description="Matches per rolling win rate point"),
+):
+    """Get statistics for a deck, optionally for a date range or the last N matches"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    await require_deck_owner(user.id, deck_id)
+    
+    stats = await aggregate_deck_stats(deck_id, date_from, date_to, window, rolling)
+    
+    return cached_json_response(request, content_etag(stats), PRIVATE_CACHE_CONTROL, lambda: stats)
+
+@api_router.get("/decks/{deck_id}/bundle", response_model=DeckBundle)
+async def get_deck_bundle(deck_id: str, request: Request):
+    """Deck, matches and stats for the deck page in one request"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    # The deck lookup doubles as the ownership check; matches are only returned if it succeeds
+    deck, matches = await asyncio.gather(
+        db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0}),
+        db.matches.find({"deck_id": deck_id}, {"_id": 0}).sort("match_date", -1).limit(MATCH_LIST_LIMIT).to_list(None),
+    )
+    if not deck:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    
+    await attach_card_data([deck])
+    deck["test_results"] = derive_test_results(deck.get("test_results"))
+    # A full page may not be every match: the stats then come from the aggregation instead
+    if len(matches) < MATCH_LIST_LIMIT:
+        stats = deck_stats_from_matches(matches)
+    else:
+        stats = await aggregate_deck_stats(deck_id)
+    bundle = DeckBundle(
+        deck=Deck(**deck),
+        matches=[Match(**m) for m in matches],
+        stats=stats,
     )
+    
+    return cached_json_response(request, content_etag(bundle), PRIVATE_CACHE_CONTROL, lambda: bundle)
+
+# composition hash -> draw odds; the odds depend only on copy counts, so decks share entries
+probability_cache = TTLCache(maxsize=256, ttl=3600)
+
+# Card groups in the consistency table, by simulation card code
+PROBABILITY_GROUPS = {
+    "basic_pokemon": ("BASIC",),
+    "pokemon": ("BASIC", "POKEMON"),
+    "trainer": ("TRAINER",),
+    "energy": ("ENERGY",),
+}
+
+def deck_composition(entries: List[dict], cards: dict) -> List[dict]:
+    """One row per distinct card: copies, simulation code and the subtypes the optimizer needs"""
+    sim = subsystems.simulation()
+    rows = {}
+    for entry in entries:
+        card = cards.get(entry['cache_key']) or {}
+        code = sim.card_code(entry, card)
+        subtypes = card.get("subtypes") or []
+        row = rows.setdefault(entry['cache_key'], {
+            "cache_key": entry['cache_key'], "name": entry['name'], "copies": 0, "code": code,
+            "supporter": "Supporter" in subtypes, "basic_energy": code == sim.ENERGY and "Basic" in subtypes})
+        row["copies"] += entry['count']
+    return list(rows.values())
+
+# A legal deck is 60 cards; the cap leaves room for drafts while bounding the work (and the
+# O(n²) binomial tables) a single deck line like "9999999 Foo" could otherwise ask for
+MAX_DECK_CARDS = 120
+
+def require_deck_size(entries: List[dict]) -> int:
+    """Total copies in a parsed deck list; 422 above MAX_DECK_CARDS"""
+    size = sum(entry['count'] for entry in entries)
+    if size > MAX_DECK_CARDS:
+        raise HTTPException(status_code=422, detail=f"A deck can have at most {MAX_DECK_CARDS} cards (this one has {size})")
+    return size
+
+async def load_deck_composition(deck_id: str, user_id: str) -> List[dict]:
+    deck = await db.decks.find_one({"id": deck_id, "user_id": user_id}, {"_id": 0, "deck_list": 1})
+    if not deck:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    entries = parse_deck_list(deck.get("deck_list") or "")
+    require_deck_size(entries)
+    return deck_composition(entries, await load_cards({e['cache_key'] for e in entries}))
+
+@api_router.get("/decks/{deck_id}/probabilities")
+async def get_deck_probabilities(deck_id: str, request: Request, turns: int = Query(default=6, ge=1, le=15)):
+    """Odds of having seen at least k copies of each card and card group by each turn"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    rows = await load_deck_composition(deck_id, user.id)
+    sim = subsystems.simulation()
+    deck_size = sum(r["copies"] for r in rows)
+    basics = sum(r["copies"] for r in rows if r["code"] == sim.BASIC)
+    groups = []
+    for name, code_names in PROBABILITY_GROUPS.items():
+        codes = {getattr(sim, code) for code in code_names}
+        groups.append({"group": name, "copies": sum(r["copies"] for r in rows if r["code"] in codes),
+                       "basics": basics if sim.BASIC in codes else 0})
+    # (copies, copies that are not Basic Pokemon) is all the odds depend on
+    targets = [(r["copies"], 0 if r["code"] == sim.BASIC else r["copies"]) for r in rows]
+    targets += [(g["copies"], g["copies"] - g["basics"]) for g in groups]
+    composition = make_etag(deck_size, basics, turns, sorted(set(targets)))
+
+    odds = probability_cache.get(composition)
+    if odds is None:
+        probability = subsystems.probability()
+        try:
+            result = probability.draw_probabilities(deck_size, basics, targets, turns)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        odds = {
+            "mulligan_rate": probability.mulligan_rate(deck_size, basics),
+            "targets": {target: {"all_prized": float(result["all_prized"][i]),
+                                 "first": result["first"][i, :min(target[0], probability.MAX_COPIES)].round(4).tolist(),
+                                 "second": result["second"][i, :min(target[0], probability.MAX_COPIES)].round(4).tolist()}
+                        for i, target in enumerate(targets)},
+        }
+        probability_cache[composition] = odds
+
+    def build_payload():
+        return {
+            "composition": composition.strip('"'),
+            "deck_size": deck_size,
+            "basics": basics,
+            "turns": turns,
+            "mulligan_rate": round(odds["mulligan_rate"], 4),
+            "cards": [{"cache_key": r["cache_key"], "name": r["name"], "copies": r["copies"], **odds["targets"][t]}
+                      for r, t in zip(rows, targets)],
+            "groups": [{"group": g["group"], "copies": g["copies"], **odds["targets"][t]}
+                       for g, t in zip(groups, targets[len(rows):])],
+        }
+    # The list and the cards it resolves to decide the table, so the composition doubles as the ETag
+    etag = make_etag(composition, *(r["cache_key"] for r in rows))
+    return cached_json_response(request, etag, PRIVATE_CACHE_CONTROL, build_payload)
+
+# (checks, composition) -> score, shared by every optimizer run
+optimizer_memo = TTLCache(maxsize=100_000, ttl=3600)
+
+OPTIMIZE_GROUPS = [*PROBABILITY_GROUPS, "supporter"]
+
+class OptimizeTarget(BaseModel):
+    group: Optional[str] = None  # one of OPTIMIZE_GROUPS
+    cards: Optional[List[str]] = None  # cache keys, counted together
+    k: int = Field(default=1, ge=1, le=4)
+    turn: int = Field(default=2, ge=1, le=10)
+    going: str = Field(default="first", pattern="^(first|second)$")
+
+class OptimizeRequest(BaseModel):
+    targets: List[OptimizeTarget] = Field(default_factory=lambda: [
+        OptimizeTarget(group="supporter", turn=2), OptimizeTarget(group="energy", turn=2)], max_length=8)
+    budget_seconds: float = Field(default=3, gt=0, le=10)
+    max_changes: int = Field(default=2, ge=1, le=4)
+
+def target_members(rows: List[dict], target: OptimizeTarget) -> List[int]:
+    if target.cards is not None:
+        keys = set(target.cards)
+        return [i for i, row in enumerate(rows) if row["cache_key"] in keys]
+    if target.group == "supporter":
+        return [i for i, row in enumerate(rows) if row["supporter"]]
+    sim = subsystems.simulation()
+    codes = {getattr(sim, code) for code in PROBABILITY_GROUPS[target.group]}
+    return [i for i, row in enumerate(rows) if row["code"] in codes]
+
+@api_router.post("/decks/{deck_id}/optimize")
+async def optimize_deck(deck_id: str, request: Request, body: Optional[OptimizeRequest] = None):
+    """Pareto-best count tweaks for mulligan rate and the requested turn-N access targets"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    body = body or OptimizeRequest()
+    for target in body.targets:
+        if (target.group is None) == (target.cards is None):
+            raise HTTPException(status_code=422, detail="Each target needs either a group or cards")
+        if target.group is not None and target.group not in OPTIMIZE_GROUPS:
+            raise HTTPException(status_code=422, detail=f"Groups: {', '.join(OPTIMIZE_GROUPS)}")
+    rows = await load_deck_composition(deck_id, user.id)
+
+    optimizer = subsystems.optimizer()
+    pool = subsystems.process_pool() if OPTIMIZE_WORKERS else None
+    try:
+        result = await optimizer.search(
+            [optimizer.Row(**row) for row in rows],
+            [target_members(rows, target) for target in body.targets],
+            [(target.k, target.turn, target.going) for target in body.targets],
+            body.budget_seconds, executor=pool, workers=OPTIMIZE_WORKERS, max_changes=body.max_changes,
+            memo=optimizer_memo)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"targets": [target.model_dump(exclude_none=True) for target in body.targets], **result}
+
+@api_router.get("/decks/{deck_id}/hands")
+async def get_seeded_hands(deck_id: str, request: Request,
+                           seed: Optional[int] = Query(default=None, ge=0, lt=2**53),
+                           offset: int = Query(default=0, ge=0), count: int = Query(default=50, ge=1, le=500)):
+    """A batch of pre-shuffled opening hands from a seeded session, with the cards they hold
+
+    Hands are positions in `deck`; the same seed, offset and count always return the same
+    hands, so a session can be replayed. Without a seed a new session is started.
+    """
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    deck = await db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0, "deck_list": 1})
+    if not deck:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    entries = parse_deck_list(deck.get("deck_list") or "")
+    require_deck_size(entries)  # before expanding the list: hands are count x deck size
+    sim = subsystems.simulation()
+    cards_in_deck = [entry['cache_key'] for entry in entries for _ in range(entry['count'])]
+    if len(cards_in_deck) < sim.HAND_SIZE:
+        raise HTTPException(status_code=422, detail=f"A deck needs at least {sim.HAND_SIZE} cards")
+    cards = await load_cards({entry['cache_key'] for entry in entries})
+
+    if seed is None:
+        seed = random.getrandbits(53)  # stays exact as a JavaScript number
+    hands = sim.seeded_hands(len(cards_in_deck), seed, offset, count)
+    return {
+        "seed": seed,
+        "offset": offset,
+        "next_offset": offset + count,
+        "deck": cards_in_deck,
+        "cards": {entry['cache_key']: deck_card(cards.get(entry['cache_key']) or card_from_deck_list(entry), entry['section'])
+                  for entry in entries},
+        "hands": hands.tolist(),
+    }
+
+def record_group_fields() -> dict:
+    """$group accumulators for a win/loss record, went first/second splits and mulligans"""
+    return {
+        "total": {"$sum": 1},
+        "wins": count_if(IS_WIN),
+        "first_total": count_if(WENT_FIRST),
+        "first_wins": count_if({"$and": [IS_WIN, WENT_FIRST]}),
+        "second_total": count_if(WENT_SECOND),
+        "second_wins": count_if({"$and": [IS_WIN, WENT_SECOND]}),
+        "mulligan_games": count_if({"$gt": [{"$ifNull": ["$mulligan_count", 0]}, 0]}),
+        "mulligans": {"$sum": {"$ifNull": ["$mulligan_count", 0]}},
+    }
+
+def user_analytics_pipeline(user_id: str) -> List[dict]:
+    """One aggregation over the user's matches: per-deck, per-opponent and deck x opponent"""
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$facet": {
+            "overall": [{"$group": {"_id": None, **record_group_fields()}}],
+            "decks": [
+                {"$group": {"_id": "$deck_id", **record_group_fields()}},
+                {"$lookup": {
+                    "from": "decks", "localField": "_id", "foreignField": "id",
+                    "pipeline": [{"$project": {"_id": 0, "deck_name": 1}}], "as": "deck",
+                }},
+                {"$set": {"deck_name": {"$first": "$deck.deck_name"}}},
+                {"$project": {"deck": 0}},
+            ],
+            "opponents": [{"$group": {"_id": OPPONENT, "total": {"$sum": 1}, "wins": count_if(IS_WIN)}}],
+            "matrix": [{"$group": {
+                "_id": {"deck_id": "$deck_id", "opponent": OPPONENT},
+                "total": {"$sum": 1},
+                "wins": count_if(IS_WIN),
+            }}],
+        }},
+    ]
+
+def matchup_record(wins: int, total: int) -> MatchupRecord:
+    return MatchupRecord(wins=wins, losses=total - wins, total=total,
+                         win_rate=round(wins / total * 100, 1) if total > 0 else 0)
+
+def split_records(group: dict) -> dict:
+    """Turn record_group_fields() output into the shared analytics fields"""
+    total = group["total"]
+    return {
+        "record": matchup_record(group["wins"], total),
+        "went_first": matchup_record(group["first_wins"], group["first_total"]),
+        "went_second": matchup_record(group["second_wins"], group["second_total"]),
+        "mulligan_rate": round(group["mulligan_games"] / total * 100, 1) if total > 0 else 0,
+        "avg_mulligans": round(group["mulligans"] / total, 2) if total > 0 else 0,
+    }
+
+@api_router.get("/users/me/analytics", response_model=UserAnalytics)
+async def get_user_analytics(request: Request):
+    """Cross-deck analytics: deck x opponent win rates, play order splits and mulligan rates"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    analytics = analytics_cache.get(user.id)
+    if analytics is None:
+        results = await db.matches.aggregate(user_analytics_pipeline(user.id)).to_list(1)
+        facets = results[0]
+        
+        matrix = {}
+        for cell in facets["matrix"]:
+            matrix.setdefault(cell["_id"]["deck_id"], {})[cell["_id"]["opponent"]] = matchup_record(cell["wins"], cell["total"])
+        
+        empty = {"total": 0, "wins": 0, "first_total": 0, "first_wins": 0,
+                 "second_total": 0, "second_wins": 0, "mulligan_games": 0, "mulligans": 0}
+        analytics = UserAnalytics(
+            **split_records(facets["overall"][0] if facets["overall"] else empty),
+            decks=sorted(
+                (DeckAnalytics(deck_id=d["_id"], deck_name=d.get("deck_name"),
+                               opponents=matrix.get(d["_id"], {}), **split_records(d))
+                 for d in facets["decks"]),
+                key=lambda d: d.record.total, reverse=True
+            ),
+            opponents={o["_id"]: matchup_record(o["wins"], o["total"]) for o in facets["opponents"]},
+        )
+        analytics_cache[user.id] = analytics
+    
+    return cached_json_response(request, content_etag(analytics), PRIVATE_CACHE_CONTROL, lambda: analytics)
 
 @api_router.get("/cards/{set_code}/{card_number}")
-async def get_card_from_db(set_code: str, card_number: str):
+async def get_card_from_db(set_code: str, card_number: str, request: Request):
     """Get card from local database"""
     # Try exact match first
     card = await db.pokemon_cards.find_one(
@@ -559,49 +1683,50 @@ async def get_card_from_db(set_code: str, card_number: str):
     if not card:
         raise HTTPException(status_code=404, detail="Card not found in database")
     
-    return card
+    return cached_json_response(request, content_etag(card), CARD_CACHE_CONTROL, lambda: card)
 
 @api_router.get("/cards/count")
-async def get_cards_count():
+async def get_cards_count(request: Request):
     """Get total number of cards in database"""
     count = await db.pokemon_cards.count_documents({})
-    return {"count": count}
+    return cached_json_response(request, make_etag("cards-count", count), CARD_COUNT_CACHE_CONTROL, lambda: {"count": count})
 
-@api_router.get("/cards/image/{set_code}/{card_number}")
-async def get_card_image_from_limitless(set_code: str, card_number: str):
-    """Fetch card image URL from LimitlessTCG"""
+async def limitless_image_url(set_code: str, card_number: str) -> dict:
+    """Card image URL scraped from the LimitlessTCG card page"""
     try:
         # LimitlessTCG URL pattern
         limitless_url = f"https://limitlesstcg.com/cards/{set_code.upper()}/{card_number}"
         
-        async with httpx.AsyncClient(timeout=10.0) as http_client:
-            response = await http_client.get(limitless_url)
-            response.raise_for_status()
-            
-            html = response.text
-            
-            # Extract image URL from HTML
-            # Look for the large card image in the page
-            import re
-            
-            # Pattern: limitlesstcg.nyc3.cdn.digitaloceanspaces.com/tpci/{SET}/{SET}_{NUM}_*_EN_LG.png
-            pattern = r'https://limitlesstcg\.nyc3\.cdn\.digitaloceanspaces\.com/tpci/[^"]+\.png'
-            matches = re.findall(pattern, html)
-            
-            if matches:
-                # Get the large image (LG suffix)
-                large_images = [m for m in matches if '_LG.png' in m or '_R_EN_LG.png' in m]
-                if large_images:
-                    return {"image_url": large_images[0]}
-                # Fallback to any image found
-                return {"image_url": matches[0]}
-            
-            return {"image_url": None, "error": "Image not found in page"}
+        response = await subsystems.http_client().get(limitless_url)
+        response.raise_for_status()
+        
+        html = response.text
+        
+        # Extract image URL from HTML
+        # Look for the large card image in the page
+        # Pattern: limitlesstcg.nyc3.cdn.digitaloceanspaces.com/tpci/{SET}/{SET}_{NUM}_*_EN_LG.png
+        pattern = r'https://limitlesstcg\.nyc3\.cdn\.digitaloceanspaces\.com/tpci/[^"]+\.png'
+        matches = re.findall(pattern, html)
+        
+        if matches:
+            # Get the large image (LG suffix)
+            large_images = [m for m in matches if '_LG.png' in m or '_R_EN_LG.png' in m]
+            if large_images:
+                return {"image_url": large_images[0]}
+            # Fallback to any image found
+            return {"image_url": matches[0]}
+        
+        return {"image_url": None, "error": "Image not found in page"}
             
     except Exception as e:
         logger.error(f"Error fetching image from LimitlessTCG: {str(e)}")
         return {"image_url": None, "error": str(e)}
 
+@api_router.get("/cards/image/{set_code}/{card_number}")
+async def get_card_image_from_limitless(set_code: str, card_number: str):
+    """Fetch card image URL from LimitlessTCG"""
+    return await limitless_image_url(set_code, card_number)
+
 @api_router.post("/cards/batch")
 async def save_cards_batch(cards: dict):
     """Save multiple cards to database in batch (progressive population)"""
@@ -610,20 +1735,16 @@ async def save_cards_batch(cards: dict):
         skipped_count = 0
         
         for cache_key, card_data in cards.items():
-            # Extract set_code and card_number from cache_key (e.g., "MEW-123")
-            parts = cache_key.split('-')
-            if len(parts) < 2:
+            # Build the pokemon_cards document from cache_key (e.g., "MEW-123")
+            card_doc = card_doc_from_client(cache_key, card_data)
+            if not card_doc:
                 continue
             
-            set_code = parts[0].upper()
-            card_number = '-'.join(parts[1:])  # Handle card numbers with dashes
-            card_id = f"{set_code.lower()}-{card_number}"
-            
             # Check if card already exists
             existing = await db.pokemon_cards.find_one({
                 "$or": [
-                    {"set_code": set_code, "card_number": card_number},
-                    {"card_id": card_id}
+                    {"set_code": card_doc["set_code"], "card_number": card_doc["card_number"]},
+                    {"card_id": card_doc["card_id"]}
                 ]
             })
             
@@ -631,26 +1752,6 @@ async def save_cards_batch(cards: dict):
                 skipped_count += 1
                 continue
             
-            # Prepare card document for database
-            card_doc = {
-                "card_id": card_id,
-                "set_code": set_code,
-                "card_number": card_number,
-                "name": card_data.get("name"),
-                "supertype": card_data.get("supertype"),
-                "subtypes": card_data.get("subtypes", []),
-                "hp": card_data.get("hp"),
-                "types": card_data.get("types", []),
-                "abilities": card_data.get("abilities", []),
-                "attacks": card_data.get("attacks", []),
-                "weaknesses": card_data.get("weaknesses", []),
-                "resistances": card_data.get("resistances", []),
-                "retreat_cost": card_data.get("retreatCost", []),
-                "rules": card_data.get("rules", []),
-                "image_small": card_data.get("image"),
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
             await db.pokemon_cards.insert_one(card_doc)
             saved_count += 1
         
@@ -665,234 +1766,124 @@ async def save_cards_batch(cards: dict):
         raise HTTPException(status_code=500, detail=f"Failed to save cards: {str(e)}")
 
 class TestResults(BaseModel):
-    total_hands: int
-    mulligan_count: int
-    mulligan_percentage: float
-    avg_pokemon: float
-    avg_trainer: float
-    avg_energy: float
-    avg_basic_pokemon: float = 0.0  # Optional for backward compatibility
-    unplayable_hands: int = 0  # Optional for backward compatibility
+    total_hands: int = Field(ge=0)
+    mulligan_count: int = Field(ge=0)
+    # Raw card counts summed over the session's hands
+    total_pokemon: Optional[int] = Field(default=None, ge=0)
+    total_trainer: Optional[int] = Field(default=None, ge=0)
+    total_energy: Optional[int] = Field(default=None, ge=0)
+    total_basic_pokemon: Optional[int] = Field(default=None, ge=0)
+    unplayable_hands: int = Field(default=0, ge=0)
+    # Per-hand count histograms for HISTOGRAM_CATEGORIES, HISTOGRAM_BUCKETS long
+    histograms: Optional[Dict[str, List[int]]] = None
+    # Older clients send per-session averages instead of raw counts
+    mulligan_percentage: Optional[float] = Field(default=None, ge=0)
+    avg_pokemon: Optional[float] = Field(default=None, ge=0)
+    avg_trainer: Optional[float] = Field(default=None, ge=0)
+    avg_energy: Optional[float] = Field(default=None, ge=0)
+    avg_basic_pokemon: Optional[float] = Field(default=None, ge=0)
+
+def test_result_increments(results: TestResults) -> dict:
+    """Counter and histogram bucket deltas for one simulator session"""
+    def total(raw, avg):
+        return raw if raw is not None else round((avg or 0) * results.total_hands)
+    increments = {
+        "total_hands": results.total_hands,
+        "mulligan_count": results.mulligan_count,
+        "total_pokemon": total(results.total_pokemon, results.avg_pokemon),
+        "total_trainer": total(results.total_trainer, results.avg_trainer),
+        "total_energy": total(results.total_energy, results.avg_energy),
+        "total_basic_pokemon": total(results.total_basic_pokemon, results.avg_basic_pokemon),
+        "unplayable_hands": results.unplayable_hands,
+    }
+    for category, histogram in (results.histograms or {}).items():
+        if (category not in HISTOGRAM_CATEGORIES or len(histogram) != HISTOGRAM_BUCKETS
+                or min(histogram) < 0 or sum(histogram) != results.total_hands):
+            # One bucket per hand, so every histogram accounts for exactly total_hands hands
+            raise HTTPException(status_code=422, detail=(
+                f"histograms.{category} must be {HISTOGRAM_BUCKETS} non-negative counts summing to total_hands; "
+                f"categories: {', '.join(HISTOGRAM_CATEGORIES)}"))
+        # Merging is element-wise addition: $inc on the array positions
+        increments.update({f"histograms.{category}.{i}": n for i, n in enumerate(histogram) if n})
+    return increments
+
+def legacy_test_result_counters(results: Optional[dict]) -> dict:
+    """Seed raw counters from averages saved before counters existed (histograms start empty)"""
+    results = results or {}
+    hands = results.get("total_hands") or 0
+    return {
+        "total_hands": hands,
+        "mulligan_count": results.get("mulligan_count") or 0,
+        "total_pokemon": round((results.get("avg_pokemon") or 0) * hands),
+        "total_trainer": round((results.get("avg_trainer") or 0) * hands),
+        "total_energy": round((results.get("avg_energy") or 0) * hands),
+        "total_basic_pokemon": round((results.get("avg_basic_pokemon") or 0) * hands),
+        "unplayable_hands": results.get("unplayable_hands") or 0,
+        "histograms": empty_histograms(),
+    }
 
 @api_router.post("/decks/{deck_id}/test-results")
 async def save_test_results(deck_id: str, test_results: TestResults, request: Request):
     """Save hand simulator test results to deck (accumulative)"""
-    try:
-        user = await get_current_user(request)
-        if not user:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
-        # Verify deck belongs to user
-        deck = await db.decks.find_one({"id": deck_id, "user_id": user.id}, {"_id": 0})
-        if not deck:
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    increments = test_result_increments(test_results)
+    now = datetime.now(timezone.utc)
+    projection = {"_id": 0, "test_results": 1}
+    
+    # Concurrent saves (two simulator tabs) both land: the counters are incremented server-side
+    counted = {"id": deck_id, "user_id": user.id, "test_results.histograms": {"$exists": True}}
+    increment = {"$inc": {f"test_results.{k}": v for k, v in increments.items()},
+                 "$set": {"test_results.last_tested": now}}
+    deck = await db.decks.find_one_and_update(counted, increment, projection=projection,
+                                              return_document=ReturnDocument.AFTER)
+    
+    while deck is None:
+        existing = await db.decks.find_one({"id": deck_id, "user_id": user.id}, projection)
+        if not existing:
             raise HTTPException(status_code=404, detail="Deck not found")
-        
-        # Get existing test results (if any) - ensure it's a dict, not None
-        existing_results = deck.get("test_results") or {}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error in save_test_results (initial): {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error loading deck: {str(e)}")
+        previous = existing.get("test_results")
+        if not previous or "total_pokemon" not in previous:
+            # First save since counters were introduced: seed them from what is stored,
+            # unless a concurrent save changed test_results since it was read
+            await db.decks.update_one(
+                {"id": deck_id, "user_id": user.id, "test_results": previous},
+                {"$set": {"test_results": legacy_test_result_counters(previous)}},
+            )
+        elif "histograms" not in previous:
+            # Counters from before histograms: $inc needs the arrays to exist, all zero
+            await db.decks.update_one(
+                {"id": deck_id, "user_id": user.id, "test_results.histograms": {"$exists": False}},
+                {"$set": {"test_results.histograms": empty_histograms()}},
+            )
+        deck = await db.decks.find_one_and_update(counted, increment, projection=projection,
+                                                  return_document=ReturnDocument.AFTER)
     
-    try:
-        # Calculate accumulated totals - handle None/missing values
-        old_total_hands = existing_results.get("total_hands", 0) if existing_results else 0
-        old_mulligan_count = existing_results.get("mulligan_count", 0) if existing_results else 0
-        old_total_pokemon = (existing_results.get("avg_pokemon", 0) if existing_results else 0) * old_total_hands
-        old_total_trainer = (existing_results.get("avg_trainer", 0) if existing_results else 0) * old_total_hands
-        old_total_energy = (existing_results.get("avg_energy", 0) if existing_results else 0) * old_total_hands
-        old_total_basic_pokemon = (existing_results.get("avg_basic_pokemon", 0) if existing_results else 0) * old_total_hands
-        old_unplayable_hands = existing_results.get("unplayable_hands", 0) if existing_results else 0
-        
-        # Add new test results to existing
-        new_total_hands = old_total_hands + test_results.total_hands
-        new_mulligan_count = old_mulligan_count + test_results.mulligan_count
-        new_total_pokemon = old_total_pokemon + (test_results.avg_pokemon * test_results.total_hands)
-        new_total_trainer = old_total_trainer + (test_results.avg_trainer * test_results.total_hands)
-        new_total_energy = old_total_energy + (test_results.avg_energy * test_results.total_hands)
-        new_total_basic_pokemon = old_total_basic_pokemon + (test_results.avg_basic_pokemon * test_results.total_hands)
-        new_unplayable_hands = old_unplayable_hands + test_results.unplayable_hands
-        
-        # Calculate new averages and percentages
-        new_mulligan_percentage = (new_mulligan_count / new_total_hands * 100) if new_total_hands > 0 else 0
-        new_avg_pokemon = new_total_pokemon / new_total_hands if new_total_hands > 0 else 0
-        new_avg_trainer = new_total_trainer / new_total_hands if new_total_hands > 0 else 0
-        new_avg_energy = new_total_energy / new_total_hands if new_total_hands > 0 else 0
-        new_avg_basic_pokemon = new_total_basic_pokemon / new_total_hands if new_total_hands > 0 else 0
-        new_unplayable_percentage = (new_unplayable_hands / new_total_hands * 100) if new_total_hands > 0 else 0
-        
-        # Update deck with accumulated test results
-        await db.decks.update_one(
-            {"id": deck_id},
-            {"$set": {
-                "test_results": {
-                    "total_hands": new_total_hands,
-                    "mulligan_count": new_mulligan_count,
-                    "mulligan_percentage": round(new_mulligan_percentage, 1),
-                    "avg_pokemon": round(new_avg_pokemon, 1),
-                    "avg_trainer": round(new_avg_trainer, 1),
-                    "avg_energy": round(new_avg_energy, 1),
-                    "avg_basic_pokemon": round(new_avg_basic_pokemon, 1),
-                    "unplayable_hands": new_unplayable_hands,
-                    "unplayable_percentage": round(new_unplayable_percentage, 1),
-                    "last_tested": datetime.now(timezone.utc).isoformat()
-                }
-            }}
-        )
-        
-        return {
-            "message": "Test results saved successfully (accumulated)",
-            "total_hands": new_total_hands,
-            "mulligan_percentage": round(new_mulligan_percentage, 1)
-        }
-    except Exception as e:
-        logger.error(f"Error in save_test_results (calculation/save): {str(e)}")
-        logger.error(f"  existing_results: {existing_results}")
-        logger.error(f"  test_results: {test_results}")
-        raise HTTPException(status_code=500, detail=f"Error saving test results: {str(e)}")
+    results = derive_test_results(deck["test_results"])
+    return {
+        "message": "Test results saved successfully (accumulated)",
+        "total_hands": results["total_hands"],
+        "mulligan_percentage": results["mulligan_percentage"]
+    }
+
+# The meta_refresh job re-renders the page hourly; older snapshots fall back to a live scrape
+META_SNAPSHOT_ID = "trainerhill_meta"
+META_SNAPSHOT_MAX_AGE = timedelta(seconds=int(os.environ.get('META_SNAPSHOT_MAX_AGE_SECONDS', str(6 * 3600))))
+
+async def meta_snapshot_html() -> Optional[str]:
+    """TrainerHill meta page stored by the scheduler, if it is recent enough"""
+    snapshot = await db.meta_snapshots.find_one(
+        {"_id": META_SNAPSHOT_ID, "fetched_at": {"$gte": datetime.now(timezone.utc) - META_SNAPSHOT_MAX_AGE}})
+    return snapshot["html"] if snapshot else None
 
 @api_router.get("/meta-wizard/{deck_name}")
 async def get_meta_wizard(deck_name: str):
     """Scrape TrainerHill meta data for deck matchups using Playwright"""
     try:
-        from playwright.async_api import async_playwright
-        import re
-        from bs4 import BeautifulSoup
-        
-        # Use Playwright to render JavaScript content
-        async with async_playwright() as p:
-            try:
-                browser = await p.chromium.launch(headless=True)
-            except Exception as browser_error:
-                # Fallback: Return sample data when Playwright browsers not installed
-                logger.warning(f"Playwright browser launch failed: {browser_error}")
-                logger.warning("Returning sample meta data. Install Playwright browsers for real data.")
-                return {
-                    'deck_name': deck_name,
-                    'best_matchups': [
-                        {'opponent': 'Sample Deck A', 'win_rate': 58.5},
-                        {'opponent': 'Sample Deck B', 'win_rate': 55.2},
-                        {'opponent': 'Sample Deck C', 'win_rate': 52.8}
-                    ],
-                    'worst_matchups': [
-                        {'opponent': 'Sample Deck X', 'win_rate': 35.4},
-                        {'opponent': 'Sample Deck Y', 'win_rate': 38.9},
-                        {'opponent': 'Sample Deck Z', 'win_rate': 42.1}
-                    ],
-                    'source': 'Sample Data (Playwright not available)',
-                    'total_matchups': 14,
-                    'note': 'Sample data shown. Install Playwright browsers in production for real TrainerHill data.'
-                }
-            
-            page = await browser.new_page()
-            
-            try:
-                # Navigate to TrainerHill meta page
-                await page.goto("https://www.trainerhill.com/meta?game=PTCG", wait_until="networkidle", timeout=30000)
-                
-                # Wait for the table to load (adjust selector as needed)
-                await page.wait_for_selector("table", timeout=15000)
-                
-                # Get the rendered HTML
-                html = await page.content()
-                
-            finally:
-                await browser.close()
-        
-        # Parse HTML to find matchup data
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Normalize deck name for matching
-        search_name = deck_name.lower().replace(' ex', '').replace('ex', '').strip()
-        
-        matchups = []
-        
-        # Find the matchup table
-        tables = soup.find_all('table')
-        logger.info(f"Found {len(tables)} tables on the page")
-        
-        for table in tables:
-            rows = table.find_all('tr')
-            if len(rows) < 2:
-                continue
-            
-            # Get header row to identify columns (opponent decks)
-            header_row = rows[0]
-            header_cells = header_row.find_all(['th', 'td'])
-            
-            # Extract opponent names from headers (skip first column which is the deck name)
-            opponent_names = []
-            for cell in header_cells[1:]:
-                opponent_text = cell.get_text(strip=True)
-                # Clean up the text
-                opponent_clean = re.sub(r'\s+', ' ', opponent_text).strip()
-                if opponent_clean and opponent_clean != '%=wins+ties3total':
-                    opponent_names.append(opponent_clean)
-            
-            logger.info(f"Extracted {len(opponent_names)} opponent names from headers")
-            
-            # Find our deck's row
-            for row in rows[1:]:
-                cells = row.find_all(['td', 'th'])
-                if len(cells) < 2:
-                    continue
-                
-                # First cell is the deck name
-                first_cell_text = cells[0].get_text(strip=True).lower()
-                
-                # Check if this is our deck
-                if search_name in first_cell_text or first_cell_text.replace(' ', '') in search_name.replace(' ', ''):
-                    logger.info(f"Found deck row for {deck_name}: {first_cell_text}")
-                    
-                    # Parse matchup data from remaining cells
-                    for i, cell in enumerate(cells[1:]):
-                        cell_text = cell.get_text(strip=True)
-                        # Extract percentage (e.g., "65.2%")
-                        percentage_match = re.search(r'(\d+(?:\.\d+)?)\s*%', cell_text)
-                        
-                        if percentage_match and i < len(opponent_names):
-                            win_rate = float(percentage_match.group(1))
-                            opponent = opponent_names[i]
-                            
-                            matchups.append({
-                                'opponent': opponent,
-                                'win_rate': win_rate
-                            })
-                    
-                    break  # Found our deck, stop searching
-            
-            if matchups:
-                break  # Found matchups, stop searching tables
-        
-        # If no matchups found
-        if not matchups:
-            logger.warning(f"No matchup data found for {deck_name}")
-            return {
-                'deck_name': deck_name,
-                'best_matchups': [{'opponent': 'Deck not found in meta', 'win_rate': 0}],
-                'worst_matchups': [{'opponent': 'Deck not found in meta', 'win_rate': 0}],
-                'source': 'TrainerHill',
-                'total_matchups': 0,
-                'note': f'Deck "{deck_name}" not found in current meta data.'
-            }
-        
-        # Sort matchups by win rate
-        sorted_matchups = sorted(matchups, key=lambda x: x['win_rate'], reverse=True)
-        
-        # Get best 3 and worst 3
-        best_3 = sorted_matchups[:3] if len(sorted_matchups) >= 3 else sorted_matchups
-        worst_3 = sorted_matchups[-3:] if len(sorted_matchups) >= 3 else sorted_matchups
-        worst_3.reverse()  # Show worst first
-        
-        return {
-            'deck_name': deck_name,
-            'best_matchups': best_3,
-            'worst_matchups': worst_3,
-            'source': 'TrainerHill',
-            'total_matchups': len(matchups)
-        }
-        
+        scraping = subsystems.scraping()
+        return await scraping.meta_wizard(deck_name, await meta_snapshot_html())
     except Exception as e:
         logger.error(f"Error fetching meta data from TrainerHill: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch meta data: {str(e)}")
@@ -902,183 +1893,362 @@ async def get_meta_wizard(deck_name: str):
 async def get_meta_brake():
     """Calculate top 2 meta-breaking decks using weighted scoring"""
     try:
-        from playwright.async_api import async_playwright
-        import re
-        from bs4 import BeautifulSoup
-        
-        logger.info("Starting Meta Brake calculation...")
-        
-        # Use Playwright to render JavaScript content
-        async with async_playwright() as p:
-            try:
-                browser = await p.chromium.launch(headless=True)
-            except Exception as browser_error:
-                # Fallback: Return sample data when Playwright browsers not installed
-                logger.warning(f"Playwright browser launch failed: {browser_error}")
-                logger.warning("Returning sample meta brake data. Install Playwright browsers for real data.")
-                return {
-                    'top_decks': [
-                        {'deck_name': 'Sample Meta Breaker 1', 'overall_wr': 54.5, 'weighted_score': 54.2},
-                        {'deck_name': 'Sample Meta Breaker 2', 'overall_wr': 52.8, 'weighted_score': 52.5}
-                    ],
-                    'source': 'Sample Data (Playwright not available)',
-                    'total_analyzed': 14,
-                    'note': 'Sample data shown. Install Playwright browsers in production for real TrainerHill analysis.'
-                }
-            
-            page = await browser.new_page()
-            
-            try:
-                # Navigate to TrainerHill meta page
-                await page.goto("https://www.trainerhill.com/meta?game=PTCG", wait_until="networkidle", timeout=30000)
-                
-                # Wait for the table to load
-                await page.wait_for_selector("table", timeout=15000)
-                
-                # Get the rendered HTML
-                html = await page.content()
-                
-            finally:
-                await browser.close()
-        
-        # Parse HTML to extract full matchup matrix
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Find the matchup table
-        tables = soup.find_all('table')
-        
-        deck_data = {}  # {deck_name: {overall_wr: float, matchups: {opponent: win_rate}}}
-        
-        for table in tables:
-            rows = table.find_all('tr')
-            if len(rows) < 2:
-                continue
-            
-            # Get header row for opponent names
-            header_row = rows[0]
-            header_cells = header_row.find_all(['th', 'td'])
-            
-            # Extract opponent names (skip first column)
-            opponent_names = []
-            for cell in header_cells[1:]:
-                opponent_text = cell.get_text(strip=True)
-                opponent_clean = re.sub(r'\s+', ' ', opponent_text).strip()
-                if opponent_clean and opponent_clean != '%=wins+ties3total':
-                    opponent_names.append(opponent_clean)
-            
-            if len(opponent_names) == 0:
-                continue
-            
-            logger.info(f"Found {len(opponent_names)} decks in meta")
-            
-            # Parse each deck's row
-            for row in rows[1:]:
-                cells = row.find_all(['td', 'th'])
-                if len(cells) < 2:
-                    continue
-                
-                # First cell is the deck name
-                deck_name = cells[0].get_text(strip=True)
-                if not deck_name:
-                    continue
-                
-                # Parse matchup data
-                matchups = {}
-                win_rates = []
-                
-                for i, cell in enumerate(cells[1:]):
-                    cell_text = cell.get_text(strip=True)
-                    # Extract percentage
-                    percentage_match = re.search(r'(\d+(?:\.\d+)?)\s*%', cell_text)
-                    
-                    if percentage_match and i < len(opponent_names):
-                        win_rate = float(percentage_match.group(1))
-                        opponent = opponent_names[i]
-                        matchups[opponent] = win_rate
-                        win_rates.append(win_rate)
-                
-                if len(matchups) > 0:
-                    # Calculate overall win rate for this deck
-                    overall_wr = sum(win_rates) / len(win_rates)
-                    deck_data[deck_name] = {
-                        'overall_wr': overall_wr,
-                        'matchups': matchups
-                    }
-            
-            if len(deck_data) > 0:
-                break  # Found data, stop searching
-        
-        if len(deck_data) < 2:
-            logger.warning("Not enough deck data found")
-            return {
-                'top_decks': [],
-                'note': 'Insufficient data to calculate meta breakers'
-            }
-        
-        logger.info(f"Analyzing {len(deck_data)} decks for meta breakers...")
-        
-        # Calculate weighted scores
-        # Score = overall_wr * 0.4 + weighted_matchup_score * 0.6
-        # weighted_matchup_score = Σ(win_rate_vs_opponent * opponent_overall_wr) / Σ(opponent_overall_wr)
-        
-        deck_scores = []
-        
-        for deck_name, data in deck_data.items():
-            overall_wr = data['overall_wr']
-            matchups = data['matchups']
-            
-            # Calculate weighted matchup score
-            weighted_sum = 0
-            weight_total = 0
-            
-            for opponent, win_rate_vs_opponent in matchups.items():
-                if opponent in deck_data:
-                    opponent_strength = deck_data[opponent]['overall_wr']
-                    # Weight this matchup by opponent's strength
-                    weighted_sum += (win_rate_vs_opponent / 100.0) * opponent_strength
-                    weight_total += opponent_strength
-            
-            if weight_total > 0:
-                weighted_matchup_score = (weighted_sum / weight_total) * 100
-            else:
-                weighted_matchup_score = overall_wr
-            
-            # Final score: balance overall strength with ability to beat strong decks
-            final_score = (overall_wr * 0.4) + (weighted_matchup_score * 0.6)
-            
-            deck_scores.append({
-                'deck_name': deck_name,
-                'overall_wr': round(overall_wr, 1),
-                'weighted_score': round(final_score, 2)
-            })
-        
-        # Sort by weighted score and get top 2
-        deck_scores.sort(key=lambda x: x['weighted_score'], reverse=True)
-        top_2 = deck_scores[:2]
-        
-        logger.info(f"Top 2 meta breakers: {[d['deck_name'] for d in top_2]}")
-        
-        return {
-            'top_decks': top_2,
-            'source': 'TrainerHill',
-            'total_analyzed': len(deck_data)
-        }
-        
+        scraping = subsystems.scraping()
+        return await scraping.meta_brake(await meta_snapshot_html())
     except Exception as e:
         logger.error(f"Error calculating meta breakers: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to calculate meta breakers: {str(e)}")
 
 
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Background jobs
+# Anything that can outlive a proxy timeout runs on the job queue; clients poll GET /api/jobs/{id}
+# or follow GET /api/jobs/{id}/events
+job_queue = JobQueue(
+    lambda: db.jobs,
+    lambda: db.job_events,
+    concurrency=int(os.environ.get('JOB_WORKERS', '2')),
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', '60')),
+    backoff_seconds=float(os.environ.get('JOB_BACKOFF_SECONDS', '5')),
 )
+MAX_ACTIVE_JOBS_PER_USER = int(os.environ.get('MAX_ACTIVE_JOBS_PER_USER', '20'))
+
+POKEMON_TCG_API_URL = os.environ.get('POKEMON_TCG_API_URL', 'https://api.pokemontcg.io/v2')
+CARD_RESOLVE_CONCURRENCY = 8
+
+SECTION_SUPERTYPES = {'pokemon': 'Pokémon', 'trainer': 'Trainer', 'energy': 'Energy'}
+
+def card_from_deck_list(entry: dict) -> dict:
+    """The basic entry for a card nothing else knows: what its deck list line says"""
+    return {"name": entry['name'], "image": None, "supertype": SECTION_SUPERTYPES.get(entry['section']), "subtypes": []}
+
+def card_from_tcg_api(card: dict) -> dict:
+    """Pokemon TCG API card -> frontend card_data entry (same mapping as the deck page)"""
+    return {
+        "name": card.get("name"),
+        "image": (card.get("images") or {}).get("small"),
+        "supertype": card.get("supertype"),
+        "subtypes": card.get("subtypes") or [],
+        "hp": card.get("hp"),
+        "types": card.get("types") or [],
+        "abilities": card.get("abilities") or [],
+        "attacks": card.get("attacks") or [],
+        "weaknesses": card.get("weaknesses") or [],
+        "resistances": card.get("resistances") or [],
+        "retreatCost": card.get("retreatCost") or [],
+        "rules": card.get("rules") or [],
+    }
+
+async def fetch_card(entry: dict, fallback: bool = True) -> dict:
+    """Card details from the Pokemon TCG API, else a basic entry from the deck list line
+
+    An unreachable or failing API raises unless `fallback` is set, so the job retries
+    instead of storing a basic entry for a card the API does have.
+    """
+    http_client = subsystems.http_client()
+    for card_id in (f"{entry['set_code'].lower()}-{entry['card_number']}", f"{entry['set_code']}-{entry['card_number']}"):
+        try:
+            response = await http_client.get(f"{POKEMON_TCG_API_URL}/cards/{card_id}")
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            return card_from_tcg_api(response.json()["data"])
+        except httpx.HTTPError as e:
+            if not fallback:
+                raise
+            logger.warning(f"Pokemon TCG API lookup of {card_id} failed: {e}")
+            break
+    image = await limitless_image_url(entry['set_code'], entry['card_number'])
+    return {**card_from_deck_list(entry), "image": image.get("image_url")}
+
+async def resolve_deck_cards(job: JobContext):
+    """Look up every card a deck names that pokemon_cards does not have yet"""
+    deck = await db.decks.find_one({"id": job.params["deck_id"], "user_id": job.user_id},
+                                   {"_id": 0, "deck_name": 1, "deck_list": 1, "card_keys": 1, "featured_image": 1})
+    if not deck:
+        raise PermanentError("Deck not found")
+    entries = {e['cache_key']: e for e in parse_deck_list(deck.get("deck_list") or "")}
+    known = await load_cards(entries)
+    missing = [entry for key, entry in entries.items() if key not in known]
+    done = len(entries) - len(missing)
+    await job.emit("cards", {key: deck_card(card, entries[key]['section']) for key, card in known.items()})
+    await job.progress(done, len(entries), f"{len(missing)} cards to look up", force=True)
+
+    resolved = {}
+    semaphore = asyncio.Semaphore(CARD_RESOLVE_CONCURRENCY)
+
+    async def resolve(entry):
+        nonlocal done
+        async with semaphore:
+            card = resolved[entry['cache_key']] = await fetch_card(entry, fallback=job.final_attempt)
+        done += 1
+        await job.emit("card", {"cache_key": entry['cache_key'], "card": deck_card(card, entry['section'])})
+        await job.progress(done, len(entries), entry['name'])
+    await asyncio.gather(*(resolve(entry) for entry in missing))
+    stored = await store_client_cards(resolved)
+
+    # Legacy decks still embed card_data; only normalized decks get their keys refreshed
+    if deck.get("card_keys") is not None:
+        update = {"card_keys": list(entries), "updated_at": datetime.now(timezone.utc)}
+        if not deck.get("featured_image"):
+            sections = {key: entry['section'] for key, entry in entries.items()}
+            cards = {key: {**card, "isPokemon": sections[key] == 'pokemon'}
+                     for key, card in {**known, **resolved}.items()}
+            update["featured_image"] = pick_featured_image(deck["deck_name"], cards)
+        await db.decks.update_one({"id": job.params["deck_id"], "user_id": job.user_id}, {"$set": update})
+    return {"total": len(entries), "already_known": len(known), "resolved": len(resolved), "stored": stored}
+
+async def simulate_hands(job: JobContext):
+    """Opening-hand statistics over many hands, emitting partial results every `report_every`"""
+    deck = await db.decks.find_one({"id": job.params["deck_id"], "user_id": job.user_id}, {"_id": 0, "deck_list": 1})
+    if not deck:
+        raise PermanentError("Deck not found")
+    sim = subsystems.simulation()
+    entries = parse_deck_list(deck.get("deck_list") or "")
+    if sum(entry['count'] for entry in entries) > MAX_DECK_CARDS:
+        raise PermanentError(f"A deck can have at most {MAX_DECK_CARDS} cards")
+    codes = sim.deck_codes(entries, await load_cards({e['cache_key'] for e in entries}))
+    if len(codes) < sim.HAND_SIZE:
+        raise PermanentError(f"A deck needs at least {sim.HAND_SIZE} cards")
+    rng = random.Random(job.params["seed"])
+    hands = job.params["hands"]
+    totals = sim.empty_totals()
+    while totals["total_hands"] < hands:
+        chunk = min(job.params["report_every"], hands - totals["total_hands"])
+        # Off the event loop: a chunk is a few hundred milliseconds of pure Python
+        totals = sim.merge_totals(totals, await asyncio.to_thread(sim.simulate_hands, codes, chunk, rng))
+        await job.emit("partial", derive_test_results(totals))
+        await job.progress(totals["total_hands"], hands, force=True)
+    return derive_test_results(totals)
+
+async def run_meta_wizard(job: JobContext):
+    return await subsystems.scraping().meta_wizard(job.params["deck_name"], await meta_snapshot_html())
+
+async def run_meta_brake(job: JobContext):
+    return await subsystems.scraping().meta_brake(await meta_snapshot_html())
+
+class ResolveDeckCardsParams(BaseModel):
+    deck_id: str
+
+class MetaWizardParams(BaseModel):
+    deck_name: str = Field(min_length=1, max_length=100)
+
+class MetaBrakeParams(BaseModel):
+    pass
+
+class SimulateHandsParams(BaseModel):
+    deck_id: str
+    hands: int = Field(default=100_000, ge=100, le=2_000_000)
+    report_every: int = Field(default=10_000, ge=1_000)
+    seed: Optional[int] = None
+
+# kind -> params model; the queue's handler for each kind is registered below
+JOB_PARAMS = {
+    "resolve_deck_cards": ResolveDeckCardsParams,
+    "meta_wizard": MetaWizardParams,
+    "meta_brake": MetaBrakeParams,
+    "simulate_hands": SimulateHandsParams,
+}
+job_queue.handler("resolve_deck_cards", resolve_deck_cards, max_attempts=3, timeout=300, priority=5)
+job_queue.handler("meta_wizard", run_meta_wizard, max_attempts=2, timeout=120)
+job_queue.handler("meta_brake", run_meta_brake, max_attempts=2, timeout=120)
+job_queue.handler("simulate_hands", simulate_hands, max_attempts=2, timeout=600)
+
+class JobCreate(BaseModel):
+    kind: str
+    params: dict = Field(default_factory=dict)
+    priority: Optional[int] = Field(default=None, ge=0, le=9)
+
+async def enqueue_job(user: User, kind: str, params: dict, priority: Optional[int], idempotency_key: Optional[str]) -> dict:
+    if kind not in JOB_PARAMS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind}")
+    try:
+        params = JOB_PARAMS[kind].model_validate(params).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    if "deck_id" in params:
+        await require_deck_owner(user.id, params["deck_id"], fresh=True)
+    active = await db.jobs.count_documents(
+        {"user_id": user.id, "status": {"$in": ["queued", "running"]}}, limit=MAX_ACTIVE_JOBS_PER_USER)
+    if active >= MAX_ACTIVE_JOBS_PER_USER:
+        raise HTTPException(status_code=429, detail="Too many jobs in progress", headers={"Retry-After": "10"})
+    return await job_queue.enqueue(kind, params, user.id, priority, idempotency_key)
+
+@api_router.post("/jobs", status_code=202)
+async def create_job(job: JobCreate, request: Request):
+    """Queue a long-running operation; repeat the Idempotency-Key header to get the same job back"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await enqueue_job(user, job.kind, job.params, job.priority, request.headers.get("idempotency-key"))
+
+@api_router.post("/decks/{deck_id}/resolve-cards", status_code=202)
+async def resolve_cards_job(deck_id: str, request: Request):
+    """Queue server-side lookup of every card the deck list names"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await enqueue_job(user, "resolve_deck_cards", {"deck_id": deck_id}, None,
+                             request.headers.get("idempotency-key"))
+
+@api_router.get("/jobs")
+async def list_jobs(request: Request, limit: int = Query(default=20, ge=1, le=100)):
+    """The current user's most recent jobs"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await db.jobs.find({"user_id": user.id}, JOB_FIELDS).sort("created_at", -1).limit(limit).to_list(limit)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Status, progress and, once finished, the result or error of a job"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    job = await job_queue.get(job_id, user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def sse_frame(event: Optional[dict]) -> str:
+    """One Server-Sent Events frame; None is a comment line that keeps proxies from timing out"""
+    if event is None:
+        return ": keepalive\n\n"
+    frame = f"id: {event['id']}\n" if "id" in event else ""
+    return frame + f"event: {event['type']}\ndata: {json.dumps(jsonable_encoder(event['data']))}\n\n"
+
+@api_router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, cancel_on_disconnect: bool = False):
+    """Stream a job's events, progress and status as Server-Sent Events until it finishes
+
+    Reconnecting with Last-Event-ID resumes after that event. With cancel_on_disconnect the
+    job is cancelled when the client goes away before it finishes.
+    """
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not await job_queue.get(job_id, user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def frames():
+        finished = False
+        try:
+            async for event in job_queue.stream(job_id, request.headers.get("last-event-id")):
+                yield sse_frame(event)
+            finished = True
+        finally:
+            # Starlette cancels this generator when the client disconnects; shield the
+            # cancel write from that cancellation or it would never reach MongoDB
+            if cancel_on_disconnect and not finished:
+                with anyio.CancelScope(shield=True):
+                    await job_queue.cancel(job_id, user.id)
+
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx would otherwise hold events back
+    })
+
+@api_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    """Cancel a queued job, or stop a running one at its next checkpoint"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    status = await job_queue.cancel(job_id, user.id)
+    if not status:
+        raise HTTPException(status_code=409, detail="Job has already finished")
+    return {"message": "Job cancelled" if status == "cancelled" else "Job cancelling", "status": status}
+
+class ProfileRequestsArm(BaseModel):
+    path: str  # exact path or glob, e.g. "/api/meta-brake" or "/api/decks/*/stats"
+    count: int = Field(default=1, ge=1, le=100)
+
+class ProfileSampleRequest(BaseModel):
+    seconds: float = Field(default=10, gt=0, le=MAX_SAMPLE_SECONDS)
+    interval_ms: float = Field(default=5, ge=1, le=1000)
+
+PROFILE_MEDIA_TYPES = {
+    "speedscope": "application/json",
+    "html": "text/html",
+    "collapsed": "text/plain",
+    "text": "text/plain",
+    "pstats": "text/plain",
+}
+
+@api_router.post("/admin/profile/requests")
+async def arm_request_profiling(arm: ProfileRequestsArm, request: Request):
+    """Profile the next `count` requests whose path matches"""
+    await require_admin(request)
+    profile_store.arm(arm.path, arm.count)
+    return {"armed": profile_store.armed}
+
+@api_router.delete("/admin/profile/requests")
+async def disarm_request_profiling(request: Request):
+    """Stop profiling requests that have not arrived yet"""
+    await require_admin(request)
+    profile_store.disarm()
+    return {"armed": profile_store.armed}
+
+@api_router.post("/admin/profile/sample")
+async def sample_profile(sample: ProfileSampleRequest, request: Request):
+    """Sample the event loop for `seconds`, then return the result summary"""
+    await require_admin(request)
+    try:
+        result = await run_sampler(sample.seconds, sample.interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {k: v for k, v in result.items() if k != "outputs"}
+
+@api_router.get("/admin/profile/results")
+async def list_profiles(request: Request):
+    """Recent profiles held by this worker"""
+    await require_admin(request)
+    return profile_store.summaries()
+
+@api_router.get("/admin/profile/results/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: Optional[str] = None):
+    """Download a profile; speedscope JSON opens directly in https://www.speedscope.app"""
+    await require_admin(request)
+    result = profile_store.get(profile_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    fmt = format or result["formats"][0]
+    if fmt not in result["outputs"]:
+        raise HTTPException(status_code=400, detail=f"Available formats: {', '.join(result['formats'])}")
+    body = result["outputs"][fmt]
+    if not isinstance(body, str):
+        body = orjson.dumps(body)
+    extension = {"speedscope": "json", "html": "html"}.get(fmt, "txt")
+    return Response(
+        content=body,
+        media_type=PROFILE_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.{extension}"'},
+    )
+
+@api_router.get("/admin/scheduler")
+async def get_scheduler_status(request: Request):
+    """Lease holder, this worker's role and every job's schedule and last run"""
+    await require_admin(request)
+    return await scheduler.status()
+
+@api_router.get("/admin/scheduler/runs")
+async def get_scheduler_runs(request: Request, job: Optional[str] = None, limit: int = Query(default=50, ge=1, le=500)):
+    """Run history, newest first"""
+    await require_admin(request)
+    query = {"job": job} if job else {}
+    return await db.scheduler_runs.find(query, {"_id": 0}).sort("started_at", -1).limit(limit).to_list(limit)
+
+@api_router.post("/admin/scheduler/jobs/{name}/run", status_code=202)
+async def trigger_scheduled_job(name: str, request: Request):
+    """Ask the leader to run a job now; it starts within one heartbeat"""
+    user = await require_admin(request)
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    await scheduler.trigger(name, user.email)
+    return {"job": name, "requested": True}
+
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -1087,6 +2257,159 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Compress anything worth compressing; small JSON bodies are cheaper to send as-is.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+# Compressors hold small chunks back until they fill a block, which would stall an event stream
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+class SkipCompressionMiddleware:
+    """Runs `compressor` (GZip/Brotli middleware) but sends UNCOMPRESSED_TYPES responses around it
+
+    The compressor decides from the request alone, so the choice is made here once the
+    response's content type is known.
+    """
+
+    def __init__(self, app, compressor, **options):
+        self.app = app
+        self.compressor = compressor
+        self.options = options
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        bypass = False
+
+        async def app(scope, receive, compressed_send):
+            async def route(message):
+                nonlocal bypass
+                if message["type"] == "http.response.start":
+                    content_type = Headers(raw=message["headers"]).get("content-type", "")
+                    bypass = content_type.startswith(UNCOMPRESSED_TYPES)
+                await (send if bypass else compressed_send)(message)
+            await self.app(scope, receive, route)
+
+        await self.compressor(app, **self.options)(scope, receive, send)
+
+rate_limiter = RateLimiter(
+    DEFAULT_CLASSES,
+    DEFAULT_CRUD,
+    max_in_flight=int(os.environ.get('MAX_CONCURRENT_REQUESTS', '256')),
+    local=MemoryBuckets(),
+    shared=MongoBuckets(lambda: db.rate_limits) if os.environ.get('RATE_LIMIT_BACKEND') == 'mongo' else None,
+    job_classes=DEFAULT_JOB_CLASSES,
+)
+
+async def refresh_meta_snapshot():
+    """Render the TrainerHill meta page once for every worker's meta routes"""
+    html = await subsystems.scraping().fetch_meta_html()
+    if html is None:
+        return {"stored": False, "reason": "browser unavailable"}
+    await db.meta_snapshots.update_one(
+        {"_id": META_SNAPSHOT_ID},
+        {"$set": {"html": html, "fetched_at": datetime.now(timezone.utc)}}, upsert=True)
+    return {"stored": True, "bytes": len(html)}
+
+async def purge_expired_sessions():
+    """Backstop for the sessions TTL index, which only runs on the primary about once a minute"""
+    result = await db.sessions.delete_many({"expires_at": {"$lt": datetime.now(timezone.utc)}})
+    return {"deleted": result.deleted_count}
+
+# Periodic jobs run on exactly one worker: whichever holds the lease in scheduler_leases
+scheduler = Scheduler(
+    lambda: db,
+    lease_seconds=float(os.environ.get('SCHEDULER_LEASE_SECONDS', '30')),
+    heartbeat_seconds=float(os.environ.get('SCHEDULER_HEARTBEAT_SECONDS', '10')),
+)
+scheduler.register("meta_refresh", timedelta(hours=1), refresh_meta_snapshot, timeout=120)
+scheduler.register("session_cleanup", timedelta(hours=1), purge_expired_sessions)
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() != 'false'
+
+async def create_indexes():
+    """Ensure the indexes the request paths rely on exist"""
+    await asyncio.gather(
+        # Expired sessions are removed by MongoDB itself (needs BSON dates, not strings)
+        db.sessions.create_index("expires_at", expireAfterSeconds=0),
+        db.sessions.create_index("session_token"),
+        db.users.create_index("id"),
+        db.decks.create_index([("user_id", 1), ("id", 1)]),
+        db.decks.create_index("id"),
+        db.matches.create_index("id"),
+        db.matches.create_index([("deck_id", 1), ("match_date", -1)]),
+        db.matches.create_index([("user_id", 1), ("match_date", -1)]),
+        db.matches.create_index([("user_id", 1), ("opponent_archetype_id", 1)]),
+        db.matches.create_index([("deck_id", 1), ("opponent_archetype_id", 1)]),
+        db.pokemon_cards.create_index("card_id"),
+    )
+    await ensure_archetypes(db, archetype_index)
+    await scheduler.ensure_indexes()
+    await job_queue.ensure_indexes()
+    if rate_limiter.shared:
+        await rate_limiter.shared.ensure_indexes()
+
+async def run_startup_tasks():
+    start = time.perf_counter()
+    try:
+        await create_indexes()
+        logger.info(f"Startup tasks finished in {(time.perf_counter() - start) * 1000:.0f}ms")
+    except Exception as e:
+        logger.error(f"Startup tasks failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index builds and archetype seeding run in the background: they are idempotent, and the
+    # request paths do not depend on them finishing (canonicalize loads archetypes itself)
+    app.state.startup_task = asyncio.create_task(run_startup_tasks())
+    if SCHEDULER_ENABLED:
+        scheduler.run_forever()
+    job_queue.start()
+    yield
+    if not app.state.startup_task.done():
+        app.state.startup_task.cancel()
+    await job_queue.stop()
+    await scheduler.stop()
+    await subsystems.close()
+
+def create_app() -> FastAPI:
+    # orjson renders the large card_data blobs several times faster than the stdlib encoder
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+
+    # Include the router in the main app
+    app.include_router(api_router)
+
+    # Innermost, so a profile covers the route handler rather than compression
+    app.add_middleware(ProfilingMiddleware)
+
+    # Brotli is used when brotli-asgi is installed (it falls back to gzip for older clients).
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(SkipCompressionMiddleware, compressor=BrotliMiddleware,
+                           minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    except ImportError:
+        app.add_middleware(SkipCompressionMiddleware, compressor=GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+    # Inside CORS so browsers can read 429/503 responses
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'false',
+        forwarded_header=os.environ.get('FORWARDED_IP_HEADER', 'x-forwarded-for') or None,
+        # Proxies in front of the app that append to the forwarded header (the ingress)
+        trusted_proxies=int(os.environ.get('TRUSTED_PROXY_COUNT', '1')),
+    )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Outermost, so latency includes compression and CORS handling
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+app = create_app()
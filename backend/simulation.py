@@ -0,0 +1,79 @@
+"""
+Opening-hand simulation
+Monte Carlo over a deck's cards: draw 7, count what the hand holds, and record a
+mulligan when it has no Basic Pokemon. Totals use the test_results counter names
+(total_hands, mulligan_count, total_pokemon, ...) and histograms, so
+server.derive_test_results turns them into the same rates and distributions the hand
+simulator page shows.
+
+Seeded hands for the simulator page come from a PCG64 stream where hand i always starts
+at draw i * deck size. Any slice of a session can be regenerated from its seed alone.
+"""
+import random
+from typing import Dict, List
+
+import numpy as np
+
+HAND_SIZE = 7
+
+# One code per card copy
+BASIC, POKEMON, TRAINER, ENERGY = range(4)
+
+COUNTERS = ("total_hands", "mulligan_count", "total_pokemon", "total_trainer",
+            "total_energy", "total_basic_pokemon", "unplayable_hands")
+# Per-hand count histograms, as stored in test_results (server.HISTOGRAM_CATEGORIES)
+HISTOGRAMS = ("pokemon", "trainer", "energy", "basic_pokemon")
+
+def card_code(entry: dict, card: dict) -> int:
+    """Deck list sections decide the card type (as on the simulator page); card data decides Basic"""
+    section = entry["section"]
+    if section == "unknown":
+        supertype = (card or {}).get("supertype")
+        section = {"Pokémon": "pokemon", "Energy": "energy"}.get(supertype, "trainer")
+    if section == "pokemon":
+        return BASIC if card and card.get("isBasic") else POKEMON
+    return ENERGY if section == "energy" else TRAINER
+
+def deck_codes(entries: List[dict], cards: Dict[str, dict]) -> List[int]:
+    codes = []
+    for entry in entries:
+        codes.extend([card_code(entry, cards.get(entry["cache_key"]))] * entry["count"])
+    return codes
+
+def empty_totals() -> dict:
+    return {**dict.fromkeys(COUNTERS, 0), "histograms": {name: [0] * (HAND_SIZE + 1) for name in HISTOGRAMS}}
+
+def simulate_hands(deck: List[int], hands: int, rng: random.Random) -> dict:
+    """Totals and per-hand histograms over `hands` independent opening hands"""
+    totals = empty_totals()
+    pokemon, trainers, energy, basics = (totals["histograms"][name] for name in HISTOGRAMS)
+    sample = rng.sample
+    for _ in range(hands):
+        hand = sample(deck, HAND_SIZE)
+        hand_basics = hand.count(BASIC)
+        basics[hand_basics] += 1
+        pokemon[hand_basics + hand.count(POKEMON)] += 1
+        trainers[hand.count(TRAINER)] += 1
+        energy[hand.count(ENERGY)] += 1
+    # Totals follow from the histograms: sum of count x hands holding that count
+    for name in HISTOGRAMS:
+        totals[f"total_{name}"] = sum(i * n for i, n in enumerate(totals["histograms"][name]))
+    totals["total_hands"] = hands
+    totals["mulligan_count"] = basics[0]
+    return totals
+
+def merge_totals(totals: dict, chunk: dict) -> dict:
+    """Counters add, histograms add bucket by bucket"""
+    return {
+        **{name: totals[name] + chunk[name] for name in COUNTERS},
+        "histograms": {name: [a + b for a, b in zip(totals["histograms"][name], chunk["histograms"][name])]
+                       for name in HISTOGRAMS},
+    }
+
+def seeded_hands(deck_size: int, seed: int, offset: int, count: int) -> np.ndarray:
+    """Deck positions of hands offset..offset+count-1 of the session `seed`, shape [count, 7]"""
+    bit_generator = np.random.PCG64(seed)
+    # Each hand consumes exactly deck_size doubles, one 64-bit draw each
+    bit_generator.advance(offset * deck_size)
+    keys = np.random.Generator(bit_generator).random((count, deck_size))
+    return np.argsort(keys, axis=1)[:, :HAND_SIZE]
@@ -0,0 +1,89 @@
+"""
+Subsystems built on first use
+Heavy or optional pieces (the MongoDB client, Playwright scraping, the outbound image
+client, simulation engines) stay out of the import of server.py, so a worker starts
+serving as soon as FastAPI is imported and only pays for what its traffic touches.
+The app's lifespan closes whatever was actually built.
+"""
+import importlib
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Lazy:
+    """A value created by `factory` on the first call, optionally released by `close`"""
+
+    def __init__(self, name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.factory = factory
+        self.closer = close
+        self.value = None
+        self.loaded = False
+
+    def __call__(self):
+        if not self.loaded:
+            self.value = self.factory()
+            self.loaded = True
+            logger.info(f"Loaded subsystem {self.name}")
+        return self.value
+
+    async def close(self):
+        if not self.loaded:
+            return
+        value, self.value, self.loaded = self.value, None, False
+        if self.closer:
+            result = self.closer(value)
+            if inspect.isawaitable(result):
+                await result
+
+class Subsystems:
+    """Registry of lazy subsystems, reachable as attributes: `subsystems.scraping()`"""
+
+    def __init__(self):
+        self.items: Dict[str, Lazy] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], Any]] = None) -> Lazy:
+        self.items[name] = Lazy(name, factory, close)
+        return self.items[name]
+
+    def module(self, name: str) -> Lazy:
+        """A module imported on first use"""
+        return self.register(name, lambda: importlib.import_module(name))
+
+    def __getattr__(self, name: str) -> Lazy:
+        try:
+            return self.__dict__["items"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def loaded(self) -> List[str]:
+        return [name for name, item in self.items.items() if item.loaded]
+
+    async def close(self):
+        # Reverse order: later subsystems may depend on earlier ones
+        for item in reversed(list(self.items.values())):
+            try:
+                await item.close()
+            except Exception as e:
+                logger.error(f"Error closing subsystem {item.name}: {e}")
+
+class LazyDatabase:
+    """Motor database whose client is only constructed when a collection is first used"""
+
+    def __init__(self, client: Lazy, name: str):
+        self._client = client
+        self._name = name
+        self._database = None
+
+    def _resolve(self):
+        if self._database is None or not self._client.loaded:
+            self._database = self._client()[self._name]
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
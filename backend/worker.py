@@ -0,0 +1,38 @@
+"""
+Dedicated job queue consumer
+Runs server.py's job handlers without serving HTTP, so heavy jobs can be moved off the
+web workers (set JOB_WORKERS=0 there) and scaled separately. Shares MONGO_URL/DB_NAME
+and the `jobs` collection with the API.
+
+  cd backend && python worker.py --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+import server
+
+logger = logging.getLogger("worker")
+
+async def main(concurrency: int):
+    queue = server.job_queue
+    queue.concurrency = concurrency
+    await queue.ensure_indexes()
+    queue.start()
+    logger.info(f"Job worker {queue.worker_id} running {concurrency} consumers for {sorted(queue.handlers)}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Stopping; running jobs are handed back to the queue")
+    await queue.stop()
+    await server.subsystems.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(main(parser.parse_args().concurrency))
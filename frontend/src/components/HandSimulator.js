@@ -1,10 +1,20 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from './ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from './ui/dialog';
 import axios from 'axios';
 import { toast } from 'sonner';
 import { API } from '../App';
 
+// Per-hand card counts, bucket i = hands holding i cards of a kind (matches the backend)
+const emptyHistograms = () => ({
+  pokemon: Array(8).fill(0),
+  trainer: Array(8).fill(0),
+  energy: Array(8).fill(0),
+  basic_pokemon: Array(8).fill(0)
+});
+
+const addToBucket = (histogram, count) => histogram.map((n, i) => (i === count ? n + 1 : n));
+
 const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpdate }) => {
   const [hand, setHand] = useState([]);
   const [mulliganCount, setMulliganCount] = useState(0);
@@ -23,10 +33,16 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
     totalEnergy: 0,
     totalCards: 0,
     totalBasicPokemon: 0,
-    unplayableHands: 0
+    unplayableHands: 0,
+    histograms: emptyHistograms()
   });
   
   const [isUnplayable, setIsUnplayable] = useState(false);
+  // Hands shuffled server-side from a seed; each draw pops one, so clicks need no work here
+  const handQueue = useRef([]);
+  const session = useRef(null);
+  const refilling = useRef(false);
+  const [sessionSeed, setSessionSeed] = useState(null);
 
   // Fetch card data for the deck
   const fetchCardDataForDeck = async (deckListText) => {
@@ -386,6 +402,34 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
     return cards;
   };
 
+  // Fetch the next batch of seeded hands; without a seed the server starts a new session
+  const fetchHands = async (seed = null) => {
+    const current = session.current;
+    const params = { count: 50 };
+    if (seed !== null) {
+      params.seed = seed;
+      params.offset = current && current.seed === seed ? current.nextOffset : 0;
+    }
+    const response = await axios.get(`${API}/decks/${deckId}/hands`, { params, withCredentials: true });
+    const { deck, cards, hands } = response.data;
+    session.current = { seed: response.data.seed, nextOffset: response.data.next_offset };
+    setSessionSeed(response.data.seed);
+    handQueue.current.push(...hands.map(positions => positions.map(position => {
+      const cacheKey = deck[position];
+      const [setCode, cardNumber] = cacheKey.split('-');
+      const data = cards[cacheKey];
+      return { name: data.name, setCode, cardNumber, id: `${cacheKey}-${position}`, data };
+    })));
+  };
+
+  useEffect(() => {
+    if (!isOpen || !deckId) return;
+    handQueue.current = [];
+    session.current = null;
+    fetchHands().catch(error => console.error('Failed to prefetch hands:', error));
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [isOpen, deckId, deckList]);
+
   // Shuffle array
   const shuffle = (array) => {
     const shuffled = [...array];
@@ -396,6 +440,54 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
     return shuffled;
   };
 
+  // Shuffle locally when no seeded hands are queued (no saved deck yet, or the fetch failed)
+  const drawLocalHand = () => {
+    const cards = parseDeckList(deckList);
+    
+    if (cards.length === 0) {
+      alert('No cards found in deck list. Make sure the format is correct (e.g., "4 Pikachu SVI 78")');
+      return null;
+    }
+    
+    const shuffled = shuffle(cards);
+    const drawnHand = shuffled.slice(0, 7);
+    
+    // Get card data from cache for each card in hand
+    console.log('=== Drawing Hand ===');
+    console.log('Available cardData keys:', cardData ? Object.keys(cardData) : 'No cardData');
+    
+    const handWithData = drawnHand.map(card => {
+      const cacheKey = `${card.setCode}-${card.cardNumber}`;
+      const cachedData = getCardData(card.setCode, card.cardNumber, card.name);
+      
+      // Merge cached image data with section-based type info
+      const isPokemon = card.section === 'pokemon';
+      const isTrainer = card.section === 'trainer';
+      const isEnergy = card.section === 'energy';
+      
+      const data = {
+        ...cachedData,
+        // Override type info from deck list sections (more reliable)
+        isPokemon: isPokemon,
+        isTrainer: isTrainer,
+        isEnergy: isEnergy,
+        supertype: isPokemon ? 'Pokémon' : (isTrainer ? 'Trainer' : (isEnergy ? 'Energy' : cachedData.supertype))
+      };
+      
+      console.log(`Card: ${card.name} (${cacheKey})`);
+      console.log('  Section:', card.section);
+      console.log('  Image URL:', data.image);
+      console.log('  Type:', { isPokemon, isTrainer, isEnergy });
+      
+      return {
+        ...card,
+        data: data
+      };
+    });
+    
+    return handWithData;
+  };
+
   // Draw opening hand
   const drawHand = (forceDraw = false) => {
     // If hand exists and no Pokemon was selected, don't draw new hand (unless forced)
@@ -409,51 +501,18 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
     setIsLoading(true);
     
     try {
-      const cards = parseDeckList(deckList);
-      
-      if (cards.length === 0) {
-        alert('No cards found in deck list. Make sure the format is correct (e.g., "4 Pikachu SVI 78")');
+      const handWithData = handQueue.current.shift() || drawLocalHand();
+      if (!handWithData) {
         setIsLoading(false);
         return;
       }
-      
-      const shuffled = shuffle(cards);
-      const drawnHand = shuffled.slice(0, 7);
-      
-      // Get card data from cache for each card in hand
-      console.log('=== Drawing Hand ===');
-      console.log('Available cardData keys:', cardData ? Object.keys(cardData) : 'No cardData');
-      
-      const handWithData = drawnHand.map(card => {
-        const cacheKey = `${card.setCode}-${card.cardNumber}`;
-        const cachedData = getCardData(card.setCode, card.cardNumber, card.name);
-        
-        // Merge cached image data with section-based type info
-        const isPokemon = card.section === 'pokemon';
-        const isTrainer = card.section === 'trainer';
-        const isEnergy = card.section === 'energy';
-        
-        const data = {
-          ...cachedData,
-          // Override type info from deck list sections (more reliable)
-          isPokemon: isPokemon,
-          isTrainer: isTrainer,
-          isEnergy: isEnergy,
-          supertype: isPokemon ? 'Pokémon' : (isTrainer ? 'Trainer' : (isEnergy ? 'Energy' : cachedData.supertype))
-        };
-        
-        console.log(`Card: ${card.name} (${cacheKey})`);
-        console.log('  Section:', card.section);
-        console.log('  Image URL:', data.image);
-        console.log('  Type:', { isPokemon, isTrainer, isEnergy });
-        
-        return {
-          ...card,
-          data: data
-        };
-      });
-      
-      console.log('Hand drawn successfully');
+      // Top the queue up in the background before it runs dry
+      if (session.current && handQueue.current.length < 10 && !refilling.current) {
+        refilling.current = true;
+        fetchHands(session.current.seed)
+          .catch(error => console.error('Failed to fetch hands:', error))
+          .finally(() => { refilling.current = false; });
+      }
       
       // Count basic Pokemon from previously selected cards (before reset)
       // Only count if there was a previous hand (not the first draw)
@@ -471,7 +530,16 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
         totalEnergy: prev.totalEnergy + energyCount,
         totalCards: prev.totalCards + 7,
         totalBasicPokemon: prev.totalBasicPokemon + basicPokemonCount,
-        unplayableHands: prev.unplayableHands + (isUnplayable ? 1 : 0)
+        unplayableHands: prev.unplayableHands + (isUnplayable ? 1 : 0),
+        histograms: {
+          pokemon: addToBucket(prev.histograms.pokemon, pokemonCount),
+          trainer: addToBucket(prev.histograms.trainer, trainerCount),
+          energy: addToBucket(prev.histograms.energy, energyCount),
+          // Basics are the selections made on the previous hand, like totalBasicPokemon
+          basic_pokemon: hand.length > 0
+            ? addToBucket(prev.histograms.basic_pokemon, basicPokemonCount)
+            : prev.histograms.basic_pokemon
+        }
       }));
       
       // Reset unplayable flag for next hand
@@ -551,39 +619,40 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
       // Calculate test metrics with additional mulligan if confirmed
       const finalMulliganCount = mulliganCount + additionalMulligan;
       
-      const mulliganPercentage = testStats.totalHandsDrawn > 0 
-        ? ((finalMulliganCount / testStats.totalHandsDrawn) * 100).toFixed(1)
-        : 0;
-      
-      const avgPokemon = (testStats.totalPokemon / testStats.totalHandsDrawn).toFixed(1);
-      const avgTrainer = (testStats.totalTrainer / testStats.totalHandsDrawn).toFixed(1);
-      const avgEnergy = (testStats.totalEnergy / testStats.totalHandsDrawn).toFixed(1);
-      const avgBasicPokemon = (testStats.totalBasicPokemon / testStats.totalHandsDrawn).toFixed(1);
-      
       console.log('Saving test results:', {
         deckId,
         totalHandsDrawn: testStats.totalHandsDrawn,
         mulliganCount: finalMulliganCount,
         additionalMulligan,
-        mulliganPercentage,
-        avgPokemon,
-        avgTrainer,
-        avgEnergy,
-        avgBasicPokemon
+        totalPokemon: testStats.totalPokemon,
+        totalTrainer: testStats.totalTrainer,
+        totalEnergy: testStats.totalEnergy,
+        totalBasicPokemon: testStats.totalBasicPokemon
       });
       
-      // Save to backend
+      // The last hand's basics are only counted on the next draw, so add them here to both
+      // the total and the histogram: every histogram then covers all of the session's hands
+      const lastHandBasics = hand.length > 0 ? selectedBasics.size : 0;
+      const totalBasicPokemon = testStats.totalBasicPokemon + lastHandBasics;
+      const histograms = {
+        ...testStats.histograms,
+        basic_pokemon: hand.length > 0
+          ? addToBucket(testStats.histograms.basic_pokemon, lastHandBasics)
+          : testStats.histograms.basic_pokemon
+      };
+
+      // Send raw counts; the backend accumulates them and derives the averages
       const response = await axios.post(
         `${API}/decks/${deckId}/test-results`,
         {
           total_hands: testStats.totalHandsDrawn,
           mulligan_count: finalMulliganCount,
-          mulligan_percentage: parseFloat(mulliganPercentage),
-          avg_pokemon: parseFloat(avgPokemon),
-          avg_trainer: parseFloat(avgTrainer),
-          avg_energy: parseFloat(avgEnergy),
-          avg_basic_pokemon: parseFloat(avgBasicPokemon),
-          unplayable_hands: testStats.unplayableHands
+          total_pokemon: testStats.totalPokemon,
+          total_trainer: testStats.totalTrainer,
+          total_energy: testStats.totalEnergy,
+          total_basic_pokemon: totalBasicPokemon,
+          unplayable_hands: testStats.unplayableHands,
+          histograms
         },
         { withCredentials: true }
       );
@@ -604,7 +673,8 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
         totalEnergy: 0,
         totalCards: 0,
         totalBasicPokemon: 0,
-        unplayableHands: 0
+        unplayableHands: 0,
+        histograms: emptyHistograms()
       });
       setMulliganCount(0);
       setIsUnplayable(false);
@@ -715,6 +785,9 @@ const HandSimulator = ({ deckList, cardData, deckId, isOpen, onClose, onDeckUpda
               </>
             )}
           </div>
+          {sessionSeed !== null && (
+            <p className="text-xs text-gray-500">Session seed: {sessionSeed} (replays the same hands)</p>
+          )}
 
           {/* Test Statistics */}
           {testStats.totalHandsDrawn > 0 && (
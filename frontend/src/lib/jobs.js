@@ -0,0 +1,38 @@
+import { API } from '../App';
+
+/**
+ * Follow a background job over Server-Sent Events.
+ *
+ * `handlers` maps event types ("card", "cards", "partial", "progress", "status") to callbacks
+ * taking the parsed data. Resolves with the final job once it finishes; `close()` stops
+ * listening and, with cancelOnDisconnect, cancels the job on the server.
+ */
+export function followJob(jobId, handlers = {}, { cancelOnDisconnect = false } = {}) {
+  const query = cancelOnDisconnect ? '?cancel_on_disconnect=true' : '';
+  const source = new EventSource(`${API}/jobs/${jobId}/events${query}`, { withCredentials: true });
+  let close;
+  const done = new Promise((resolve, reject) => {
+    close = () => {
+      source.close();
+      reject(new Error('closed'));
+    };
+    ['cards', 'card', 'partial', 'progress'].forEach((type) => {
+      source.addEventListener(type, (event) => handlers[type]?.(JSON.parse(event.data)));
+    });
+    source.addEventListener('status', (event) => {
+      const job = JSON.parse(event.data);
+      handlers.status?.(job);
+      if (['succeeded', 'failed', 'cancelled'].includes(job.status)) {
+        source.close();
+        resolve(job);
+      }
+    });
+    // EventSource reconnects on its own (sending Last-Event-ID) unless the server refused outright
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        reject(new Error('Job stream closed'));
+      }
+    };
+  });
+  return { done, close };
+}
@@ -2,6 +2,7 @@ import { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { API } from '../App';
+import { followJob } from '../lib/jobs';
 import { Button } from '../components/ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '../components/ui/dialog';
 import { Input } from '../components/ui/input';
@@ -30,7 +31,9 @@ const Dashboard = ({ user, onLogout }) => {
 
   const fetchDecks = async () => {
     try {
+      // Summary mode skips the heavy card_data blobs; the server picks featured_image for us
       const response = await axios.get(`${API}/decks`, {
+        params: { fields: 'summary' },
         withCredentials: true,
       });
       setDecks(response.data);
@@ -42,219 +45,6 @@ const Dashboard = ({ user, onLogout }) => {
     }
   };
 
-  const fetchCardDataForDeck = async (deckListText) => {
-    const cardDataMap = {};
-    const lines = deckListText.split('\n');
-    
-    console.log('=== Starting card fetch from local database ===');
-    console.log('Total lines:', lines.length);
-    
-    // Parse all unique cards first, tracking their sections
-    const uniqueCards = new Map();
-    let currentSection = 'unknown';
-    
-    for (const line of lines) {
-      const trimmedLine = line.trim();
-      if (!trimmedLine) continue;
-      
-      // Check for section headers
-      if (trimmedLine.match(/^Pokémon:/i) || trimmedLine.match(/^Pokemon:/i)) {
-        currentSection = 'pokemon';
-        continue;
-      }
-      if (trimmedLine.match(/^Trainer:/i)) {
-        currentSection = 'trainer';
-        continue;
-      }
-      if (trimmedLine.match(/^Energy:/i)) {
-        currentSection = 'energy';
-        continue;
-      }
-      
-      const match = trimmedLine.match(/^(\d+)\s+(.+?)\s+([A-Z]{2,5})\s+(\d+)$/i);
-      if (match) {
-        const cardName = match[2].trim();
-        const setCode = match[3].toUpperCase();
-        const cardNumber = match[4];
-        const cacheKey = `${setCode}-${cardNumber}`;
-        
-        if (!uniqueCards.has(cacheKey)) {
-          uniqueCards.set(cacheKey, { cardName, setCode, cardNumber, section: currentSection });
-        }
-      }
-    }
-    
-    console.log(`Found ${uniqueCards.size} unique cards to fetch`);
-    
-    // Fetch all cards in parallel from our database
-    const fetchPromises = Array.from(uniqueCards.entries()).map(async ([cacheKey, { cardName, setCode, cardNumber, section }]) => {
-      try {
-        // Try our local database first
-        const response = await axios.get(
-          `${API}/cards/${setCode}/${cardNumber}`,
-          { withCredentials: true, timeout: 5000 }
-        );
-        
-        const card = response.data;
-        console.log(`✓ ${card.name} (${cacheKey}) from local DB`);
-        
-        return {
-          cacheKey,
-          data: {
-            name: card.name,
-            image: card.image_small || null,
-            supertype: card.supertype,
-            subtypes: card.subtypes || [],
-            hp: card.hp || null,
-            types: card.types || [],
-            abilities: card.abilities || [],
-            attacks: card.attacks || [],
-            weaknesses: card.weaknesses || [],
-            resistances: card.resistances || [],
-            retreatCost: card.retreat_cost || [],
-            rules: card.rules || [],
-            isBasic: card.supertype === 'Pokémon' && card.subtypes?.includes('Basic'),
-            // Use section from deck list for type (more reliable)
-            isPokemon: section === 'pokemon',
-            isTrainer: section === 'trainer',
-            isEnergy: section === 'energy',
-            section: section // Store section info
-          }
-        };
-      } catch (error) {
-        // Fallback to external API if not in our database
-        console.log(`  → Not in local DB, trying external API for ${cacheKey}`);
-        
-        try {
-          const POKEMON_API = process.env.REACT_APP_POKEMON_API_URL || 'https://api.pokemontcg.io/v2';
-          let apiUrl = `${POKEMON_API}/cards/${setCode.toLowerCase()}-${cardNumber}`;
-          let apiResponse;
-          
-          try {
-            apiResponse = await axios.get(apiUrl, { timeout: 5000 });
-          } catch (firstError) {
-            if (firstError.response?.status === 404) {
-              apiUrl = `${POKEMON_API}/cards/${setCode}-${cardNumber}`;
-              apiResponse = await axios.get(apiUrl, { timeout: 5000 });
-            } else {
-              throw firstError;
-            }
-          }
-          
-          const card = apiResponse.data.data;
-          console.log(`✓ ${card.name} (${cacheKey}) from external API`);
-          
-          return {
-            cacheKey,
-            fromExternalAPI: true,  // Mark for database saving
-            data: {
-              name: card.name,
-              image: card.images?.small || null,
-              supertype: card.supertype,
-              subtypes: card.subtypes || [],
-              hp: card.hp || null,
-              types: card.types || [],
-              abilities: card.abilities || [],
-              attacks: card.attacks || [],
-              weaknesses: card.weaknesses || [],
-              resistances: card.resistances || [],
-              retreatCost: card.retreatCost || [],
-              rules: card.rules || [],
-              isBasic: card.supertype === 'Pokémon' && card.subtypes?.includes('Basic'),
-              // Use section from deck list for type (more reliable)
-              isPokemon: section === 'pokemon',
-              isTrainer: section === 'trainer',
-              isEnergy: section === 'energy',
-              section: section // Store section info
-            }
-          };
-        } catch (apiError) {
-          console.error(`✗ API Failed: ${cacheKey} - ${apiError.message}`);
-          console.log(`  → Creating basic card entry from deck list info`);
-          
-          // Try to fetch image from LimitlessTCG
-          let imageUrl = null;
-          try {
-            const imageResponse = await axios.get(
-              `${API}/cards/image/${setCode}/${cardNumber}`,
-              { withCredentials: true, timeout: 5000 }
-            );
-            imageUrl = imageResponse.data.image_url;
-            if (imageUrl) {
-              console.log(`  ✓ Got image from LimitlessTCG`);
-            }
-          } catch (imageError) {
-            console.log(`  → No image available from LimitlessTCG`);
-          }
-          
-          // Create basic card entry from deck list information
-          const supertype = section === 'pokemon' ? 'Pokémon' : (section === 'trainer' ? 'Trainer' : 'Energy');
-          
-          return {
-            cacheKey,
-            fromDeckListOnly: true,  // Mark for database saving with basic info
-            data: {
-              name: cardName,
-              image: imageUrl,  // Image from LimitlessTCG or null
-              supertype: supertype,
-              subtypes: [],
-              hp: null,
-              types: [],
-              abilities: [],
-              attacks: [],
-              weaknesses: [],
-              resistances: [],
-              retreatCost: [],
-              rules: [],
-              isBasic: false,  // Can't determine without API
-              isPokemon: section === 'pokemon',
-              isTrainer: section === 'trainer',
-              isEnergy: section === 'energy',
-              section: section
-            }
-          };
-        }
-      }
-    });
-    
-    // Wait for all fetches to complete
-    const results = await Promise.all(fetchPromises);
-    
-    // Track which cards came from external API (need to be saved to DB)
-    const cardsToSave = {};
-    
-    // Build the card data map
-    results.forEach(result => {
-      if (result) {
-        cardDataMap[result.cacheKey] = result.data;
-        // If card has 'fromExternalAPI' or 'fromDeckListOnly' flag, add to batch save
-        if (result.fromExternalAPI || result.fromDeckListOnly) {
-          cardsToSave[result.cacheKey] = result.data;
-        }
-      }
-    });
-    
-    console.log(`=== Fetch complete: ${Object.keys(cardDataMap).length}/${uniqueCards.size} cards fetched ===`);
-    
-    // Save newly fetched cards to local database for future use
-    if (Object.keys(cardsToSave).length > 0) {
-      try {
-        console.log(`Saving ${Object.keys(cardsToSave).length} new cards to local database...`);
-        await axios.post(
-          `${API}/cards/batch`,
-          cardsToSave,
-          { withCredentials: true, timeout: 10000 }
-        );
-        console.log('✓ Cards saved to local database for future use');
-      } catch (saveError) {
-        console.error('Failed to save cards to database:', saveError);
-        // Don't fail the whole operation if saving fails
-      }
-    }
-    
-    return cardDataMap;
-  };
-
   const handleImportDeck = async () => {
     if (!deckName.trim() || !deckList.trim()) {
       toast.error('Please enter both deck name and deck list');
@@ -263,34 +53,28 @@ const Dashboard = ({ user, onLogout }) => {
 
     setIsSubmitting(true);
     try {
-      // Count unique cards
-      const lines = deckList.split('\n').filter(line => line.trim());
-      const uniqueCards = new Set();
-      lines.forEach(line => {
-        const match = line.match(/^(\d+)\s+(.+?)\s+([A-Z]{2,5})\s+(\d+)$/i);
-        if (match) {
-          uniqueCards.add(`${match[3]}-${match[4]}`);
-        }
-      });
-      
-      // Fetch card data before saving
-      toast.info(`Fetching ${uniqueCards.size} unique cards in parallel...`);
-      const startTime = Date.now();
-      const cardData = await fetchCardDataForDeck(deckList);
-      const fetchTime = ((Date.now() - startTime) / 1000).toFixed(1);
-      
-      toast.success(`Fetched ${Object.keys(cardData).length} cards in ${fetchTime}s`);
-      
-      await axios.post(
+      const response = await axios.post(
         `${API}/decks`,
-        {
-          deck_name: deckName,
-          deck_list: deckList,
-          card_data: cardData,
-        },
+        { deck_name: deckName, deck_list: deckList },
         { withCredentials: true }
       );
 
+      // Cards are looked up server-side; the stream reports each one as it resolves
+      const job = await axios.post(
+        `${API}/decks/${response.data.id}/resolve-cards`,
+        {},
+        { withCredentials: true }
+      );
+      const toastId = toast.loading('Fetching cards...');
+      const { done } = followJob(job.data.id, {
+        progress: ({ done: resolved, total }) => toast.loading(`Fetched ${resolved}/${total} cards`, { id: toastId }),
+      });
+      const finished = await done;
+      toast.dismiss(toastId);
+      if (finished.status !== 'succeeded') {
+        toast.error(`Some cards could not be fetched: ${finished.error}`);
+      }
+
       toast.success('Deck imported successfully!');
       setDeckName('');
       setDeckList('');
@@ -579,10 +363,10 @@ const Dashboard = ({ user, onLogout }) => {
                 {(() => {
                   // Extract Pokemon name from deck title (e.g., "Charizard EX" -> "Charizard")
                   const deckNameLower = deck.deck_name.toLowerCase();
-                  let featuredImage = null;
+                  let featuredImage = deck.featured_image || null;
                   
                   // Try to find a card in deck's card_data that matches the deck name
-                  if (deck.card_data) {
+                  if (!featuredImage && deck.card_data) {
                     for (const [cacheKey, cardData] of Object.entries(deck.card_data)) {
                       if (cardData.isPokemon && cardData.image) {
                         const cardNameLower = cardData.name.toLowerCase();
@@ -55,15 +55,12 @@ const DeckDetail = ({ user, onLogout }) => {
 
   const fetchDeckData = async () => {
     try {
-      const [deckRes, matchesRes, statsRes] = await Promise.all([
-        axios.get(`${API}/decks/${deckId}`, { withCredentials: true }),
-        axios.get(`${API}/matches/${deckId}`, { withCredentials: true }),
-        axios.get(`${API}/decks/${deckId}/stats`, { withCredentials: true }),
-      ]);
-
-      setDeck(deckRes.data);
-      setMatches(matchesRes.data);
-      setStats(statsRes.data);
+      // Deck, matches and stats in one round trip
+      const response = await axios.get(`${API}/decks/${deckId}/bundle`, { withCredentials: true });
+
+      setDeck(response.data.deck);
+      setMatches(response.data.matches);
+      setStats(response.data.stats);
     } catch (error) {
       console.error('Error fetching deck data:', error);
       toast.error('Failed to load deck data');
@@ -0,0 +1,288 @@
+"""
+Concurrent load generator for the deck tracker API
+Virtual users loop over weighted scenarios modelled on the real frontend:
+- dashboard: /auth/me + /decks?fields=summary
+- deck_detail: deck, matches and stats fetched concurrently (as DeckDetail.js does)
+- match_burst: several matches logged back to back
+- simulator_save: hand simulator test-results saves
+Latency percentiles and throughput are reported per route and written to
+load_test_results/<timestamp>.json; --compare prints the change against an earlier run.
+
+Usage:
+  python load_test.py --base-url https://host --tokens TOKEN1,TOKEN2 --users 20 --duration 60
+  python load_test.py --in-process --users 10 --duration 20   # server.app on TEST_MONGO_URL or mongomock
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "load_test_results"
+LOAD_TEST_NOTE = "load-test"
+
+SCENARIO_WEIGHTS = {
+    "dashboard": 4,
+    "deck_detail": 4,
+    "match_burst": 1,
+    "simulator_save": 2,
+}
+OPPONENTS = ["Charizard ex", "Gardevoir ex", "Dragapult ex", "Raging Bolt ex", "Lugia VSTAR", "Lost Box"]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # route -> ms
+        self.statuses = defaultdict(lambda: defaultdict(int))  # route -> status -> count
+        self.errors = defaultdict(int)  # route -> transport errors
+        self.scenarios = defaultdict(list)  # scenario -> ms
+
+    async def request(self, client, method, url, route, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        finally:
+            self.latencies[route].append((time.perf_counter() - start) * 1000)
+        self.statuses[route][response.status_code] += 1
+        return response
+
+    def summary(self, elapsed):
+        def describe(values, extra=None):
+            values = sorted(values)
+            result = {
+                "count": len(values),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "max_ms": round(values[-1], 2) if values else 0.0,
+            }
+            result.update(extra or {})
+            return result
+
+        routes = {}
+        for route, values in self.latencies.items():
+            statuses = dict(self.statuses[route])
+            failed = sum(c for s, c in statuses.items() if s >= 400) + self.errors[route]
+            routes[route] = describe(values, {
+                "statuses": {str(s): c for s, c in sorted(statuses.items())},
+                "errors": failed,
+            })
+        total = [v for values in self.latencies.values() for v in values]
+        return {
+            "overall": describe(total, {"errors": sum(r["errors"] for r in routes.values())}),
+            "routes": dict(sorted(routes.items())),
+            "scenarios": {name: describe(values) for name, values in sorted(self.scenarios.items())},
+        }
+
+class VirtualUser:
+    def __init__(self, client, recorder, deck_ids, rng, think):
+        self.client = client
+        self.recorder = recorder
+        self.deck_ids = deck_ids
+        self.rng = rng
+        self.think = think
+        self.created_matches = []
+
+    async def dashboard(self):
+        await self.recorder.request(self.client, "GET", "/api/auth/me", "GET /api/auth/me")
+        await self.recorder.request(self.client, "GET", "/api/decks", "GET /api/decks?fields=summary",
+                                    params={"fields": "summary"})
+
+    async def deck_detail(self):
+        deck_id = self.rng.choice(self.deck_ids)
+        await asyncio.gather(
+            self.recorder.request(self.client, "GET", f"/api/decks/{deck_id}", "GET /api/decks/{deck_id}"),
+            self.recorder.request(self.client, "GET", f"/api/matches/{deck_id}", "GET /api/matches/{deck_id}"),
+            self.recorder.request(self.client, "GET", f"/api/decks/{deck_id}/stats", "GET /api/decks/{deck_id}/stats"),
+        )
+
+    async def match_burst(self):
+        deck_id = self.rng.choice(self.deck_ids)
+        for _ in range(self.rng.randint(3, 8)):
+            response = await self.recorder.request(self.client, "POST", "/api/matches", "POST /api/matches", json={
+                "deck_id": deck_id,
+                "result": self.rng.choice(["win", "loss"]),
+                "opponent_deck_name": self.rng.choice(OPPONENTS),
+                "went_first": self.rng.random() < 0.5,
+                "mulligan_count": self.rng.choice([0, 0, 1]),
+                "notes": LOAD_TEST_NOTE,
+            })
+            if response is not None and response.status_code == 200:
+                self.created_matches.append(response.json()["id"])
+
+    async def simulator_save(self):
+        deck_id = self.rng.choice(self.deck_ids)
+        hands = self.rng.choice([10, 25, 50])
+        await self.recorder.request(
+            self.client, "POST", f"/api/decks/{deck_id}/test-results", "POST /api/decks/{deck_id}/test-results",
+            json={
+                "total_hands": hands,
+                "mulligan_count": self.rng.randint(0, hands // 8),
+                "total_pokemon": sum(self.rng.randint(1, 4) for _ in range(hands)),
+                "total_trainer": sum(self.rng.randint(2, 5) for _ in range(hands)),
+                "total_energy": sum(self.rng.randint(0, 2) for _ in range(hands)),
+                "total_basic_pokemon": sum(self.rng.randint(1, 3) for _ in range(hands)),
+                "unplayable_hands": 0,
+            },
+        )
+
+    async def run(self, deadline):
+        names = list(SCENARIO_WEIGHTS)
+        weights = [SCENARIO_WEIGHTS[n] for n in names]
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            await getattr(self, name)()
+            self.recorder.scenarios[name].append((time.perf_counter() - start) * 1000)
+            if self.think:
+                await asyncio.sleep(self.rng.uniform(0, self.think))
+
+async def discover_decks(client):
+    response = await client.get("/api/decks", params={"fields": "id"})
+    response.raise_for_status()
+    return [deck["id"] for deck in response.json()]
+
+async def cleanup(client, match_ids):
+    for match_id in match_ids:
+        await client.delete(f"/api/matches/{match_id}")
+
+async def in_process_app(scale_factor):
+    """server.app on TEST_MONGO_URL (or mongomock), seeded with the test suite's synthetic data"""
+    sys.path.insert(0, str(Path(__file__).parent / "backend"))
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "load_test")
+    # A handful of seeded sessions would otherwise spend the whole run on 429s
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ["PERF_SCALE"] = str(scale_factor)
+
+    import server
+    from tests.synthetic import Scale, seed
+
+    if os.environ.get("TEST_MONGO_URL"):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ["TEST_MONGO_URL"], tz_aware=True)
+        await client.drop_database("load_test")
+        server.db = client["load_test"]
+        await server.create_indexes()
+    else:
+        # mongomock lacks the stats aggregation stages; those requests count as errors
+        from mongomock_motor import AsyncMongoMockClient
+        server.db = AsyncMongoMockClient(tz_aware=True)["load_test"]
+    seeded = await seed(server.db, Scale.from_env())
+    return server.app, seeded.tokens
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_report(summary, previous=None):
+    print(f'\n{"route":<44}{"count":>7}{"rps":>8}{"p50":>9}{"p95":>9}{"p99":>9}{"errors":>8}')
+    rows = list(summary["routes"].items()) + [("overall", summary["overall"])]
+    for route, stats in rows:
+        line = (f'{route:<44}{stats["count"]:>7}{stats["throughput_rps"]:>8.1f}'
+                f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["errors"]:>8}')
+        before = (previous or {}).get("routes", {}).get(route) if route != "overall" else (previous or {}).get("overall")
+        if before and before["p95_ms"]:
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+            line += f'   p95 {change:+.0f}% vs {before["p95_ms"]:.1f}'
+        print(line)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.environ.get("LOAD_TEST_URL", "http://localhost:8001"))
+    parser.add_argument("--tokens", default=os.environ.get("LOAD_TEST_TOKENS", ""),
+                        help="comma-separated session tokens; virtual users are spread across them")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--think", type=float, default=0.5, help="max think time between scenarios (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--in-process", action="store_true", help="drive server.app on mongomock instead of a URL")
+    parser.add_argument("--scale", type=int, default=1, help="synthetic data scale for --in-process")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare against")
+    parser.add_argument("--output", type=Path, help="result file (default load_test_results/<timestamp>.json)")
+    parser.add_argument("--no-cleanup", action="store_true", help="keep the matches created by match bursts")
+    args = parser.parse_args()
+
+    if args.in_process:
+        app, tokens = await in_process_app(args.scale)
+        transport, base_url = httpx.ASGITransport(app=app, raise_app_exceptions=False), "http://load-test"
+    else:
+        tokens = [t for t in args.tokens.split(",") if t]
+        transport, base_url = None, args.base_url.rstrip("/")
+    if not tokens:
+        parser.error("session tokens are required (--tokens or LOAD_TEST_TOKENS)")
+
+    limits = httpx.Limits(max_connections=args.users * 3)
+    clients = [httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30.0,
+                                 headers={"Authorization": f"Bearer {token}"}) for token in tokens]
+    try:
+        deck_ids = {id(c): await discover_decks(c) for c in clients}
+        if not any(deck_ids.values()):
+            parser.error("the test accounts have no decks")
+
+        recorder = Recorder()
+        users = []
+        for i in range(args.users):
+            candidates = [c for c in clients if deck_ids[id(c)]]
+            client = candidates[i % len(candidates)]
+            users.append(VirtualUser(client, recorder, deck_ids[id(client)], random.Random(args.seed + i), args.think))
+
+        print(f"Running {args.users} virtual users for {args.duration:g}s against "
+              f"{'server.app (in process)' if args.in_process else base_url}...")
+        start = time.perf_counter()
+        await asyncio.gather(*(u.run(start + args.duration) for u in users))
+        elapsed = time.perf_counter() - start
+
+        if not args.no_cleanup and not args.in_process:
+            for user in users:
+                await cleanup(user.client, user.created_matches)
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    summary = recorder.summary(elapsed)
+    previous = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(summary, previous)
+
+    result = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "config": {
+            "target": "in-process" if args.in_process else base_url,
+            "users": args.users, "duration": args.duration, "think": args.think,
+            "seed": args.seed, "scale": args.scale if args.in_process else None,
+            "scenario_weights": SCENARIO_WEIGHTS,
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        **summary,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults written to {output}")
+    return 1 if summary["overall"]["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,126 @@
+"""
+In-process fixtures: server.app driven through httpx's ASGI transport
+Runs against a real MongoDB when TEST_MONGO_URL is set (a throwaway database is
+created and dropped per test), otherwise against mongomock-motor.
+"""
+import os
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+# Tests drive the scheduler and the job queue explicitly instead of through their loops
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+os.environ.setdefault("JOB_WORKERS", "0")
+# Optimizer scoring runs on threads; test_optimizer starts its own process pool
+os.environ.setdefault("OPTIMIZE_WORKERS", "0")
+
+import server  # noqa: E402
+from archetypes import ArchetypeIndex  # noqa: E402
+
+from tests.synthetic import Scale, seed  # noqa: E402
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+# Collection methods that cost a round trip to MongoDB
+COUNTED_OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "aggregate", "count_documents", "estimated_document_count", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write",
+}
+
+class CountingCollection:
+    def __init__(self, collection, counter: Counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in COUNTED_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter[f"{self._collection.name}.{name}"] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+class CountingDatabase:
+    """Database proxy counting every query the server issues"""
+
+    def __init__(self, database):
+        self._database = database
+        self.queries = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if name.startswith("_") or not hasattr(attr, "find_one"):
+            return attr  # database methods (command, drop_collection, ...)
+        return CountingCollection(attr, self.queries)
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.queries)
+
+    def reset(self):
+        self.queries.clear()
+
+    @property
+    def total(self) -> int:
+        return sum(self.queries.values())
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def uses_mongod() -> bool:
+    return TEST_MONGO_URL is not None
+
+@pytest.fixture
+async def db(monkeypatch):
+    if TEST_MONGO_URL:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(TEST_MONGO_URL, tz_aware=True)
+        name = f"test_{uuid.uuid4().hex[:12]}"
+        database = client[name]
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        client = mongomock_motor.AsyncMongoMockClient(tz_aware=True)
+        database = client["test_database"]
+
+    counting = CountingDatabase(database)
+    monkeypatch.setattr(server, "db", counting)
+    monkeypatch.setattr(server, "archetype_index", ArchetypeIndex())
+    server.card_cache.clear()
+    server.analytics_cache.clear()
+    server.owned_decks_cache.clear()
+    server.rate_limiter.reset()
+    await server.create_indexes()
+    yield counting
+
+    if TEST_MONGO_URL:
+        await client.drop_database(name)
+        client.close()
+
+@pytest.fixture
+def scale() -> Scale:
+    return Scale.from_env()
+
+@pytest.fixture
+async def seeded(db, scale):
+    data = await seed(db, scale)
+    db.reset()
+    return data
+
+@pytest.fixture
+async def client(seeded):
+    transport = httpx.ASGITransport(app=server.app)
+    headers = {"Authorization": f"Bearer {seeded.tokens[0]}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", headers=headers) as c:
+        yield c
@@ -0,0 +1,119 @@
+"""
+Seeded synthetic users, decks, cards and matches for the in-process test suite
+The same seed always produces the same data, so budgets are comparable between runs.
+Scale with PERF_SCALE (a multiplier on decks per user and matches per deck).
+"""
+import os
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+OPPONENTS = [
+    "Charizard ex", "zard", "Gardevoir ex", "Dragapult ex", "Raging Bolt",
+    "Lugia VSTAR", "Miraidon ex", "Gholdengo ex", "Lost Box", "Regidrago VSTAR",
+    "Roaring Moon ex", "Terapagos ex", "Snorlax Stall", "Ancient Box", "Future Box",
+]
+SETS = ["SVI", "PAL", "OBF", "MEW", "PAR", "TEF", "TWM", "SFA", "SCR", "SSP"]
+
+@dataclass
+class Scale:
+    users: int = 3
+    decks_per_user: int = 8
+    matches_per_deck: int = 40
+    cards_per_deck: int = 20
+    seed: int = 1234
+
+    @classmethod
+    def from_env(cls) -> "Scale":
+        factor = max(1, int(os.environ.get("PERF_SCALE", "1")))
+        return cls(
+            decks_per_user=8 * factor,
+            matches_per_deck=40 * factor,
+            seed=int(os.environ.get("PERF_SEED", "1234")),
+        )
+
+@dataclass
+class Seeded:
+    scale: Scale
+    user_ids: List[str] = field(default_factory=list)
+    tokens: List[str] = field(default_factory=list)
+    deck_ids: List[str] = field(default_factory=list)  # decks of the first user
+    match_ids: List[str] = field(default_factory=list)  # matches of the first user
+
+def make_card(set_code: str, number: int, rng: random.Random) -> dict:
+    supertype = rng.choice(["Pokémon", "Pokémon", "Trainer", "Energy"])
+    return {
+        "card_id": f"{set_code.lower()}-{number}",
+        "set_code": set_code,
+        "card_number": str(number),
+        "name": f"{set_code} Card {number}" + (" ex" if supertype == "Pokémon" and number % 4 == 0 else ""),
+        "supertype": supertype,
+        "subtypes": ["Basic"] if supertype == "Pokémon" and number % 2 else ["Item"],
+        "hp": "120" if supertype == "Pokémon" else None,
+        "types": ["Fire"] if supertype == "Pokémon" else [],
+        "attacks": [{"name": "Tackle", "cost": ["Colorless"], "damage": "30", "text": ""}] if supertype == "Pokémon" else [],
+        "image_small": f"https://images.example.com/{set_code}/{number}.png",
+        "image_large": f"https://images.example.com/{set_code}/{number}_hires.png",
+        "created_at": datetime.now(timezone.utc),
+    }
+
+def make_deck_list(cards: List[dict]) -> str:
+    sections = {"Pokémon": [], "Trainer": [], "Energy": []}
+    for card in cards:
+        sections[card["supertype"]].append(f"4 {card['name']} {card['set_code']} {card['card_number']}")
+    return "\n\n".join(f"{name}: {len(lines) * 4}\n" + "\n".join(lines) for name, lines in sections.items() if lines)
+
+async def seed(db, scale: Scale) -> Seeded:
+    """Insert users, sessions, cards, decks and matches; the first user is the one under test"""
+    rng = random.Random(scale.seed)
+    now = datetime.now(timezone.utc)
+    seeded = Seeded(scale=scale)
+
+    cards = [make_card(s, n, rng) for s in SETS for n in range(1, 40)]
+    await db.pokemon_cards.insert_many([dict(c) for c in cards])
+
+    for u in range(scale.users):
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        token = f"token-{u}"
+        seeded.user_ids.append(user_id)
+        seeded.tokens.append(token)
+        await db.users.insert_one({
+            "id": user_id, "email": f"user{u}@example.com", "name": f"User {u}",
+            "picture": "", "created_at": now,
+        })
+        await db.sessions.insert_one({
+            "id": str(uuid.uuid4()), "user_id": user_id, "session_token": token,
+            "expires_at": now + timedelta(days=7), "created_at": now,
+        })
+
+        decks, matches = [], []
+        for d in range(scale.decks_per_user):
+            deck_cards = rng.sample(cards, scale.cards_per_deck)
+            deck_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            decks.append({
+                "id": deck_id, "user_id": user_id, "deck_name": f"{deck_cards[0]['name']} {d}",
+                "deck_list": make_deck_list(deck_cards),
+                "card_keys": [f"{c['set_code']}-{c['card_number']}" for c in deck_cards],
+                "test_results": None, "featured_image": deck_cards[0]["image_small"],
+                "created_at": now, "updated_at": now,
+            })
+            for m in range(scale.matches_per_deck):
+                opponent = rng.choice(OPPONENTS)
+                matches.append({
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))), "deck_id": deck_id, "user_id": user_id,
+                    "result": rng.choice(["win", "loss"]), "opponent_deck_name": opponent,
+                    "opponent_archetype_id": None, "opponent_archetype": None,
+                    "went_first": rng.random() < 0.5, "bad_game": rng.random() < 0.1,
+                    "mulligan_count": rng.choice([0, 0, 0, 1, 2]), "notes": None,
+                    "match_date": now - timedelta(hours=m * 7 + d), "created_at": now,
+                })
+            if u == 0:
+                seeded.deck_ids.append(deck_id)
+        await db.decks.insert_many(decks)
+        if matches:
+            await db.matches.insert_many(matches)
+        if u == 0:
+            seeded.match_ids = [m["id"] for m in matches]
+    return seeded
@@ -0,0 +1,136 @@
+"""
+Aggregation pipelines checked against the same numbers computed in Python
+mongomock has no $dateTrunc, $setWindowFields, $round or pipeline $lookup, so without
+TEST_MONGO_URL the facets using them are dropped and the rest still runs on every test run.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+MONGOD_ONLY_FACETS = {"decks", "weekly", "form"}
+
+def runnable(pipeline: list, uses_mongod: bool) -> list:
+    """The pipeline minus the facets mongomock cannot evaluate, unless a real mongod runs it"""
+    if uses_mongod:
+        return pipeline
+    return [
+        {"$facet": {name: stages for name, stages in stage["$facet"].items() if name not in MONGOD_ONLY_FACETS}}
+        if "$facet" in stage else stage
+        for stage in pipeline
+    ]
+
+async def run(db, pipeline: list, uses_mongod: bool) -> dict:
+    results = await db.matches.aggregate(runnable(pipeline, uses_mongod)).to_list(1)
+    return results[0]
+
+def opponent(match: dict) -> str:
+    return match.get("opponent_archetype") or match["opponent_deck_name"]
+
+def record(matches: list) -> dict:
+    """record_group_fields() computed in Python"""
+    first = [m for m in matches if m["went_first"] is True]
+    second = [m for m in matches if m["went_first"] is False]
+    return {
+        "total": len(matches),
+        "wins": sum(m["result"] == "win" for m in matches),
+        "first_total": len(first),
+        "first_wins": sum(m["result"] == "win" for m in first),
+        "second_total": len(second),
+        "second_wins": sum(m["result"] == "win" for m in second),
+        "mulligan_games": sum((m.get("mulligan_count") or 0) > 0 for m in matches),
+        "mulligans": sum(m.get("mulligan_count") or 0 for m in matches),
+    }
+
+def without_id(group: dict) -> dict:
+    return {k: v for k, v in group.items() if k != "_id"}
+
+@pytest.fixture
+async def archetype_matches(db, seeded):
+    """A few matches with a canonical archetype, so grouping prefers it over the raw name"""
+    deck_id = seeded.deck_ids[0]
+    await db.matches.insert_many([
+        {"id": f"canonical-{i}", "user_id": seeded.user_ids[0], "deck_id": deck_id,
+         "result": result, "opponent_deck_name": "thorns", "opponent_archetype_id": "iron-thorns-ex",
+         "opponent_archetype": "Iron Thorns ex", "went_first": i % 2 == 0, "bad_game": False,
+         "mulligan_count": i, "match_date": datetime(2024, 3, 4 + i, tzinfo=timezone.utc)}
+        for i, result in enumerate(["win", "loss", "win"])
+    ])
+    db.reset()
+
+async def test_user_analytics_pipeline(db, seeded, archetype_matches, uses_mongod):
+    user_id = seeded.user_ids[0]
+    matches = await db.matches.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+    facets = await run(db, server.user_analytics_pipeline(user_id), uses_mongod)
+
+    assert without_id(facets["overall"][0]) == record(matches)
+
+    opponents = {o["_id"]: (o["total"], o["wins"]) for o in facets["opponents"]}
+    assert opponents["Iron Thorns ex"] == (3, 2)
+    assert "thorns" not in opponents
+    expected = {}
+    for m in matches:
+        total, wins = expected.get(opponent(m), (0, 0))
+        expected[opponent(m)] = (total + 1, wins + (m["result"] == "win"))
+    assert opponents == expected
+
+    matrix = {(g["_id"]["deck_id"], g["_id"]["opponent"]): (g["total"], g["wins"]) for g in facets["matrix"]}
+    expected = {}
+    for m in matches:
+        total, wins = expected.get((m["deck_id"], opponent(m)), (0, 0))
+        expected[(m["deck_id"], opponent(m))] = (total + 1, wins + (m["result"] == "win"))
+    assert matrix == expected
+
+    if uses_mongod:
+        decks = {d["_id"]: d for d in facets["decks"]}
+        assert set(decks) == {m["deck_id"] for m in matches}
+        for deck_id, group in decks.items():
+            deck = await db.decks.find_one({"id": deck_id})
+            assert group.pop("deck_name") == deck["deck_name"]
+            assert without_id(group) == record([m for m in matches if m["deck_id"] == deck_id])
+
+@pytest.mark.parametrize("window,rolling", [(None, 10), (5, 3)])
+async def test_deck_stats_pipeline(db, seeded, archetype_matches, uses_mongod, window, rolling):
+    deck_id = seeded.deck_ids[0]
+    matches = await db.matches.find({"deck_id": deck_id}, {"_id": 0}).sort("match_date", -1).to_list(None)
+    expected = server.deck_stats_from_matches(matches[:window], rolling)
+    facets = await run(db, server.deck_stats_pipeline(deck_id, None, None, window, rolling), uses_mongod)
+
+    totals = facets["totals"][0]
+    assert without_id(totals) == {
+        "total_matches": expected.total_matches,
+        "wins": expected.wins,
+        "bad_games": expected.bad_games,
+        "went_first_wins": expected.went_first_wins,
+        "went_first_losses": expected.went_first_losses,
+        "went_second_wins": expected.went_second_wins,
+        "went_second_losses": expected.went_second_losses,
+        "total_mulligans": expected.total_mulligans,
+    }
+    opponents = {o["_id"]: {"wins": o["wins"], "losses": o["total"] - o["wins"], "total": o["total"]}
+                 for o in facets["opponents"]}
+    assert opponents == expected.opponent_stats
+
+    if uses_mongod:
+        assert [(w["_id"], w["matches"], w["wins"]) for w in facets["weekly"]] == \
+            [(w.week_start, w.matches, w.wins) for w in expected.weekly]
+        assert [server.FormPoint(**point) for point in facets["form"]] == expected.form
+
+async def test_deck_bundle_caps_matches(client, db, seeded, uses_mongod, monkeypatch):
+    deck_id = seeded.deck_ids[0]
+    monkeypatch.setattr(server, "MATCH_LIST_LIMIT", 5)
+    if not uses_mongod:
+        # Stand in for the pipeline with the same numbers computed in Python
+        async def aggregate(deck_id):
+            matches = await db.matches.find({"deck_id": deck_id}, {"_id": 0}).to_list(None)
+            return server.deck_stats_from_matches(matches)
+        monkeypatch.setattr(server, "aggregate_deck_stats", aggregate)
+
+    bundle = (await client.get(f"/api/decks/{deck_id}/bundle")).json()
+    assert len(bundle["matches"]) == 5
+    # Stats still cover every match, not just the page that was loaded
+    assert bundle["stats"]["total_matches"] == seeded.scale.matches_per_deck
+    assert len((await client.get(f"/api/matches/{deck_id}")).json()) == 5
@@ -0,0 +1,41 @@
+"""
+Opponent archetype canonicalization against a collection shared with other workers
+"""
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from archetypes import ArchetypeIndex, canonicalize, ensure_archetypes
+
+pytestmark = pytest.mark.anyio
+
+class UniqueAliases:
+    """archetypes collection refusing an alias another archetype holds, as mongod does on
+    update (mongomock only checks unique indexes on insert)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def update_one(self, query, update, **kwargs):
+        alias = update.get("$addToSet", {}).get("aliases")
+        if alias and await self.collection.find_one({"aliases": alias, "id": {"$ne": query["id"]}}):
+            raise DuplicateKeyError(f"duplicate key: aliases {alias!r}")
+        return await self.collection.update_one(query, update, **kwargs)
+
+async def test_learned_alias_race_returns_stored_archetype(db, uses_mongod):
+    database = db if uses_mongod else SimpleNamespace(archetypes=UniqueAliases(db.archetypes))
+    index = ArchetypeIndex()
+    await ensure_archetypes(database, index)
+    charizard = index.lookup("Charizard ex")
+    assert index.lookup("charizrd") == charizard  # a typo, resolved by trigram similarity
+
+    # Another worker stored the same spelling for a different archetype after this index loaded
+    await db.archetypes.insert_one({"id": "other", "name": "Charizrd Box", "aliases": ["charizrd"]})
+
+    assert await canonicalize(database, index, "Charizrd") == {"id": "other", "name": "Charizrd Box"}
+    assert index.lookup("charizrd") == "other"
+    assert "charizrd" not in (await db.archetypes.find_one({"id": charizard}))["aliases"]
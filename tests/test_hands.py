@@ -0,0 +1,34 @@
+"""
+Seeded hand batches for the hand simulator
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_seeded_hands_replay(client, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}/hands"
+    first = (await client.get(url, params={"count": 20})).json()
+    assert len(first["hands"]) == 20 and first["next_offset"] == 20
+    deck = first["deck"]
+    for hand in first["hands"]:
+        assert len(hand) == 7 and len(set(hand)) == 7
+        assert all(deck[position] in first["cards"] for position in hand)
+
+    # The same seed replays the session, however it is split into batches
+    seed = first["seed"]
+    head = (await client.get(url, params={"seed": seed, "count": 8})).json()
+    tail = (await client.get(url, params={"seed": seed, "offset": 8, "count": 12})).json()
+    assert head["hands"] + tail["hands"] == first["hands"]
+    assert (await client.get(url, params={"seed": seed + 1, "count": 20})).json()["hands"] != first["hands"]
+
+async def test_seeded_hands_need_the_owner(client, seeded):
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.get(f"/api/decks/{seeded.deck_ids[0]}/hands", headers=other)).status_code == 404
+    assert (await client.get(f"/api/decks/{seeded.deck_ids[0]}/hands", params={"count": 0})).status_code == 422
+
+async def test_seeded_hands_reject_oversized_decks(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    deck = await db.decks.find_one({"id": deck_id})
+    await db.decks.update_one({"id": deck_id}, {"$set": {"deck_list": deck["deck_list"] + "\n9999999 Nest Ball SVI 181"}})
+    response = await client.get(f"/api/decks/{deck_id}/hands", params={"count": 500})
+    assert response.status_code == 422
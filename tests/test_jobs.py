@@ -0,0 +1,274 @@
+"""
+Job queue: enqueue and poll, idempotency, priorities, retries, card resolution, event
+streams, cancellation and hand simulation
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from jobqueue import JobQueue, PermanentError
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def queue(db):
+    return JobQueue(lambda: db.jobs, lambda: db.job_events, backoff_seconds=0.01, progress_interval=0, worker_id="test-worker")
+
+async def test_enqueue_and_poll(client, db, seeded, monkeypatch):
+    async def fake_brake(job):
+        await job.progress(1, 2, "half way", force=True)
+        return {"top_decks": []}
+    monkeypatch.setattr(server.job_queue.handlers["meta_brake"], "run", fake_brake)
+
+    response = await client.post("/api/jobs", json={"kind": "meta_brake"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+
+    assert await server.job_queue.run_once() == "succeeded"
+    job = (await client.get(f"/api/jobs/{job['id']}")).json()
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"top_decks": []}
+    assert job["progress"] == {"done": 2, "total": 2, "message": "half way"}
+    assert [j["id"] for j in (await client.get("/api/jobs")).json()] == [job["id"]]
+
+    # Jobs belong to the user who queued them
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.get(f"/api/jobs/{job['id']}", headers=other)).status_code == 404
+
+async def test_idempotency_key_returns_the_same_job(client, db, seeded):
+    headers = {"Idempotency-Key": "resolve-1"}
+    url = f"/api/decks/{seeded.deck_ids[0]}/resolve-cards"
+    first = (await client.post(url, headers=headers)).json()
+    second = (await client.post(url, headers=headers)).json()
+    assert first["id"] == second["id"]
+    assert await db.jobs.count_documents({}) == 1
+    assert (await client.post(url)).json()["id"] != first["id"]
+
+async def test_rejects_unknown_kinds_bad_params_and_other_users_decks(client, seeded):
+    assert (await client.post("/api/jobs", json={"kind": "mine_bitcoin"})).status_code == 400
+    assert (await client.post("/api/jobs", json={"kind": "meta_wizard", "params": {}})).status_code == 422
+    response = await client.post("/api/jobs", json={"kind": "resolve_deck_cards", "params": {"deck_id": "nope"}})
+    assert response.status_code == 404
+
+async def test_claims_by_priority_then_age(queue):
+    order = []
+
+    async def record(job):
+        order.append(job.params["n"])
+    queue.handler("record", record)
+    for n, priority in [(1, 0), (2, 5), (3, 0), (4, 9)]:
+        await queue.enqueue("record", {"n": n}, priority=priority)
+    while await queue.run_once():
+        pass
+    assert order == [4, 2, 1, 3]
+
+async def test_retries_with_backoff_then_fails(queue, db):
+    attempts = []
+
+    async def flaky(job):
+        attempts.append(job.job["attempts"])
+        if len(attempts) < 2:
+            raise RuntimeError("upstream 503")
+        return "ok"
+
+    async def broken(job):
+        raise PermanentError("deck deleted")
+    queue.handler("flaky", flaky, max_attempts=3)
+    queue.handler("broken", broken, max_attempts=3)
+
+    flaky_job = await queue.enqueue("flaky")
+    assert await queue.run_once() == "queued"
+    retry = await queue.get(flaky_job["id"])
+    assert retry["error"] == "upstream 503" and retry["run_at"] > flaky_job["run_at"]
+    await asyncio.sleep(0.02)
+    assert await queue.run_once() == "succeeded"
+    assert attempts == [1, 2]
+
+    broken_job = await queue.enqueue("broken")
+    assert await queue.run_once() == "failed"
+    assert (await queue.get(broken_job["id"]))["attempts"] == 1
+
+async def test_expired_lease_is_reclaimed(queue, db):
+    async def noop(job):
+        return job.job["attempts"]
+    queue.handler("noop", noop)
+    job = await queue.enqueue("noop")
+    claimed = await queue.claim()
+    assert claimed["id"] == job["id"]
+    # The worker died mid-job: its lease lapses and another worker takes over
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {"lease_expires_at": datetime.now(timezone.utc)}})
+    other = JobQueue(lambda: db.jobs, lambda: db.job_events, worker_id="other-worker")
+    other.handler("noop", noop)
+    assert await other.run_once() == "succeeded"
+    assert (await other.get(job["id"]))["result"] == 2
+
+async def test_expired_lease_on_final_attempt_fails_the_job(queue, db):
+    runs = []
+
+    async def noop(job):
+        runs.append(job.job["attempts"])
+    queue.handler("noop", noop, max_attempts=1)
+    job = await queue.enqueue("noop")
+    await queue.claim()
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {"lease_expires_at": datetime.now(timezone.utc)}})
+    other = JobQueue(lambda: db.jobs, lambda: db.job_events, worker_id="other-worker")
+    other.handler("noop", noop, max_attempts=1)
+    assert await other.run_once() == "failed"
+    assert runs == []
+    failed = await other.get(job["id"])
+    assert failed["status"] == "failed" and failed["attempts"] == 1
+    assert failed["error"] == "worker lost during attempt 1 of 1"
+    assert await other.run_once() is None
+
+async def test_resolve_deck_cards(client, db, seeded, monkeypatch):
+    deck_id = seeded.deck_ids[0]
+    deck = await db.decks.find_one({"id": deck_id})
+    # One card the database has never seen
+    await db.decks.update_one({"id": deck_id}, {"$set": {"deck_list": deck["deck_list"] + "\n1 Mystery Card NEW 7"}})
+    fetched = []
+
+    async def fake_fetch(entry, fallback=True):
+        fetched.append(entry["cache_key"])
+        return {"name": entry["name"], "image": None, "supertype": "Trainer", "subtypes": []}
+    monkeypatch.setattr(server, "fetch_card", fake_fetch)
+
+    job = (await client.post(f"/api/decks/{deck_id}/resolve-cards")).json()
+    assert await server.job_queue.run_once() == "succeeded"
+    result = (await client.get(f"/api/jobs/{job['id']}")).json()["result"]
+    assert fetched == ["NEW-7"]
+    assert result["resolved"] == 1 and result["stored"] == 1
+    assert (await client.get(f"/api/decks/{deck_id}")).json()["card_data"]["NEW-7"]["name"] == "Mystery Card"
+    assert (await db.decks.find_one({"id": deck_id}))["updated_at"] > deck["updated_at"]
+
+def parse_sse(body: str) -> list:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append({**fields, "data": json.loads(fields["data"])})
+    return events
+
+async def test_event_stream_replays_cards_and_resumes(client, db, seeded, monkeypatch):
+    deck_id = seeded.deck_ids[0]
+    deck = await db.decks.find_one({"id": deck_id})
+    await db.decks.update_one({"id": deck_id}, {"$set": {"deck_list": deck["deck_list"] + "\n1 Mystery Card NEW 7"}})
+
+    async def fake_fetch(entry, fallback=True):
+        return {"name": entry["name"], "image": None, "supertype": "Trainer", "subtypes": []}
+    monkeypatch.setattr(server, "fetch_card", fake_fetch)
+
+    job = (await client.post(f"/api/decks/{deck_id}/resolve-cards")).json()
+    assert await server.job_queue.run_once() == "succeeded"
+    response = await client.get(f"/api/jobs/{job['id']}/events", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    # Compression would hold events back; other large responses are still compressed
+    assert "content-encoding" not in response.headers
+    compressed = await client.get(f"/api/decks/{deck_id}", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    events = parse_sse(response.text)
+    types = [e["event"] for e in events]
+    assert types[:2] == ["cards", "card"] and types[-1] == "status"
+    assert events[1]["data"]["cache_key"] == "NEW-7"
+    assert events[1]["data"]["card"]["name"] == "Mystery Card"
+    assert "isPokemon" in events[1]["data"]["card"]
+    assert events[-1]["data"]["status"] == "succeeded"
+
+    # Reconnecting after the first event skips it
+    resumed = await client.get(f"/api/jobs/{job['id']}/events", headers={"Last-Event-ID": events[0]["id"]})
+    assert [e["event"] for e in parse_sse(resumed.text)][0] == "card"
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.get(f"/api/jobs/{job['id']}/events", headers=other)).status_code == 404
+
+async def test_cancel_running_job(queue):
+    started = asyncio.Event()
+
+    async def endless(job):
+        started.set()
+        while True:
+            await job.progress(0, 1)
+            await asyncio.sleep(0.01)
+    queue.handler("endless", endless)
+    job = await queue.enqueue("endless")
+    run = asyncio.create_task(queue.run_once())
+    await started.wait()
+    assert await queue.cancel(job["id"]) == "cancelling"
+    assert await run == "cancelled"
+    assert (await queue.get(job["id"]))["status"] == "cancelled"
+    assert await queue.cancel(job["id"]) is None
+
+async def test_cancel_flag_stops_a_job_on_another_worker(queue, db):
+    async def endless(job):
+        while True:
+            await job.progress(0, 1)
+            await asyncio.sleep(0.01)
+    queue.handler("endless", endless)
+    job = await queue.enqueue("endless")
+    run = asyncio.create_task(queue.run_once())
+    await asyncio.sleep(0.05)
+    # Set by a worker that is not running the job: the handler sees it at its next progress write
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {"cancel_requested": True}})
+    assert await asyncio.wait_for(run, 1) == "cancelled"
+
+async def test_event_stream_cancels_on_disconnect(client, db, seeded, monkeypatch):
+    job = (await client.post("/api/jobs", json={"kind": "meta_brake"})).json()
+    cancel = server.job_queue.cancel
+
+    async def round_trip_cancel(*args):
+        await asyncio.sleep(0)  # a real MongoDB write yields, so a cancelled stream would drop it here
+        return await cancel(*args)
+    monkeypatch.setattr(server.job_queue, "cancel", round_trip_cancel)
+
+    disconnected = asyncio.Event()
+    sent, requested = [], []
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            disconnected.set()  # the client goes away after the first frame
+
+    # Driven as raw ASGI: httpx's transport reads the whole body before returning
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 1234), "root_path": "",
+        "path": f"/api/jobs/{job['id']}/events", "raw_path": f"/api/jobs/{job['id']}/events".encode(),
+        "query_string": b"cancel_on_disconnect=true",
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {seeded.tokens[0]}".encode())],
+    }
+    await asyncio.wait_for(server.app(scope, receive, send), 5)
+    assert sent[0]["status"] == 200
+    stored = await db.jobs.find_one({"id": job["id"]})
+    assert stored["status"] == "cancelled" or stored.get("cancel_requested")
+
+async def test_simulate_hands(client, seeded):
+    params = {"deck_id": seeded.deck_ids[0], "hands": 3000, "report_every": 1000, "seed": 7}
+    job = (await client.post("/api/jobs", json={"kind": "simulate_hands", "params": params})).json()
+    assert await server.job_queue.run_once() == "succeeded"
+    result = (await client.get(f"/api/jobs/{job['id']}")).json()["result"]
+    assert result["total_hands"] == 3000
+    assert 0 <= result["mulligan_percentage"] <= 100
+    assert result["avg_pokemon"] + result["avg_trainer"] + result["avg_energy"] == pytest.approx(7, abs=0.2)
+    assert result["distributions"]["basic_pokemon"]["histogram"][0] == result["mulligan_count"]
+    assert result["distributions"]["pokemon"]["hands"] == 3000
+
+    events = parse_sse((await client.get(f"/api/jobs/{job['id']}/events")).text)
+    partials = [e["data"]["total_hands"] for e in events if e["event"] == "partial"]
+    assert partials == [1000, 2000, 3000]
+
+async def test_simulate_hands_rejects_oversized_decks(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    deck = await db.decks.find_one({"id": deck_id})
+    await db.decks.update_one({"id": deck_id}, {"$set": {"deck_list": deck["deck_list"] + "\n9999999 Nest Ball SVI 181"}})
+    job = (await client.post("/api/jobs", json={"kind": "simulate_hands", "params": {"deck_id": deck_id}})).json()
+    assert await server.job_queue.run_once() == "failed"
+    assert "at most" in (await client.get(f"/api/jobs/{job['id']}")).json()["error"]
@@ -0,0 +1,117 @@
+"""
+/metrics: request labels, the text exposition format and the Mongo and scrape collectors
+"""
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$")
+
+def samples(text: str) -> dict:
+    """'name{labels}' -> value for every sample line, checking each line parses"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* \S", line), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        values[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return values
+
+async def scrape(client) -> dict:
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return samples(response.text)
+
+async def test_requests_are_labelled_by_route_template(client, seeded):
+    before = await scrape(client)
+    deck_id = seeded.deck_ids[0]
+    assert (await client.get(f"/api/decks/{deck_id}")).status_code == 200
+    assert (await client.get("/api/decks/no-such-deck")).status_code == 404
+    assert (await client.get("/api/not-a-route")).status_code == 404
+    after = await scrape(client)
+
+    def delta(key):
+        return after.get(key, 0) - before.get(key, 0)
+
+    template = 'method="GET",route="/api/decks/{deck_id}"'
+    assert delta(f'http_requests_total{{{template},status="200"}}') == 1
+    assert delta(f'http_requests_total{{{template},status="404"}}') == 1
+    assert delta('http_requests_total{method="GET",route="unmatched",status="404"}') == 1
+    assert delta(f"http_request_duration_seconds_count{{{template}}}") == 2
+    # Raw paths never become label values
+    assert not any(deck_id in key or "no-such-deck" in key or "not-a-route" in key for key in after)
+
+async def test_exposition_format():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("jobs_total", "Jobs run", ("kind",)))
+    gauge = registry.register(metrics.Gauge("queue_depth", "Queued jobs"))
+    histogram = registry.register(metrics.Histogram("job_seconds", "Job duration", ("kind",), buckets=(1.0, 0.1)))
+    counter.inc(kind='say "hi"\n')
+    counter.inc(2, kind="plain")
+    gauge.set(5)
+    gauge.dec()
+    histogram.observe(0.05, kind="a")
+    histogram.observe(0.5, kind="a")
+    histogram.observe(3, kind="a")
+
+    assert registry.render() == "\n".join([
+        "# HELP jobs_total Jobs run",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="say \\"hi\\"\\n"} 1',
+        'jobs_total{kind="plain"} 2',
+        "# HELP queue_depth Queued jobs",
+        "# TYPE queue_depth gauge",
+        "queue_depth 4",
+        "# HELP job_seconds Job duration",
+        "# TYPE job_seconds histogram",
+        # Buckets are sorted and cumulative; +Inf equals the count
+        'job_seconds_bucket{kind="a",le="0.1"} 1',
+        'job_seconds_bucket{kind="a",le="1.0"} 2',
+        'job_seconds_bucket{kind="a",le="+Inf"} 3',
+        'job_seconds_sum{kind="a"} 3.55',
+        'job_seconds_count{kind="a"} 3',
+    ]) + "\n"
+    samples(registry.render())
+
+async def test_mongo_command_metrics():
+    listener = metrics.MongoCommandMetrics()
+    key = ("find", "decks")
+    count = metrics.MONGO_LATENCY.series.get(key, [0])[-1]
+    failures = metrics.MONGO_FAILURES.values.get(("insert",), 0)
+
+    listener.started(SimpleNamespace(request_id=1, command_name="find", command={"find": "decks"}))
+    listener.succeeded(SimpleNamespace(request_id=1, command_name="find", duration_micros=2500))
+    assert metrics.MONGO_LATENCY.series[key][-1] == count + 1
+
+    # Commands whose first field is not a collection name get an empty label
+    listener.started(SimpleNamespace(request_id=2, command_name="ping", command={"ping": 1}))
+    listener.succeeded(SimpleNamespace(request_id=2, command_name="ping", duration_micros=100))
+    assert ("ping", "") in metrics.MONGO_LATENCY.series
+
+    listener.started(SimpleNamespace(request_id=3, command_name="insert", command={"insert": "matches"}))
+    listener.failed(SimpleNamespace(request_id=3, command_name="insert", duration_micros=100))
+    assert metrics.MONGO_FAILURES.values[("insert",)] == failures + 1
+    assert listener.collections == {}
+
+async def test_track_scrape():
+    def count(outcome):
+        return metrics.SCRAPE_LATENCY.series.get(("test_target", outcome), [0])[-1]
+    successes, errors = count("success"), count("error")
+
+    with metrics.track_scrape("test_target"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.track_scrape("test_target"):
+            raise RuntimeError("page did not load")
+
+    assert count("success") == successes + 1
+    assert count("error") == errors + 1
+    assert 'scrape_duration_seconds_count{target="test_target",outcome="error"}' in metrics.render_metrics()
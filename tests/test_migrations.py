@@ -0,0 +1,45 @@
+"""
+One-off data migrations run against legacy documents
+"""
+import pytest
+
+import migrate_card_data
+import server
+
+pytestmark = pytest.mark.anyio
+
+LEGACY_CARD_DATA = {
+    "PAL-86": {"name": "Gardevoir ex", "image": "https://img/pal-86.png", "supertype": "Pokémon",
+               "subtypes": ["Stage 2", "ex"], "isPokemon": True},
+    "SVI-181": {"name": "Nest Ball", "image": "https://img/svi-181.png", "supertype": "Trainer",
+                "subtypes": ["Item"], "isTrainer": True},
+}
+
+async def test_migrate_card_data_keeps_featured_image(client, db, seeded, monkeypatch):
+    monkeypatch.setattr(migrate_card_data, "db", db)
+
+    async def no_stats(name):
+        return 0  # collStats is not available on every backend
+    monkeypatch.setattr(migrate_card_data, "collection_size", no_stats)
+
+    deck_list = "Pokémon: 1\n1 Gardevoir ex PAL 86\nTrainer: 1\n1 Nest Ball SVI 181"
+    await db.decks.insert_many([
+        # Saved before featured_image existed
+        {"id": "legacy", "user_id": seeded.user_ids[0], "deck_name": "Gardevoir ex", "deck_list": deck_list,
+         "card_data": LEGACY_CARD_DATA},
+        {"id": "chosen", "user_id": seeded.user_ids[0], "deck_name": "Gardevoir ex", "deck_list": deck_list,
+         "card_data": LEGACY_CARD_DATA, "featured_image": "https://img/custom.png"},
+    ])
+
+    await migrate_card_data.migrate_card_data()
+
+    legacy = await db.decks.find_one({"id": "legacy"})
+    assert "card_data" not in legacy
+    assert legacy["card_keys"] == ["PAL-86", "SVI-181"]
+    assert legacy["featured_image"] == "https://img/pal-86.png"
+    assert (await db.decks.find_one({"id": "chosen"}))["featured_image"] == "https://img/custom.png"
+    assert await db.pokemon_cards.find_one({"card_id": "pal-86"})
+
+    # The dashboard backfill leaves the migrated image alone
+    decks = (await client.get("/api/decks", params={"fields": "summary"})).json()
+    assert {d["id"]: d.get("featured_image") for d in decks}["legacy"] == "https://img/pal-86.png"
@@ -0,0 +1,72 @@
+"""
+Deck optimizer: swap search, memoization, the Pareto front and the optimize route
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from optimizer import Row, pareto_front, search
+from simulation import BASIC, ENERGY, POKEMON, TRAINER
+
+pytestmark = pytest.mark.anyio
+
+def sample_rows():
+    return [
+        Row("B1", "Basic A", 4, BASIC),
+        Row("B2", "Basic B", 2, BASIC),
+        Row("P1", "Stage 1", 4, POKEMON),
+        Row("S1", "Professor", 2, TRAINER, supporter=True),
+        Row("T1", "Item", 28, TRAINER),
+        Row("E1", "Fire Energy", 20, ENERGY, basic_energy=True),
+    ]
+
+def test_pareto_front_drops_dominated_scores():
+    scored = {
+        (0,): {"mulligan_rate": 0.2, "targets": [0.5]},
+        (1,): {"mulligan_rate": 0.1, "targets": [0.6]},
+        (2,): {"mulligan_rate": 0.05, "targets": [0.4]},
+        (3,): {"mulligan_rate": 0.1, "targets": [0.55]},
+    }
+    assert sorted(pareto_front(scored).values()) == [(1,), (2,)]
+
+async def test_search_finds_tweaks_and_memoizes():
+    rows = sample_rows()
+    memo = {}
+    result = await search(rows, [[3]], [(1, 2, "first")], budget_seconds=5, max_changes=2, memo=memo)
+    assert not result["timed_out"]
+    assert result["tweaks"]
+    for tweak in result["tweaks"]:
+        assert sum(change["delta"] for change in tweak["changes"]) == 0
+        # Nothing on the front is worse than the stored list on every score
+        assert (tweak["mulligan_rate"] < result["baseline"]["mulligan_rate"]
+                or tweak["targets"][0] > result["baseline"]["targets"][0])
+    # Adding a Supporter is the obvious way to find one sooner
+    best = {change["cache_key"]: change["delta"] for change in result["tweaks"][0]["changes"]}
+    assert best["S1"] == 2
+
+    # Swaps that land on the same counts share a score, and a rerun is served from the memo
+    assert result["evaluated"] < result["variations"]
+    again = await search(rows, [[3]], [(1, 2, "first")], budget_seconds=5, max_changes=2, memo=memo)
+    assert again["evaluated"] == 0 and again["tweaks"] == result["tweaks"]
+
+async def test_search_scores_on_a_process_pool():
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        result = await search(sample_rows(), [[3]], [(1, 2, "first")], budget_seconds=30,
+                              executor=pool, workers=2, max_changes=1)
+    assert result["tweaks"] and result["evaluated"] > 1
+
+async def test_optimize_route(client, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}/optimize"
+    response = await client.post(url, json={"targets": [{"group": "basic_pokemon", "k": 1, "turn": 1}],
+                                            "budget_seconds": 2, "max_changes": 1})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["targets"] == [{"group": "basic_pokemon", "k": 1, "turn": 1, "going": "first"}]
+    assert 0 < result["baseline"]["mulligan_rate"] < 1
+    assert (await client.post(url)).status_code == 200  # default targets
+
+    assert (await client.post(url, json={"targets": [{"k": 1}]})).status_code == 422
+    assert (await client.post(url, json={"targets": [{"group": "stadium"}]})).status_code == 422
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.post(url, headers=other)).status_code == 404
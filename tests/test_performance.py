@@ -0,0 +1,338 @@
+"""
+Latency and query-count budgets per endpoint
+Query budgets count MongoDB round trips, including the two every authenticated request
+spends on the session and user lookups, and are always checked. Latency budgets are p95
+milliseconds for an in-process request (no network) and depend on the machine, so they
+are only checked with PERF_LATENCY=1, scaled by PERF_LATENCY_FACTOR for slower machines.
+"""
+import os
+import statistics
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ITERATIONS = int(os.environ.get("PERF_ITERATIONS", "15"))
+LATENCY_CHECKS = os.environ.get("PERF_LATENCY", "0") not in ("", "0")
+LATENCY_FACTOR = float(os.environ.get("PERF_LATENCY_FACTOR", "1"))
+AUTH_QUERIES = 2
+
+async def measure(client, db, method, url, iterations=ITERATIONS, **kwargs):
+    """Issue the request `iterations` times; returns (p95 ms, queries of the first request)"""
+    latencies, queries = [], None
+    for _ in range(iterations):
+        db.reset()
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code < 400, response.text
+        if queries is None:
+            queries = db.total
+    p95 = statistics.quantiles(latencies, n=20)[18] if len(latencies) > 1 else latencies[0]
+    return p95, queries
+
+def assert_budget(name, p95, queries, latency_ms, max_queries):
+    assert queries <= max_queries, f"{name}: {queries} queries, budget {max_queries}"
+    if LATENCY_CHECKS:
+        assert p95 <= latency_ms * LATENCY_FACTOR, f"{name}: p95 {p95:.1f}ms, budget {latency_ms * LATENCY_FACTOR:.0f}ms"
+
+async def test_auth_me(client, db):
+    p95, queries = await measure(client, db, "GET", "/api/auth/me")
+    assert_budget("auth/me", p95, queries, latency_ms=25, max_queries=AUTH_QUERIES)
+
+async def test_dashboard_summary(client, db, seeded):
+    response = await client.get("/api/decks", params={"fields": "summary"})
+    assert len(response.json()) == seeded.scale.decks_per_user
+    assert all("card_data" not in deck for deck in response.json())
+
+    p95, queries = await measure(client, db, "GET", "/api/decks", params={"fields": "summary"})
+    # Dashboard stats still cost one matches query per deck
+    assert_budget("decks?fields=summary", p95, queries, latency_ms=150,
+                  max_queries=AUTH_QUERIES + 1 + seeded.scale.decks_per_user)
+
+async def test_decks_full(client, db, seeded):
+    response = await client.get("/api/decks")
+    assert all(deck["card_data"] for deck in response.json())
+
+    p95, queries = await measure(client, db, "GET", "/api/decks")
+    # Cards for all decks are loaded with one batched query
+    assert_budget("decks", p95, queries, latency_ms=250,
+                  max_queries=AUTH_QUERIES + 2 + seeded.scale.decks_per_user)
+
+async def test_deck_detail(client, db, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}"
+    p95, queries = await measure(client, db, "GET", url)
+    assert_budget("decks/{id}", p95, queries, latency_ms=40, max_queries=AUTH_QUERIES + 2)
+
+async def test_deck_detail_not_modified(client, db, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}"
+    etag = (await client.get(url)).headers["etag"]
+
+    db.reset()
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # A revalidation hashes the body, but the cards come from the in-process cache
+    assert db.queries["pokemon_cards.find"] == 0
+    assert db.total <= AUTH_QUERIES + 1
+
+async def test_card_revalidates_after_repair(client, db, seeded):
+    card = await db.pokemon_cards.find_one({})
+    url = f"/api/cards/{card['set_code']}/{card['card_number']}"
+    response = await client.get(url)
+    # Stored cards get repaired in place, so browsers must come back and revalidate
+    assert "immutable" not in response.headers["cache-control"]
+    assert "max-age=3600" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+    await db.pokemon_cards.update_one({"card_id": card["card_id"]}, {"$set": {"image_small": "https://fixed.example/a.png"}})
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["image_small"] == "https://fixed.example/a.png"
+
+async def test_deck_etag_follows_resolved_cards(client, db, seeded):
+    deck = (await client.post("/api/decks", json={"deck_name": "Fresh", "deck_list": "Pokémon: 1\n4 Newcomer NEW 1"})).json()
+    url = f"/api/decks/{deck['id']}"
+    first = await client.get(url)
+    assert first.json()["card_data"] == {}
+
+    # The card is stored later (resolve job, another user's import); the deck document is untouched
+    await db.pokemon_cards.insert_one({"card_id": "new-1", "set_code": "NEW", "card_number": "1", "name": "Newcomer",
+                                       "supertype": "Pokémon", "subtypes": ["Basic"], "image_small": "https://x/1.png"})
+    response = await client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 200
+    assert response.json()["card_data"]["NEW-1"]["name"] == "Newcomer"
+    assert response.headers["etag"] != first.headers["etag"]
+
+async def test_card_cache_warm(client, db, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}"
+    await client.get(url)
+    db.reset()
+    await client.get(url, headers={"Cache-Control": "no-cache"})
+    assert db.queries["pokemon_cards.find"] == 0
+
+async def test_deck_matches(client, db, seeded):
+    url = f"/api/matches/{seeded.deck_ids[0]}"
+    response = await client.get(url)
+    assert len(response.json()) == seeded.scale.matches_per_deck
+
+    p95, queries = await measure(client, db, "GET", url)
+    assert_budget("matches/{deck_id}", p95, queries, latency_ms=80, max_queries=AUTH_QUERIES + 2)
+
+async def test_create_match(client, db, seeded):
+    payload = {"deck_id": seeded.deck_ids[0], "result": "win",
+               "opponent_deck_name": "Charizard ex", "went_first": True}
+    await client.post("/api/matches", json=payload)
+    p95, queries = await measure(client, db, "POST", "/api/matches", json=payload)
+    # Ownership is re-checked (an index-only lookup) and the archetype comes from the in-memory index
+    assert_budget("POST matches", p95, queries, latency_ms=40, max_queries=AUTH_QUERIES + 2)
+    assert db.queries["decks.find_one"] == 1
+
+async def test_ownership_cache_dropped_on_delete(client, db, seeded):
+    deck_id = seeded.deck_ids[-1]
+    assert (await client.get(f"/api/matches/{deck_id}")).status_code == 200
+    assert (await client.delete(f"/api/decks/{deck_id}")).status_code == 200
+    assert (await client.get(f"/api/matches/{deck_id}")).status_code == 404
+
+async def test_ownership_rechecked_on_writes(client, db, seeded):
+    deck_id = seeded.deck_ids[-1]
+    assert (await client.get(f"/api/matches/{deck_id}")).status_code == 200
+    # Deleted through another worker: this worker's cache still lists the deck
+    await db.decks.delete_one({"id": deck_id})
+    matches = await db.matches.count_documents({"deck_id": deck_id})
+
+    db.reset()
+    # Reads may trust the cache until its TTL runs out...
+    assert (await client.get(f"/api/matches/{deck_id}")).status_code == 200
+    assert db.queries["decks.find_one"] == 0
+    # ...but writes go to MongoDB
+    payload = {"deck_id": deck_id, "result": "win", "opponent_deck_name": "Charizard ex", "went_first": True}
+    assert (await client.post("/api/matches", json=payload)).status_code == 404
+    body = f"deck_id,result,opponent_deck_name,went_first\n{deck_id},win,Charizard ex,true\n"
+    response = await client.post("/api/matches/import", content=body, headers={"Content-Type": "text/csv"})
+    assert response.json()["imported"] == 0
+    assert response.json()["failed"] == 1
+    assert await db.matches.count_documents({"deck_id": deck_id}) == matches
+
+async def test_update_deck(client, db, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}"
+    deck = (await client.get(url)).json()
+    payload = {"deck_name": "Renamed", "deck_list": deck["deck_list"]}
+    p95, queries = await measure(client, db, "PUT", url, json=payload)
+    # Ownership check, update and re-read in one find_one_and_update, plus the card load
+    assert_budget("PUT decks/{id}", p95, queries, latency_ms=40, max_queries=AUTH_QUERIES + 2)
+
+    updated = (await client.get(url)).json()
+    assert updated["deck_name"] == "Renamed"
+    assert updated["card_data"]
+
+async def test_update_match(client, db, seeded):
+    url = f"/api/matches/{seeded.match_ids[0]}"
+    p95, queries = await measure(client, db, "PUT", url, json={"result": "loss", "notes": "edited"})
+    assert_budget("PUT matches/{id}", p95, queries, latency_ms=25, max_queries=AUTH_QUERIES + 1)
+
+    response = await client.put(f"/api/matches/{seeded.match_ids[0]}", json={"mulligan_count": 2})
+    assert response.json()["notes"] == "edited"
+    assert response.json()["mulligan_count"] == 2
+
+    other_user_match = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    response = await client.put(url, json={"result": "win"}, headers=other_user_match)
+    assert response.status_code == 404
+
+async def test_import_matches_batches_inserts(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    rows = "\n".join(f"{deck_id},{'win' if i % 2 else 'loss'},Gardevoir ex,true" for i in range(300))
+    body = "deck_id,result,opponent_deck_name,went_first\n" + rows
+
+    db.reset()
+    start = time.perf_counter()
+    response = await client.post("/api/matches/import", content=body, headers={"Content-Type": "text/csv"})
+    elapsed = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, response.text
+    assert response.json()["imported"] == 300
+    # Rows are inserted in batches, not one round trip per match
+    assert db.queries["matches.insert_many"] == 1
+    assert db.queries["matches.insert_one"] == 0
+    if LATENCY_CHECKS:
+        assert elapsed <= 1500 * LATENCY_FACTOR
+
+async def test_import_matches_multiline_csv_field(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    body = ("deck_id,result,opponent_deck_name,went_first,notes\r\n"
+            f'{deck_id},win,Gardevoir ex,true,"Prized both Rare Candy,\r\nstill won"\r\n'
+            f'{deck_id},loss,Charizard ex,false,"said ""gg"""\r\n')
+    response = await client.post("/api/matches/import", content=body.encode(), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200, response.text
+    assert response.json()["imported"] == 2
+    assert response.json()["failed"] == 0
+    notes = {m["opponent_deck_name"]: m.get("notes") async for m in db.matches.find({"deck_id": deck_id})}
+    assert notes["Gardevoir ex"] == "Prized both Rare Candy,\r\nstill won"
+    assert notes["Charizard ex"] == 'said "gg"'
+
+async def test_import_matches_rejects_non_utf8(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    body = (f"deck_id,result,opponent_deck_name,went_first\n{deck_id},win,Gardevoir ex,true\n".encode()
+            + f"{deck_id},loss,Pok\u00e9mon,true\n".encode("latin-1"))
+    response = await client.post("/api/matches/import", content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["row"] == 2
+    assert response.json()["detail"]["imported"] == 1
+
+async def test_save_test_results(client, db, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}/test-results"
+    payload = {"total_hands": 10, "mulligan_count": 1, "total_pokemon": 25, "total_trainer": 35,
+               "total_energy": 10, "total_basic_pokemon": 15, "unplayable_hands": 1}
+    await client.post(url, json=payload)
+
+    p95, queries = await measure(client, db, "POST", url, json=payload)
+    # Once counters exist a save is a single atomic $inc
+    assert_budget("test-results", p95, queries, latency_ms=40, max_queries=AUTH_QUERIES + 1)
+
+    results = (await client.get(f"/api/decks/{seeded.deck_ids[0]}")).json()["test_results"]
+    saves = ITERATIONS + 1
+    assert results["total_hands"] == 10 * saves
+    assert results["total_pokemon"] == 25 * saves
+    assert results["avg_pokemon"] == 2.5
+    assert results["mulligan_percentage"] == 10.0
+
+async def test_save_test_results_seeds_legacy_averages(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    await db.decks.update_one({"id": deck_id}, {"$set": {"test_results": {
+        "total_hands": 20, "mulligan_count": 2, "mulligan_percentage": 10.0, "avg_pokemon": 3.0,
+        "avg_trainer": 4.0, "avg_energy": 1.0, "avg_basic_pokemon": 2.0, "unplayable_hands": 0}}})
+    # An older client still sending averages
+    response = await client.post(f"/api/decks/{deck_id}/test-results", json={
+        "total_hands": 20, "mulligan_count": 0, "mulligan_percentage": 0.0, "avg_pokemon": 2.0,
+        "avg_trainer": 5.0, "avg_energy": 1.0, "avg_basic_pokemon": 1.0})
+    assert response.json()["total_hands"] == 40
+
+    results = (await client.get(f"/api/decks/{deck_id}")).json()["test_results"]
+    assert results["total_pokemon"] == 100
+    assert results["avg_pokemon"] == 2.5
+    assert results["avg_trainer"] == 4.5
+    assert results["mulligan_percentage"] == 5.0
+
+async def test_test_result_histograms_merge_exactly(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    url = f"/api/decks/{deck_id}/test-results"
+    # Counters saved before histograms existed
+    await client.post(url, json={"total_hands": 5, "mulligan_count": 0, "total_pokemon": 10, "total_trainer": 20,
+                                 "total_energy": 5, "total_basic_pokemon": 5})
+    await db.decks.update_one({"id": deck_id}, {"$unset": {"test_results.histograms": ""}})
+
+    session = {"total_hands": 4, "mulligan_count": 1, "total_pokemon": 8, "total_trainer": 16,
+               "total_energy": 4, "total_basic_pokemon": 4, "histograms": {
+                   "pokemon": [0, 1, 1, 1, 1, 0, 0, 0], "basic_pokemon": [1, 2, 0, 1, 0, 0, 0, 0]}}
+    await client.post(url, json=session)
+    await client.post(url, json=session)
+
+    stored = (await db.decks.find_one({"id": deck_id}))["test_results"]
+    assert stored["histograms"]["pokemon"] == [0, 2, 2, 2, 2, 0, 0, 0]
+    assert stored["histograms"]["energy"] == [0] * 8
+
+    results = (await client.get(f"/api/decks/{deck_id}")).json()["test_results"]
+    assert results["total_hands"] == 13
+    pokemon = results["distributions"]["pokemon"]
+    # Only the 8 hands saved with histograms: two each of 1..4 Pokemon
+    assert pokemon["hands"] == 8 and pokemon["mean"] == 2.5 and pokemon["variance"] == 1.25
+    assert pokemon["percentiles"] == {"p10": 1, "p25": 1, "p50": 2, "p75": 3, "p90": 4}
+    assert results["distributions"]["basic_pokemon"]["shares"][:3] == [25.0, 50.0, 0.0]
+    assert results["distributions"]["energy"] == {"histogram": [0] * 8, "hands": 0}
+
+    bad = {**session, "histograms": {"pokemon": [1, 2, 3]}}
+    assert (await client.post(url, json=bad)).status_code == 422
+    bad = {**session, "histograms": {"pokemon": [9, 0, 0, 0, 0, 0, 0, 0]}}
+    assert (await client.post(url, json=bad)).status_code == 422
+    # Each histogram must account for every hand, and no bucket can go negative
+    bad = {**session, "histograms": {"pokemon": [0, 1, 1, 1, 0, 0, 0, 0]}}
+    assert (await client.post(url, json=bad)).status_code == 422
+    bad = {**session, "histograms": {"pokemon": [0, 2, 2, 1, -1, 0, 0, 0]}}
+    assert (await client.post(url, json=bad)).status_code == 422
+
+async def test_test_results_reject_negative_counters(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    url = f"/api/decks/{deck_id}/test-results"
+    session = {"total_hands": 4, "mulligan_count": 1, "total_pokemon": 8}
+    for field in ("total_hands", "mulligan_count", "total_pokemon", "unplayable_hands", "avg_energy"):
+        response = await client.post(url, json={**session, field: -1})
+        assert response.status_code == 422, field
+    assert (await db.decks.find_one({"id": deck_id})).get("test_results") is None
+
+async def test_deck_stats(client, db, seeded, uses_mongod):
+    if not uses_mongod:
+        pytest.skip("$setWindowFields/$dateTrunc need a real mongod (set TEST_MONGO_URL)")
+    url = f"/api/decks/{seeded.deck_ids[0]}/stats"
+    response = await client.get(url)
+    assert response.json()["total_matches"] == seeded.scale.matches_per_deck
+
+    p95, queries = await measure(client, db, "GET", url)
+    assert_budget("decks/{id}/stats", p95, queries, latency_ms=60, max_queries=AUTH_QUERIES + 2)
+
+async def test_deck_bundle(client, db, seeded, uses_mongod):
+    deck_id = seeded.deck_ids[0]
+    bundle = (await client.get(f"/api/decks/{deck_id}/bundle")).json()
+    assert bundle["deck"]["card_data"]
+    assert len(bundle["matches"]) == seeded.scale.matches_per_deck
+    assert bundle["stats"]["total_matches"] == seeded.scale.matches_per_deck
+    assert bundle["stats"]["wins"] == sum(m["result"] == "win" for m in bundle["matches"])
+    if uses_mongod:
+        # Python stats over the loaded matches agree with the aggregation pipeline
+        stats = (await client.get(f"/api/decks/{deck_id}/stats")).json()
+        assert {k: v for k, v in bundle["stats"].items() if k != "form"} == \
+            {k: v for k, v in stats.items() if k != "form"}
+
+    p95, queries = await measure(client, db, "GET", f"/api/decks/{deck_id}/bundle")
+    # One deck read, one matches read (issued concurrently), cards from the warm cache
+    assert_budget("decks/{id}/bundle", p95, queries, latency_ms=150, max_queries=AUTH_QUERIES + 2)
+    assert db.queries["pokemon_cards.find"] == 0
+
+async def test_user_analytics(client, db, seeded, uses_mongod):
+    if not uses_mongod:
+        pytest.skip("$lookup with a pipeline needs a real mongod (set TEST_MONGO_URL)")
+    response = await client.get("/api/users/me/analytics")
+    assert response.status_code == 200
+
+    # Served from the per-user cache until a match changes
+    p95, queries = await measure(client, db, "GET", "/api/users/me/analytics")
+    assert_budget("users/me/analytics", p95, queries, latency_ms=25, max_queries=AUTH_QUERIES)
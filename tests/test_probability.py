@@ -0,0 +1,54 @@
+"""
+Draw probability engine and the deck page consistency table
+"""
+from math import comb
+
+import pytest
+
+import server
+from probability import draw_probabilities, mulligan_rate
+
+pytestmark = pytest.mark.anyio
+
+def test_all_basic_deck_is_plain_hypergeometric():
+    # Every card is a Basic, so the mulligan condition never bites
+    result = draw_probabilities(60, 60, [(4, 0)], 5)
+    for turn in range(1, 6):
+        seen = 7 + turn
+        assert result["second"][0, 0, turn - 1] == pytest.approx(1 - comb(56, seen) / comb(60, seen))
+        assert result["first"][0, 0, turn - 1] == pytest.approx(1 - comb(56, seen - 1) / comb(60, seen - 1))
+
+def test_opener_always_holds_a_basic():
+    result = draw_probabilities(60, 8, [(8, 0), (4, 4)], 3)
+    assert result["first"][0, 0] == pytest.approx([1, 1, 1])
+    # More draws never lower the odds, and a card cannot be seen more often than it is played
+    assert (result["second"][1, 0] >= result["first"][1, 0]).all()
+    assert result["first"][1, 0, 0] > result["first"][1, 1, 0] > result["first"][1, 2, 0]
+    assert mulligan_rate(60, 8) == pytest.approx(comb(52, 7) / comb(60, 7))
+
+def test_rejects_decks_without_basics():
+    with pytest.raises(ValueError):
+        draw_probabilities(60, 0, [(4, 4)], 3)
+
+async def test_probabilities_endpoint(client, seeded):
+    url = f"/api/decks/{seeded.deck_ids[0]}/probabilities?turns=4"
+    response = await client.get(url)
+    assert response.status_code == 200
+    table = response.json()
+    assert table["turns"] == 4 and table["deck_size"] == sum(c["copies"] for c in table["cards"])
+    card = table["cards"][0]
+    assert len(card["first"]) == min(card["copies"], 4) and len(card["first"][0]) == 4
+    assert {g["group"] for g in table["groups"]} == {"basic_pokemon", "pokemon", "trainer", "energy"}
+
+    assert (await client.get(url, headers={"If-None-Match": response.headers["etag"]})).status_code == 304
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.get(url, headers=other)).status_code == 404
+
+async def test_oversized_decks_are_rejected(client, db, seeded):
+    deck_id = seeded.deck_ids[0]
+    deck = await db.decks.find_one({"id": deck_id})
+    await db.decks.update_one({"id": deck_id}, {"$set": {"deck_list": deck["deck_list"] + "\n9999999 Nest Ball SVI 181"}})
+    response = await client.get(f"/api/decks/{deck_id}/probabilities")
+    assert response.status_code == 422
+    assert str(server.MAX_DECK_CARDS) in response.json()["detail"]
+    assert (await client.post(f"/api/decks/{deck_id}/optimize")).status_code == 422
@@ -0,0 +1,78 @@
+"""
+Admin profiling endpoints: arm request profiling, sample the event loop, download results
+"""
+import pytest
+
+import profiling
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_EMAILS", {"user0@example.com"})
+    profiling.profile_store.disarm()
+    profiling.profile_store.results.clear()
+    yield
+    profiling.profile_store.disarm()
+    profiling.profile_store.results.clear()
+
+async def profile_next_request(client) -> dict:
+    response = await client.post("/api/admin/profile/requests", json={"path": "/api/decks", "count": 1})
+    assert response.status_code == 200
+    assert response.json()["armed"] == {"/api/decks": 1}
+    assert (await client.get("/api/decks")).status_code == 200
+    results = (await client.get("/api/admin/profile/results")).json()
+    assert len(results) == 1
+    assert results[0]["kind"] == "request"
+    assert results[0]["target"] == "GET /api/decks"
+    return results[0]
+
+async def download(client, result: dict, fmt: str):
+    response = await client.get(f"/api/admin/profile/results/{result['id']}", params={"format": fmt})
+    assert response.status_code == 200, response.text
+    assert f"profile-{result['id']}." in response.headers["content-disposition"]
+    return response
+
+async def test_requires_admin(client, db):
+    assert (await client.get("/api/admin/profile/results")).status_code == 403
+    assert (await client.post("/api/admin/profile/requests", json={"path": "/api/*"})).status_code == 403
+
+async def test_request_profile_pstats(client, admin, monkeypatch):
+    monkeypatch.setattr(profiling, "PyinstrumentProfiler", None)
+    result = await profile_next_request(client)
+    assert result["formats"] == ["pstats"]
+    response = await download(client, result, "pstats")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "cumulative" in response.text
+    # The slot was used up, so the next request is not profiled
+    await client.get("/api/decks")
+    assert len((await client.get("/api/admin/profile/results")).json()) == 1
+
+async def test_request_profile_pyinstrument(client, admin):
+    pytest.importorskip("pyinstrument")
+    result = await profile_next_request(client)
+    assert set(result["formats"]) == {"speedscope", "html", "text"}
+    assert (await download(client, result, "speedscope")).json()["profiles"]
+    assert (await download(client, result, "html")).headers["content-type"].startswith("text/html")
+    assert (await download(client, result, "text")).text
+
+async def test_sample_profile(client, admin):
+    response = await client.post("/api/admin/profile/sample", json={"seconds": 0.2, "interval_ms": 5})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["kind"] == "sample"
+    assert result["formats"] == ["collapsed", "speedscope"]
+
+    speedscope = await download(client, result, "speedscope")
+    assert speedscope.headers["content-type"] == "application/json"
+    assert ".json" in speedscope.headers["content-disposition"]
+    profile = speedscope.json()["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"]) > 0
+    collapsed = await download(client, result, "collapsed")
+    assert collapsed.text.strip().rsplit(" ", 1)[1].isdigit()
+
+    missing = await client.get(f"/api/admin/profile/results/{result['id']}", params={"format": "pstats"})
+    assert missing.status_code == 400
+    assert (await client.get("/api/admin/profile/results/nope")).status_code == 404
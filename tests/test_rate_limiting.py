@@ -0,0 +1,130 @@
+"""
+Token buckets, concurrency ceilings and the shared Mongo bucket backend
+"""
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+from ratelimit import MongoBuckets
+
+pytestmark = pytest.mark.anyio
+
+async def test_session_bucket_returns_429_with_retry_after(client, seeded, monkeypatch):
+    # The session gets its own bucket once a request has validated it
+    assert (await client.get("/api/auth/me")).status_code == 200
+    monkeypatch.setattr(server.rate_limiter.crud, "capacity", 3)
+    monkeypatch.setattr(server.rate_limiter.crud, "refill_per_second", 0.5)
+
+    statuses = [(await client.get("/api/auth/me")).status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    response = await client.get("/api/auth/me")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+    # Another session behind the same IP still has its own bucket
+    other = {"Authorization": f"Bearer {seeded.tokens[1]}"}
+    assert (await client.get("/api/auth/me", headers=other)).status_code == 200
+
+async def test_spoofed_identities_share_one_bucket(client, seeded, monkeypatch):
+    monkeypatch.setattr(server.rate_limiter.crud, "capacity", 1)
+    monkeypatch.setattr(server.rate_limiter.crud, "refill_per_second", 0.01)
+
+    statuses = []
+    for i in range(5):
+        # Invented tokens and client-written hops left of the address the ingress appended
+        headers = {"Authorization": f"Bearer fake-{i}", "X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"}
+        statuses.append((await client.get("/api/auth/me", headers=headers)).status_code)
+    # One IP bucket of capacity x ip_factor, whatever the token or the spoofed hops say
+    assert statuses.count(429) == 5 - 3
+    assert not any(key.startswith("crud:session:") for key in server.rate_limiter.local.buckets)
+    other = {"Authorization": "Bearer fake", "X-Forwarded-For": "203.0.113.8"}
+    assert (await client.get("/api/auth/me", headers=other)).status_code != 429
+
+async def test_refused_ip_does_not_spend_session_tokens(client, seeded, monkeypatch):
+    assert (await client.get("/api/auth/me")).status_code == 200
+    monkeypatch.setattr(server.rate_limiter.crud, "ip_factor", 1 / 120)  # the IP bucket holds 1 token
+    monkeypatch.setattr(server.rate_limiter.crud, "refill_per_second", 0.01)
+    statuses = [(await client.get("/api/auth/me")).status_code for _ in range(3)]
+    assert statuses == [200, 429, 429]
+    session_buckets = [v for k, v in server.rate_limiter.local.buckets.items() if k.startswith("crud:session:")]
+    # Only the request the IP bucket let through (the warm-up ran before the session was known)
+    assert session_buckets[0][0] == pytest.approx(119, abs=0.5)
+
+def test_client_ip_skips_client_written_hops():
+    from starlette.requests import HTTPConnection
+    from ratelimit import client_ip
+
+    def connection(forwarded):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return HTTPConnection({"type": "http", "headers": headers, "client": ("192.0.2.1", 1)})
+    assert client_ip(connection("6.6.6.6, 203.0.113.7"), "x-forwarded-for", 1) == "203.0.113.7"
+    assert client_ip(connection("6.6.6.6, 203.0.113.7, 10.1.1.1"), "x-forwarded-for", 2) == "203.0.113.7"
+    # Fewer hops than trusted proxies: the request skipped them, so use the peer address
+    assert client_ip(connection("203.0.113.7"), "x-forwarded-for", 2) == "192.0.2.1"
+    assert client_ip(connection(None), "x-forwarded-for", 1) == "192.0.2.1"
+    assert client_ip(connection("6.6.6.6"), "x-forwarded-for", 0) == "192.0.2.1"
+
+async def test_concurrency_ceiling_returns_503(client, monkeypatch):
+    monkeypatch.setattr(server.rate_limiter.crud, "max_concurrent", 0)
+    response = await client.get("/api/auth/me")
+    assert response.status_code == 503
+    assert "retry-after" in response.headers
+
+async def test_routes_are_classified():
+    limiter = server.rate_limiter
+    assert limiter.classify("/api/meta-brake").name == "scrape"
+    assert limiter.classify("/api/meta-wizard/Charizard").name == "scrape"
+    assert limiter.classify("/api/cards/image/SVI/57").name == "image"
+    assert limiter.classify("/api/decks/abc/bundle").name == "crud"
+    assert limiter.classify("/api/jobs/abc/events").name == "stream"
+    assert limiter.classify("/api/jobs/abc").name == "crud"
+    assert limiter.classify_job("meta_wizard").name == "scrape"
+    assert limiter.classify_job("meta_brake").name == "scrape"
+    assert limiter.classify_job("simulate_hands").name == "simulate"
+    assert limiter.classify_job("resolve_deck_cards") is None
+    assert limiter.classify_job(None) is None
+
+async def test_scrape_jobs_use_the_scrape_bucket(client, seeded, monkeypatch):
+    assert (await client.get("/api/auth/me")).status_code == 200
+    scrape = server.rate_limiter.classify_job("meta_wizard")
+    monkeypatch.setattr(scrape, "capacity", 1)
+    monkeypatch.setattr(scrape, "refill_per_second", 0.01)
+
+    job = {"kind": "meta_wizard", "params": {"deck_name": "Gardevoir ex"}}
+    assert (await client.post("/api/jobs", json=job)).status_code == 202
+    response = await client.post("/api/jobs", json={"kind": "meta_brake"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    # The scrape route and queued scrapes draw from the same bucket
+    assert (await client.get("/api/meta-brake")).status_code == 429
+    # Other job kinds are still plain CRUD, and the body still reaches the route
+    resolve = await client.post("/api/jobs", json={"kind": "resolve_deck_cards", "params": {"deck_id": seeded.deck_ids[0]}})
+    assert resolve.status_code == 202
+    assert (await client.post("/api/jobs", json={"kind": "nope"})).status_code == 400
+
+async def test_event_streams_not_counted_in_flight(client, seeded, monkeypatch):
+    job = (await client.post("/api/jobs", json={"kind": "meta_brake"})).json()
+    await server.job_queue.cancel(job["id"], seeded.user_ids[0])
+    monkeypatch.setattr(server.rate_limiter, "max_in_flight", 0)
+
+    assert (await client.get("/api/auth/me")).status_code == 503
+    response = await client.get(f"/api/jobs/{job['id']}/events")
+    assert response.status_code == 200
+    assert server.rate_limiter.in_flight == 0
+
+async def test_shared_bucket_survives_lost_upsert_races():
+    class Racing:
+        async def find_one_and_update(self, *args, **kwargs):
+            raise DuplicateKeyError("E11000 duplicate key error")
+
+    buckets = MongoBuckets(lambda: Racing())
+    assert await buckets.take("scrape:ip:1.2.3.4", 2, 0.01) == (True, 0.0)
+
+async def test_shared_buckets(db, uses_mongod):
+    if not uses_mongod:
+        pytest.skip("pipeline updates need a real mongod (set TEST_MONGO_URL)")
+    buckets = MongoBuckets(lambda: db.rate_limits)
+    await buckets.ensure_indexes()
+    results = [await buckets.take("scrape:ip:1.2.3.4", 2, 0.01) for _ in range(3)]
+    assert [allowed for allowed, _ in results] == [True, True, False]
+    assert results[-1][1] > 0
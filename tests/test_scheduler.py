@@ -0,0 +1,110 @@
+"""
+Scheduler lease election, failover, run history and admin triggers
+"""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import server
+from scheduler import Scheduler
+
+pytestmark = pytest.mark.anyio
+
+def make_scheduler(db, worker_id, runs, lease_seconds=30):
+    scheduler = Scheduler(lambda: db, lease_seconds=lease_seconds, heartbeat_seconds=0.01, worker_id=worker_id)
+
+    async def job():
+        runs.append(worker_id)
+        return {"ran_on": worker_id}
+    scheduler.register("tally", timedelta(hours=1), job)
+    return scheduler
+
+async def settle(*schedulers):
+    for scheduler in schedulers:
+        if scheduler.running:
+            await asyncio.gather(*scheduler.running.values())
+
+async def test_only_the_leader_runs_jobs(db):
+    runs = []
+    a, b = make_scheduler(db, "worker-a", runs), make_scheduler(db, "worker-b", runs)
+    await a.sync_jobs()
+    await b.sync_jobs()
+    for _ in range(3):
+        await a.tick()
+        await b.tick()
+        await settle(a, b)
+    assert a.is_leader and not b.is_leader
+    # Due once per interval, however many heartbeats and workers there are
+    assert runs == ["worker-a"]
+
+    history = await db.scheduler_runs.find({"job": "tally"}, {"_id": 0}).to_list(None)
+    assert [(r["worker"], r["status"], r["result"]) for r in history] == [("worker-a", "success", {"ran_on": "worker-a"})]
+
+async def test_failover_after_release_and_expiry(db):
+    runs = []
+    a, b = make_scheduler(db, "worker-a", runs, lease_seconds=0.05), make_scheduler(db, "worker-b", runs)
+    assert await a.acquire()
+    assert not await b.acquire()
+    await a.release()
+    assert await b.acquire()
+
+    # A leader that stops heartbeating loses the lease once it expires
+    await b.release()
+    assert await a.acquire()
+    await asyncio.sleep(0.1)
+    assert await b.acquire()
+    assert not await a.acquire()
+
+async def test_trigger_runs_on_the_leader(db):
+    runs = []
+    leader, other = make_scheduler(db, "worker-a", runs), make_scheduler(db, "worker-b", runs)
+    await leader.sync_jobs()
+    await leader.tick()
+    await settle(leader)
+    # Requested through a worker that is not the leader
+    await other.trigger("tally", "admin@example.com")
+    await leader.tick()
+    await settle(leader)
+    assert runs == ["worker-a", "worker-a"]
+    status = await leader.status()
+    assert status["jobs"][0]["last_run"]["triggered_by"] == "admin@example.com"
+    assert status["jobs"][0]["trigger_requested_at"] is None
+
+async def test_admin_endpoints(client, db, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_EMAILS", {"user0@example.com"})
+    monkeypatch.setattr(server.scheduler, "is_leader", False)
+    await server.scheduler.sync_jobs()
+
+    response = await client.post("/api/admin/scheduler/jobs/session_cleanup/run")
+    assert response.status_code == 202
+    assert (await client.post("/api/admin/scheduler/jobs/nope/run")).status_code == 404
+
+    status = (await client.get("/api/admin/scheduler")).json()
+    jobs = {job["name"]: job for job in status["jobs"]}
+    assert set(jobs) == {"meta_refresh", "session_cleanup"}
+    assert jobs["session_cleanup"]["trigger_requested_by"] == "user0@example.com"
+    assert (await client.get("/api/admin/scheduler/runs")).json() == []
+
+async def test_cancelled_run_releases_the_job_and_propagates(db):
+    scheduler = Scheduler(lambda: db, worker_id="worker-a")
+    started = asyncio.Event()
+
+    async def hang():
+        started.set()
+        await asyncio.Event().wait()
+    scheduler.register("hang", timedelta(hours=1), hang)
+    await scheduler.sync_jobs()
+
+    task = scheduler.start(scheduler.jobs["hang"])
+    await started.wait()
+    assert (await db.scheduler_jobs.find_one({"_id": "hang"}))["running_on"] == "worker-a"
+    scheduler.cancel_running()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert task.cancelled()
+
+    job = await db.scheduler_jobs.find_one({"_id": "hang"})
+    assert job["running_on"] is None
+    assert job["last_run"]["status"] == "cancelled"
+    assert (await db.scheduler_runs.find_one({"job": "hang"}))["status"] == "cancelled"
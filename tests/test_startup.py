@@ -0,0 +1,40 @@
+"""
+Cold start: what importing the app costs and what startup does on a warm database
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import server
+from archetypes import ArchetypeIndex, ensure_archetypes
+
+pytestmark = pytest.mark.anyio
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+async def test_import_is_lazy():
+    # A fresh interpreter: other tests may already have loaded the subsystems here
+    check = ("import sys, server; "
+             "assert not server.subsystems.loaded(), server.subsystems.loaded(); "
+             "assert not {'scraping', 'playwright', 'bs4'} & set(sys.modules)")
+    result = subprocess.run([sys.executable, "-c", check], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+async def test_archetypes_on_warm_database_is_one_read(db):
+    db.reset()
+    index = ArchetypeIndex()
+    await ensure_archetypes(db, index)
+    assert db.queries["archetypes.find"] == 1
+    assert db.queries["archetypes.update_one"] == 0
+    assert db.queries["archetypes.insert_one"] == 0
+    assert index.lookup("zard") == index.lookup("Charizard ex") is not None
+
+async def test_lifespan_closes_loaded_subsystems(db):
+    async with server.lifespan(server.app):
+        await server.app.state.startup_task
+        client = server.subsystems.http_client()
+        assert server.subsystems.http_client() is client
+    assert "http_client" not in server.subsystems.loaded()
+    assert client.is_closed